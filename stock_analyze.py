@@ -1,18 +1,60 @@
 import streamlit as st
-import gspread
 import pandas as pd
-import yfinance as yf
-import requests
 import urllib3
+import logging
 import os
+import tempfile
 from datetime import datetime
-from google.oauth2.service_account import Credentials
-from io import BytesIO
+from functools import partial
+
+from stock_core.config import (
+    INTRADAY_INTERVAL,
+    INTRADAY_QUOTE_URL,
+    LOG_FORMAT,
+    PREFETCH_ENABLED,
+    SHEET_NAME,
+    expected_trading_date,
+)
+from stock_core.parser import clean_code
+from stock_core.pipeline import (
+    authorize_gspread,
+    run_daily_ranking,
+    save_results_to_store,
+    save_to_archive,
+    sync_to_sheets,
+    yfinance_fallback,
+)
+from stock_core.result_store import get_default_result_store, import_from_sheets
+from stock_core.markets import MARKETS, fetch_markets, market_versions, parse_markets
+from stock_core.diagnostics import Diagnostics
+from stock_core.prefetch import PrefetchScheduler, get_daily_ranking
+from stock_core.snapshot import RETRY_INTERVAL
+from stock_core.liquidity import get_liquidity_ranking
+from stock_core.intraday import HttpQuoteSource, IntradayMonitor, MisQuoteSource
+from stock_core.screening import ScreenError, build_universe, load_screens, run_screens, save_screen, screen_from_text
+from stock_core.backfill import backfill
+from stock_core.batch import BatchUpdater, expand_uploads
+from stock_core.export import FORMATS, available_formats, export_bytes, xlsx_engine
+from stock_core.excel_update import apply_values, normalize_columns, queryable_codes, select_rows
+from stock_core.yf_fetcher import get_default_fetcher, ohlcv_to_values
+from stock_core.workbook_io import read_preview, scan_workbook, stream_update
 
 # --- 基礎配置 ---
 st.set_page_config(page_title="台股交易值分析系統", page_icon="📊", layout="wide")
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-SHEET_NAME = "Stock_Predictions_History"
+
+@st.cache_resource(show_spinner=False)
+def configure_logging():
+    """每個程序只設定一次 stock_core 日誌（INFO 以上輸出到 stderr）；已有 handler 時不重複加入"""
+    logger = logging.getLogger("stock_core")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    return logger
+
+configure_logging()
 
 # 檢查必要的套件
 def check_excel_support():
@@ -34,125 +76,537 @@ def check_excel_support():
 
 EXCEL_ENGINES = check_excel_support()
 
-def get_gspread_client():
-    """安全授權邏輯"""
-    scopes = [
-        'https://www.googleapis.com/auth/spreadsheets',
-        'https://www.googleapis.com/auth/drive'
-    ]
-    
+@st.cache_resource(show_spinner=False)
+def cached_gspread_client():
+    """授權並快取 gspread 客戶端（所有工作階段共用）；沒有憑證時回傳 None"""
     if "gcp_service_account" in st.secrets:
-        try:
-            creds_info = st.secrets["gcp_service_account"]
-            creds = Credentials.from_service_account_info(creds_info, scopes=scopes)
-            return gspread.authorize(creds)
-        except Exception as e:
-            st.error(f"Cloud Auth Error: {e}")
-            return None
-    elif os.path.exists("eco-precept-485904-j5-7ef3cdda1b03.json"):
-        creds = Credentials.from_service_account_file("eco-precept-485904-j5-7ef3cdda1b03.json", scopes=scopes)
-        return gspread.authorize(creds)
-    return None
-
-def get_stocks_from_twse_api():
-    """使用台灣證交所官方 API 取得所有上市股票的當日交易資訊"""
+        return authorize_gspread(credentials_info=dict(st.secrets["gcp_service_account"]))
+    return authorize_gspread()
+
+def get_gspread_client():
+    """安全授權邏輯（授權失敗不會被快取，下次會重試）"""
     try:
-        st.info("📡 正在從台灣證交所 API 抓取當日交易資訊...")
-        url = 'https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_data'
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code != 200:
-            raise Exception(f"HTTP 狀態碼: {response.status_code}")
-        
-        data = pd.read_csv(url)
-        
-        if data.empty:
-            raise Exception("API 回傳資料為空")
-        
-        st.success(f"✅ 成功從證交所 API 獲取 {len(data)} 檔股票資料")
-        return data
-        
+        return cached_gspread_client()
     except Exception as e:
-        st.error(f"❌ 證交所 API 失敗: {e}")
+        st.error(f"Cloud Auth Error: {e}")
         return None
 
-def process_twse_data(data, limit=100):
-    """處理證交所資料，計算交易值並排序"""
+@st.cache_resource(show_spinner=False)
+def start_prefetch_scheduler():
+    """每個程序只啟動一次收盤後預先載入排程"""
+    return PrefetchScheduler().start()
+
+def current_trade_date_key():
+    """快取鍵：依目前時間推算的最新交易日"""
+    return expected_trading_date().strftime('%Y-%m-%d')
+
+class UncachedResult(Exception):
+    """結果不完整（市場失敗、日期未確認或非預期交易日）時攜帶結果跳出快取函式，不寫入快取"""
+
+    def __init__(self, value):
+        super().__init__("uncached result")
+        self.value = value
+
+@st.cache_data(show_spinner=False, max_entries=10, ttl=RETRY_INTERVAL)
+def _cached_parsed_snapshot(trade_date_key, versions, listed_only):
+    fetched = fetch_markets()
+    if "twse" in fetched.snapshots:
+        archive_error = save_to_archive(fetched.snapshots["twse"])
+        if archive_error:
+            st.caption(f"⚠️ 略過歷史資料庫寫入: {archive_error}")
+    parsed, report = parse_markets(fetched.snapshots, listed_only=listed_only)
+    result = parsed, report, fetched.trade_date, fetched.sources
+    if fetched.errors or fetched.unverified or fetched.trade_date != trade_date_key:
+        raise UncachedResult(result)
+    return result
+
+def load_parsed_snapshot(trade_date_key, listed_only=True):
+    """
+    依交易日與快照版本快取解析後的上市、上櫃合併快照（所有工作階段共用）；listed_only 時只保留 4 位數普通股
+
+    任一市場失敗、日期未確認或不是預期交易日時不寫入快取，下次重新取得。
+    """
     try:
-        st.info("🔄 正在處理資料...")
-        
-        results = []
-        
-        for idx, row in data.iterrows():
+        return _cached_parsed_snapshot(trade_date_key, market_versions(), listed_only)
+    except UncachedResult as e:
+        return e.value
+
+@st.cache_data(show_spinner=False, max_entries=10, ttl=RETRY_INTERVAL)
+def _cached_market_ranking(trade_date_key, versions):
+    ranking = get_daily_ranking()
+    if not ranking.complete or ranking.trade_date != trade_date_key:
+        raise UncachedResult(ranking)
+    return ranking
+
+def load_market_ranking(trade_date_key):
+    """
+    依交易日與快照版本快取完整排行（DailyRanking）；調整前 N 名只需重新切片（已預先載入時直接取用）
+
+    排行不完整時不寫入快取，下次重新取得。
+    """
+    try:
+        return _cached_market_ranking(trade_date_key, market_versions())
+    except UncachedResult as e:
+        return e.value
+
+def clear_market_cache():
+    """清除排行快取並強制重新下載各市場快照"""
+    _cached_parsed_snapshot.clear()
+    _cached_market_ranking.clear()
+    get_daily_ranking(force_refresh=True)
+
+def show_diagnostics(diagnostics, ranking_diagnostics=None):
+    """可展開的效能診斷面板：各階段耗時、傳輸量、列數與 cProfile 結果"""
+    stages = list(diagnostics.stages) + (list(ranking_diagnostics.stages) if ranking_diagnostics else [])
+    total = sum(record.seconds for record in stages)
+    with st.expander(f"🩺 效能診斷（{len(stages)} 個階段，共 {total:.2f} 秒）"):
+        if ranking_diagnostics is not None and ranking_diagnostics is not diagnostics:
+            st.caption(
+                f"排行計算於 {ranking_diagnostics.started_at.strftime('%H:%M:%S')}"
+                f"（run_id {ranking_diagnostics.run_id}），之後沿用快取"
+            )
+            st.dataframe(ranking_diagnostics.to_frame(), use_container_width=True)
+        if diagnostics.stages:
+            st.caption(f"本次操作（run_id {diagnostics.run_id}）")
+            st.dataframe(diagnostics.to_frame(), use_container_width=True)
+        profile_report = diagnostics.profile_report()
+        if profile_report:
+            st.code(profile_report)
+
+def describe_sources(sources):
+    """各市場資料來源說明，例如「上市: 證交所 API、上櫃: 本地快取」"""
+    labels = []
+    for key, source in sources.items():
+        market = MARKETS[key]
+        source_label = {
+            "network": f"{market.provider} API",
+            "revalidated": f"本地快取（已向{market.provider}確認未更新）",
+            "disk": "本地快取",
+            "warm": "預先載入（收盤後自動更新）",
+            "stale": f"本地快取（{market.provider} API 無法連線）",
+            "yfinance": f"yfinance 備援（{market.provider} API 無法連線）",
+        }.get(source, "記憶體快取")
+        labels.append(f"{market.label}: {source_label}")
+    return "、".join(labels)
+
+def load_dated_values(row_dates, codes, allow_network=True):
+    """依每列日期回補歷史行情，回傳含 日期、代號 的行情表"""
+    progress_bar = st.progress(0.0, text="📅 正在回補歷史行情...")
+    
+    def on_progress(done, total):
+        ratio = done / total if total else 1.0
+        progress_bar.progress(ratio, text=f"📅 正在回補歷史行情... {done}/{total} 個日期")
+    
+    history, report = backfill(row_dates, codes, allow_network=allow_network, progress=on_progress)
+    progress_bar.empty()
+    
+    st.success(
+        f"✅ 共 {report.dates_total} 個日期：本地資料庫 {report.from_archive} 個、"
+        f"證交所下載 {report.fetched} 個、無交易資料 {len(report.no_data)} 個"
+    )
+    if report.skipped:
+        st.warning(f"⚠️ 本地資料庫缺少 {len(report.skipped)} 個日期：{', '.join(report.skipped[:10])}")
+    if report.failed:
+        st.warning(f"⚠️ {len(report.failed)} 個日期下載失敗：{', '.join(sorted(report.failed)[:10])}")
+    st.caption("ℹ️ 依日期回補與本地歷史資料庫只收錄上市股票（證交所每日收盤行情），上櫃股票請改用 yfinance")
+    
+    return history
+
+def uses_dated_values(data_source, date_filter, has_dates):
+    """是否依每列日期取得行情：「所有日期」或本地歷史資料庫；無法依日期查詢時顯示錯誤並回傳 None"""
+    if data_source == "🗄️ 本地歷史資料庫" and not has_dates:
+        st.error("❌ 本地歷史資料庫需要可識別的日期欄位")
+        return None
+    return has_dates and (data_source == "🗄️ 本地歷史資料庫" or date_filter == "所有日期")
+
+def fetch_update_values(data_source, stock_codes_clean, row_dates=None):
+    """
+    依資料來源取得行情表（代號、收盤價格、交易值指標；傳入 row_dates 時依日期回補）
+
+    取得失敗時顯示錯誤並回傳 None。
+    """
+    values = None
+    
+    if data_source == "📈 yfinance":
+        with st.spinner("📈 正在從 yfinance 下載資料..."):
             try:
-                stock_code = str(row.iloc[0]).strip()
-                
-                if not stock_code.isdigit() or len(stock_code) != 4:
-                    continue
-                
-                close_price = str(row.iloc[7]).replace(',', '').replace('--', '0')
-                if close_price == '' or close_price == '--':
-                    continue
-                close_price = float(close_price)
+                tickers = {f"{code}.TW": code for code in stock_codes_clean}
+                if row_dates is not None:
+                    dates = pd.to_datetime(pd.Series(list(row_dates)), errors='coerce').dropna()
+                    start, end = dates.min(), dates.max()
+                else:
+                    # 與原本 period="5d" 相同，取最近幾個交易日中最後一筆
+                    end = None
+                    start = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=10)
                 
-                volume = str(row.iloc[2]).replace(',', '').replace('--', '0')
-                if volume == '' or volume == '--':
-                    continue
-                volume = float(volume)
+                frames, report = get_default_fetcher().fetch(list(tickers), start, end)
+                values = ohlcv_to_values(frames, suffix_map=tickers, dated=row_dates is not None)
                 
-                if close_price <= 0 or volume <= 0:
-                    continue
+                st.success(
+                    f"✅ 成功獲取 {values['代號'].nunique()} 支股票的資料"
+                    f"（快取 {report.from_cache} 支、下載 {report.downloaded} 支、{report.batches} 批次）"
+                )
+                if report.failures:
+                    with st.expander(f"⚠️ {len(report.failures)} 支股票下載失敗"):
+                        st.dataframe(
+                            pd.DataFrame(sorted(report.failures.items()), columns=['代號', '原因']),
+                            use_container_width=True
+                        )
                 
-                trading_value = (close_price * volume) / 1e8
+            except Exception as e:
+                st.error(f"❌ yfinance 下載失敗: {e}")
+    
+    elif data_source == "🏛️ 證交所 API (推薦)" and row_dates is None:
+        with st.spinner("📡 正在從證交所、櫃買中心 API 獲取資料..."):
+            try:
+                parsed, _, _, _ = load_parsed_snapshot(current_trade_date_key(), listed_only=False)
+                values = parsed[parsed['代號'].isin(stock_codes_clean)]
                 
-                results.append({
-                    "日期": datetime.now().strftime('%Y-%m-%d'),
-                    "股票代號": f"{stock_code}.TW",
-                    "股票名稱": str(row.iloc[1]).strip(),
-                    "收盤價格": round(close_price, 2),
-                    "成交股數": int(volume),
-                    "交易值指標": round(trading_value, 4)
-                })
+                st.success(f"✅ 成功獲取 {len(values)} 支股票的資料")
                 
+            except Exception as e:
+                # 沒有同日本地快照可用時，改以 yfinance 查詢需要的代號
+                st.warning(f"⚠️ 證交所 API 失敗，改用 yfinance: {e}")
+                try:
+                    values, report = yfinance_fallback(stock_codes_clean)
+                    st.success(f"✅ 成功從 yfinance 獲取 {len(values)} 支股票的資料")
+                except Exception as e:
+                    st.error(f"❌ yfinance 備援也失敗: {e}")
+    
+    else:
+        with st.spinner("📅 正在依日期取得歷史行情..."):
+            try:
+                values = load_dated_values(
+                    row_dates,
+                    stock_codes_clean,
+                    allow_network=(data_source != "🗄️ 本地歷史資料庫")
+                )
+            except Exception as e:
+                st.error(f"❌ 歷史行情取得失敗: {e}")
+    
+    return values
+
+def read_upload(uploaded_file, streaming_mode):
+    """讀取上傳檔案並顯示預覽（串流模式只讀取前 10 列）；無法讀取或欄位不足時顯示錯誤並回傳 None"""
+    if streaming_mode:
+        # 串流模式只讀取預覽，實際處理在按下按鈕後分批進行
+        df = read_preview(uploaded_file, uploaded_file.name)
+        uploaded_file.seek(0)
+        st.success("✅ 串流模式：將分批處理整份檔案")
+    else:
+        # 讀取檔案
+        if uploaded_file.name.endswith('.csv'):
+            df = pd.read_csv(uploaded_file)
+        else:
+            try:
+                df = pd.read_excel(uploaded_file, engine='openpyxl')
             except:
-                continue
+                try:
+                    df = pd.read_excel(uploaded_file)
+                except Exception as e:
+                    st.error(f"❌ 無法讀取 Excel 檔案: {e}")
+                    st.info("💡 請確認已安裝 openpyxl: `pip install openpyxl`")
+                    return None
+        
+        st.success(f"✅ 成功讀取檔案，共 {len(df)} 列資料")
+    
+    # 顯示原始資料
+    st.subheader("📊 原始資料預覽")
+    st.dataframe(df.head(10), use_container_width=True)
+    
+    # 檢查欄位
+    if len(df.columns) < 2:
+        st.error("❌ 檔案至少需要 2 欄 (日期、股票代號)")
+        return None
+    return df
+
+def run_table_update(df, data_source, date_filter, export_format, diagnostics):
+    """一般模式：整份讀入後篩選要更新的列，取得行情寫回 C/D 欄並提供下載"""
+    # 轉換日期欄位
+    try:
+        df['日期'] = pd.to_datetime(df['日期'])
+    except:
+        st.warning("⚠️ 日期欄位格式無法識別，將更新所有列")
+        date_filter = "所有日期"
+    
+    # 篩選今日資料
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    if date_filter == "僅今日":
+        rows_to_update = select_rows(df, True, today)
         
-        if not results:
-            return None
+        if len(rows_to_update) == 0:
+            st.warning(f"⚠️ 沒有找到今日 ({today}) 的資料")
+            st.info("💡 您可以選擇「所有日期」來更新全部資料")
+            return
         
-        df = pd.DataFrame(results)
-        df_sorted = df.sort_values(by="交易值指標", ascending=False)
-        df_top = df_sorted.head(limit)
+        st.info(f"📍 找到 {len(rows_to_update)} 列今日資料需要更新")
+    else:
+        rows_to_update = df.index
+        st.info(f"📍 將更新全部 {len(rows_to_update)} 列資料")
+    
+    # 清理股票代號格式（整欄一次）
+    clean_codes = clean_code(df.loc[rows_to_update, '股票代號'])
+    stock_codes_clean = queryable_codes(clean_codes)
+    
+    st.write(f"需要查詢 {len(stock_codes_clean)} 支股票")
+    
+    # 根據選擇的資料來源獲取資料
+    values = None
+    
+    # 「所有日期」依每列日期回補；本地歷史資料庫一律依日期查詢
+    has_dates = pd.api.types.is_datetime64_any_dtype(df['日期'])
+    use_dated_values = uses_dated_values(data_source, date_filter, has_dates)
+    if use_dated_values is None:
+        return
+    
+    with diagnostics.stage("fetch", source=data_source) as record:
+        values = fetch_update_values(
+            data_source,
+            stock_codes_clean,
+            row_dates=df.loc[rows_to_update, '日期'] if use_dated_values else None
+        )
+        record.rows_in = len(stock_codes_clean)
+        record.rows_out = len(values) if values is not None else 0
+    if values is None:
+        return
+    
+    # 更新 DataFrame（以代號或 (日期, 代號) 一次對應寫回）
+    with diagnostics.stage("update") as record:
+        result = apply_values(df, rows_to_update, values, clean_codes=clean_codes, by_date=use_dated_values)
+        record.rows_in = len(rows_to_update)
+        record.rows_out = result.updated
+        record.extra["unmatched_codes"] = len(result.unmatched_codes)
+    update_count = result.updated
+    
+    st.success(f"✅ 成功更新 {update_count} 列的交易值指標！")
+    
+    if result.unmatched_codes:
+        with st.expander(f"⚠️ {len(result.unmatched_codes)} 個代號未找到資料"):
+            st.write("、".join(result.unmatched_codes))
+    
+    # 顯示更新後的資料
+    st.subheader("📊 更新後的資料")
+    st.dataframe(df.head(20), use_container_width=True)
+    
+    # 統計資訊
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("總列數", len(df))
+    with col2:
+        st.metric("已更新", update_count)
+    with col3:
+        st.metric("成功率", f"{result.success_rate:.1f}%")
+    
+    # 提供下載
+    st.subheader("💾 下載更新後的檔案")
+    
+    with diagnostics.stage("export") as record:
+        output, file_format = download_frame(
+            df, export_format, f"updated_stock_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "📥 下載更新後的檔案", deferred=False
+        )
+        record.rows_in = record.rows_out = len(df)
+        record.bytes = len(output)
+        record.extra["format"] = file_format
+
+def run_streaming_update(uploaded_file, data_source, date_filter, diagnostics):
+    """串流模式：第一遍收集代號與日期，取得行情後第二遍逐塊填入 C/D 欄並寫出"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    only_today = date_filter == "僅今日"
+    
+    with st.spinner("🔍 正在掃描檔案..."), diagnostics.stage("scan") as record:
+        scan = scan_workbook(uploaded_file, uploaded_file.name, only_today, today)
+        uploaded_file.seek(0)
+        record.bytes = uploaded_file.size
+        record.rows_in = scan.rows_total
+        record.rows_out = scan.rows_selected
+    
+    if scan.rows_selected == 0:
+        st.warning(f"⚠️ 沒有找到今日 ({today}) 的資料" if only_today else "⚠️ 檔案沒有資料列")
+        return
+    
+    st.info(f"📍 共 {scan.rows_total} 列，將更新 {scan.rows_selected} 列；需要查詢 {len(scan.codes)} 支股票")
+    
+    use_dated_values = uses_dated_values(data_source, date_filter, bool(scan.dates))
+    if use_dated_values is None:
+        return
+    with diagnostics.stage("fetch", source=data_source) as record:
+        values = fetch_update_values(data_source, scan.codes, row_dates=scan.dates if use_dated_values else None)
+        record.rows_in = len(scan.codes)
+        record.rows_out = len(values) if values is not None else 0
+    if values is None:
+        return
+    
+    output_kind = 'csv' if uploaded_file.name.endswith('.csv') else 'xlsx'
+    output = tempfile.NamedTemporaryFile(suffix=f".{output_kind}", delete=False)
+    # 串流模式逐塊更新並寫出，更新與匯出合併為同一階段
+    with st.spinner("✍️ 正在分批寫出結果..."), diagnostics.stage("update", streaming=True, format=output_kind) as record:
+        with output:
+            result = stream_update(
+                uploaded_file, uploaded_file.name, output, values,
+                only_today, today, by_date=use_dated_values, output_kind=output_kind
+            )
+        record.rows_in = result.rows_total
+        record.rows_out = result.updated
+        record.bytes = os.path.getsize(output.name)
+        record.extra["unmatched_codes"] = len(result.unmatched_codes)
+    
+    st.success(f"✅ 成功更新 {result.updated} 列的交易值指標！")
+    if result.unmatched_codes:
+        with st.expander(f"⚠️ {len(result.unmatched_codes)} 個代號未找到資料"):
+            st.write("、".join(result.unmatched_codes))
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("總列數", scan.rows_total)
+    with col2:
+        st.metric("已更新", result.updated)
+    with col3:
+        st.metric("成功率", f"{result.success_rate:.1f}%")
+    
+    st.subheader("💾 下載更新後的檔案")
+    with open(output.name, 'rb') as f:
+        st.download_button(
+            label="📥 下載更新後的 Excel" if output_kind == 'xlsx' else "📥 下載更新後的 CSV",
+            data=f,
+            file_name=f"updated_stock_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{output_kind}",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" if output_kind == 'xlsx' else "text/csv"
+        )
+    os.remove(output.name)
+
+def run_batch_update(uploaded_files, data_source, date_filter, diagnostics):
+    """批次模式：平行掃描所有檔案，以代號聯集取得一次行情，再平行更新並打包為 zip"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    only_today = date_filter == "僅今日"
+    
+    files = expand_uploads([(f.name, f.getvalue()) for f in uploaded_files])
+    if not files:
+        st.warning("⚠️ 沒有可處理的 Excel 或 CSV 檔案")
+        return
+    
+    with BatchUpdater(files, only_today, today) as batch:
+        with st.spinner(f"🔍 正在平行掃描 {len(files)} 個檔案..."), diagnostics.stage("scan", files=len(files)) as record:
+            batch.scan()
+            record.bytes = sum(len(data) for _, data in files)
+            record.rows_in = sum(summary.rows_total for summary in batch.summaries)
+            record.rows_out = sum(summary.rows_selected for summary in batch.summaries)
+            record.extra["workers"] = batch.max_workers
         
-        st.success(f"✅ 成功處理 {len(results)} 檔股票，取前 {len(df_top)} 名")
-        return df_top
+        st.info(f"📍 {len(files)} 個檔案共 {record.rows_in} 列，將更新 {record.rows_out} 列；合併後需要查詢 {len(batch.codes)} 支股票")
+        if not batch.codes:
+            st.warning(f"⚠️ 沒有找到今日 ({today}) 的資料" if only_today else "⚠️ 檔案沒有可查詢的股票代號")
+            return
         
-    except Exception as e:
-        st.error(f"❌ 資料處理失敗: {e}")
-        return None
+        use_dated_values = uses_dated_values(data_source, date_filter, bool(batch.dates))
+        if use_dated_values is None:
+            return
+        with diagnostics.stage("fetch", source=data_source) as record:
+            values = fetch_update_values(data_source, batch.codes, row_dates=batch.dates if use_dated_values else None)
+            record.rows_in = len(batch.codes)
+            record.rows_out = len(values) if values is not None else 0
+        if values is None:
+            return
+        
+        with st.spinner("✍️ 正在平行更新所有檔案..."), diagnostics.stage("update", files=len(files)) as record:
+            result = batch.update(values, by_date=use_dated_values)
+            record.rows_in = sum(summary.rows_selected for summary in result.summaries)
+            record.rows_out = sum(summary.updated for summary in result.summaries)
+            record.bytes = len(result.archive)
+    
+    st.success(f"✅ 已更新 {len(files) - len(result.failed)} 個檔案、共 {record.rows_out} 列的交易值指標！")
+    for summary in result.failed:
+        st.warning(f"⚠️ {summary.name} 處理失敗: {summary.error}")
+    
+    st.subheader("📋 各檔案摘要")
+    st.dataframe(result.to_frame(), use_container_width=True)
+    
+    st.subheader("💾 下載更新後的檔案")
+    st.download_button(
+        label="📥 下載全部（zip）",
+        data=result.archive,
+        file_name=f"updated_stock_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+        mime="application/zip"
+    )
 
-def create_excel_file(df, filename="output.xlsx"):
-    """創建 Excel 檔案，自動選擇可用的引擎"""
-    output = BytesIO()
-    
-    # 優先使用 openpyxl，否則使用 xlsxwriter
-    if 'openpyxl' in EXCEL_ENGINES:
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-    elif 'xlsxwriter' in EXCEL_ENGINES:
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-    else:
-        # 如果都沒有，輸出 CSV
+def resolve_export_format(file_format):
+    """缺少 Excel 支援套件時改輸出 CSV"""
+    if file_format == "xlsx" and xlsx_engine() is None:
         st.warning("⚠️ 缺少 Excel 支援套件，將輸出 CSV 格式")
-        output = BytesIO()
-        csv_data = df.to_csv(index=False).encode('utf-8-sig')
-        output.write(csv_data)
-        output.seek(0)
-        return output, "csv"
+        return "csv"
+    return file_format
+
+def create_excel_file(df, file_format="xlsx"):
+    """依格式輸出為 bytes（直接寫入單一緩衝區，可直接交給下載按鈕）；缺少 Excel 套件時改輸出 CSV"""
+    file_format = resolve_export_format(file_format)
+    return export_bytes(df, file_format), file_format
+
+def download_frame(df, file_format, file_stem, label, key=None, deferred=True):
+    """
+    顯示下載按鈕，回傳輸出的 bytes 與實際格式
+
+    deferred 時按下按鈕才輸出（每次重新執行不會產生檔案內容），回傳的 bytes 為 None；
+    需要檔案大小（例如效能診斷）時傳入 deferred=False 立即輸出。
+    """
+    if deferred:
+        file_format = resolve_export_format(file_format)
+        output = None
+        data = partial(export_bytes, df, file_format)
+    else:
+        output, file_format = create_excel_file(df, file_format)
+        data = output
+    export_format = FORMATS[file_format]
+    st.download_button(
+        label=f"{label}（{export_format.label}）",
+        data=data,
+        file_name=f"{file_stem}{export_format.ext}",
+        mime=export_format.mime,
+        key=key
+    )
+    return output, file_format
+
+def get_intraday_monitor(top_n, watch):
+    """每個使用者工作階段一個盤中監看；報價來源或前 N 名改變時重新建立"""
+    key = (INTRADAY_QUOTE_URL, top_n, watch)
+    if st.session_state.get("intraday_key") != key:
+        if INTRADAY_QUOTE_URL:
+            source = HttpQuoteSource(INTRADAY_QUOTE_URL)
+        else:
+            # 證交所即時報價需逐檔查詢，只追蹤前一交易日交易值前 watch 名
+            ranked = load_market_ranking(current_trade_date_key()).ranked
+            source = MisQuoteSource(ranked.head(watch)["股票代號"].tolist())
+        st.session_state["intraday_monitor"] = IntradayMonitor(source, top_n)
+        st.session_state["intraday_key"] = key
+    return st.session_state["intraday_monitor"]
+
+def render_intraday(monitor):
+    """輪詢一次並顯示前 N 名（即時模式下由 st.fragment 定期重新執行）"""
+    delta = monitor.poll()
+    if monitor.last_error:
+        st.warning(f"⚠️ 報價取得失敗，顯示上一次的排行: {monitor.last_error}")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("追蹤股票", f"{len(monitor.ranking)} 檔")
+    with col2:
+        st.metric("本次異動報價", f"{delta.changed} 筆" if delta else "—")
+    with col3:
+        st.metric("排序更新耗時", f"{delta.seconds * 1000:.2f} ms" if delta else "—")
+    with col4:
+        st.metric("更新時間", monitor.last_poll.strftime('%H:%M:%S'))
     
-    output.seek(0)
-    return output, "xlsx"
+    if delta and monitor.polls > 1:
+        st.caption(f"🆕 新進榜 {len(delta.entered)} 檔・⬇️ 跌出榜 {len(delta.exited)} 檔・↕️ 名次變化 {len(delta.moved)} 檔")
+    st.dataframe(monitor.ranking.frame(), use_container_width=True, hide_index=True)
+    
+    exited = monitor.ranking.exited_frame()
+    if not exited.empty:
+        st.write("⬇️ **本次跌出榜**")
+        st.dataframe(exited, use_container_width=True, hide_index=True)
+
+# 收盤後於背景預先下載並計算排行，第一位使用者不必等待
+if PREFETCH_ENABLED:
+    start_prefetch_scheduler()
 
 # --- 主程式 ---
 st.title("📊 台股交易值分析系統")
@@ -173,74 +627,161 @@ if not EXCEL_ENGINES:
     """)
 
 # 創建分頁
-tab1, tab2 = st.tabs(["🚀 市場掃描與排行", "📝 Excel 更新工具"])
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+    ["🚀 市場掃描與排行", "📝 Excel 更新工具", "📈 多日流動性排行", "🔎 條件選股", "⚡ 盤中即時排行", "🗂️ 歷史排行"]
+)
 
 # ===== 第一個分頁：市場掃描 =====
 with tab1:
     st.header("🏆 台股交易值排行")
-    st.write("**使用證交所官方開放資料 API**")
+    st.write("**使用證交所、櫃買中心官方開放資料 API（上市 + 上櫃）**")
     
-    st.info("""
-    📡 **資料來源:** 台灣證券交易所官方開放資料 API  
-    🔗 **API 網址:** https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_data
+    st.info(f"""
+    📡 **資料來源:** 台灣證券交易所、證券櫃檯買賣中心官方開放資料 API（同時下載）  
+    🔗 **上市:** {MARKETS['twse'].url}  
+    🔗 **上櫃:** {MARKETS['tpex'].url}
     """)
     
     col1, col2 = st.columns(2)
     with col1:
         top_n = st.number_input("前 N 名股票", min_value=10, max_value=500, value=100, step=10, key="tab1_top_n")
     
-    if st.button("🚀 開始分析", type="primary", key="tab1_analyze"):
-        st.subheader("📡 步驟 1: 從證交所 API 獲取資料")
-        twse_data = get_stocks_from_twse_api()
+    with col2:
+        st.write("")
+        refresh_clicked = st.button("🔄 重新抓取", key="tab1_refresh", help="清除快取並重新從證交所、櫃買中心下載")
+        profile_enabled = st.checkbox("🔬 cProfile 剖析", key="tab1_profile", help="剖析本次各階段的函式耗時（會略過排行快取）")
+        sheets_mirror = st.checkbox(
+            "☁️ 同步至 Google Sheets", value=True, key="tab1_mirror",
+            help="本地排行結果資料庫為主要的歷史來源，Google Sheets 為選用的鏡像"
+        )
+    
+    analyze_clicked = st.button("🚀 開始分析", type="primary", key="tab1_analyze")
+    if analyze_clicked or refresh_clicked:
+        st.session_state["tab1_active"] = True
+        st.session_state.pop("tab1_result", None)
+        st.session_state.pop("tab1_error", None)
+    
+    if st.session_state.get("tab1_error"):
+        st.error(st.session_state["tab1_error"])
+        st.caption("💡 按下「開始分析」或「重新抓取」重試")
+    
+    # 分析過一次後，調整前 N 名只會重新切片快取中的排行，不會重新下載
+    if st.session_state.get("tab1_active"):
+        st.subheader("📡 步驟 1: 從證交所、櫃買中心 API 獲取資料")
+        diagnostics = Diagnostics(profile=profile_enabled)
+        ranking = st.session_state.get("tab1_result")
+        ranking_diagnostics = None
+        if ranking is not None:
+            # 未寫入快取的排行（不完整或剖析結果）保留在工作階段，其他分頁重新執行時不重新下載
+            st.caption("💡 沿用上次取得的排行，按下「開始分析」重新取得")
+            ranking_diagnostics = ranking.diagnostics
+        else:
+            try:
+                if refresh_clicked:
+                    clear_market_cache()
+                with st.spinner("📡 正在同時抓取上市、上櫃當日交易資訊..."):
+                    if profile_enabled:
+                        ranking = run_daily_ranking(diagnostics=diagnostics)
+                    else:
+                        ranking = load_market_ranking(current_trade_date_key())
+                        ranking_diagnostics = ranking.diagnostics
+            except Exception as e:
+                # 失敗後不再自動重試，以免其他分頁的操作每次都重新下載
+                st.session_state["tab1_active"] = False
+                st.session_state["tab1_error"] = f"❌ 行情 API 失敗: {e}"
+                st.error(st.session_state["tab1_error"])
+            else:
+                if profile_enabled or not ranking.complete:
+                    st.session_state["tab1_result"] = ranking
         
-        if twse_data is None:
-            st.error("❌ 無法取得證交所資料")
-            st.stop()
+        if ranking is not None:
+            ranked, report, trade_date = ranking.ranked, ranking.report, ranking.trade_date
+            sources, errors = ranking.sources, ranking.errors
         
-        st.subheader("📊 步驟 2: 計算交易值並排序")
-        df_top = process_twse_data(twse_data, limit=top_n)
+            st.success(f"✅ 成功獲取 {report.rows_in} 檔股票資料（{trade_date}；{describe_sources(sources)}）")
+            for key, error in errors.items():
+                if sources.get(key) == "yfinance":
+                    st.warning(f"⚠️ {MARKETS[key].label}資料取得失敗，已改以 yfinance 備援（結果不保存）: {error}")
+                else:
+                    st.warning(f"⚠️ {MARKETS[key].label}資料取得失敗，排行暫不含{MARKETS[key].label}股票: {error}")
+            for key in ranking.unverified:
+                st.warning(f"⚠️ 無法確認{MARKETS[key].label}資料的日期（可能尚未更新），暫以 {trade_date} 顯示且不寫入本地快取")
         
-        if df_top is None or len(df_top) == 0:
-            st.error("❌ 無法計算交易值資料")
-            st.stop()
+            st.subheader("📊 步驟 2: 計算交易值並排序")
+            df_top = ranked.head(top_n)
         
-        st.subheader(f"📊 交易值前 {len(df_top)} 名")
+            if len(df_top) == 0:
+                st.error("❌ 無法計算交易值資料")
+            else:
+                st.success(f"✅ 成功處理 {report.rows_out} 檔股票，取前 {len(df_top)} 名")
+                if report.total_dropped:
+                    st.caption(f"已略過 {report.total_dropped} 筆：{report.summary()}")
         
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("股票數量", f"{len(df_top)} 檔")
-        with col2:
-            avg_value = df_top["交易值指標"].mean()
-            st.metric("平均交易值", f"{avg_value:.2f} 億")
-        with col3:
-            max_value = df_top["交易值指標"].max()
-            st.metric("最高交易值", f"{max_value:.2f} 億")
+                st.subheader(f"📊 交易值前 {len(df_top)} 名")
         
-        st.dataframe(df_top, use_container_width=True)
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("股票數量", f"{len(df_top)} 檔")
+                with col2:
+                    avg_value = df_top["交易值指標"].mean()
+                    st.metric("平均交易值", f"{avg_value:.2f} 億")
+                with col3:
+                    max_value = df_top["交易值指標"].max()
+                    st.metric("最高交易值", f"{max_value:.2f} 億")
         
-        st.subheader("☁️ 步驟 3: 同步至 Google Sheets")
+                st.dataframe(df_top, use_container_width=True)
         
-        client = get_gspread_client()
+                col1, col2 = st.columns([1, 2])
+                with col1:
+                    ranking_format = st.selectbox(
+                        "輸出格式", available_formats(), format_func=lambda key: FORMATS[key].label, key="tab1_format"
+                    )
+                with col2:
+                    st.write("")
+                    download_frame(df_top, ranking_format, f"trading_value_top{len(df_top)}_{trade_date}", "📥 下載排行", key="tab1_download")
         
-        if client:
-            try:
-                with st.spinner("正在寫入雲端..."):
-                    sh = client.open(SHEET_NAME)
-                    ws = sh.get_worksheet(0)
-                    
-                    if not ws.acell('A1').value:
-                        ws.append_row(["日期", "股票代號", "收盤價格", "交易值指標"])
-                    
-                    upload_list = df_top[["日期", "股票代號", "收盤價格", "交易值指標"]].values.tolist()
-                    ws.append_rows(upload_list)
+                st.subheader("💾 步驟 3: 保存歷史結果")
+        
+                # 完整排行在計算時已寫入本地資料庫；由其他程序預先載入的排行在此補寫
+                result_store = get_default_result_store()
+                stored_dates = result_store.dates()
+                if ranking.complete and trade_date not in stored_dates:
+                    save_results_to_store(ranking)
+                    stored_dates = result_store.dates()
+                if ranking.complete and trade_date in stored_dates:
+                    st.success(f"✅ 已保存至本地排行結果資料庫（{trade_date}，共 {len(stored_dates)} 個交易日）")
+                elif ranking.unverified:
+                    st.warning("⚠️ 資料日期未確認，本次排行未寫入本地排行結果資料庫")
+                else:
+                    st.warning("⚠️ 部分市場資料取得失敗，本次排行未寫入本地排行結果資料庫")
+        
+                sync_requested = sheets_mirror and (analyze_clicked or refresh_clicked)
+                client = get_gspread_client() if sync_requested and ranking.complete else None
+        
+                if not sheets_mirror:
+                    st.info("💡 未啟用 Google Sheets 鏡像，歷史查詢請使用「歷史排行」分頁")
+                elif not (analyze_clicked or refresh_clicked):
+                    st.info("💡 調整前 N 名不會自動同步，按下「開始分析」即可同步目前的排行至 Google Sheets")
+                elif not ranking.complete:
+                    st.warning("⚠️ 排行不完整（部分市場失敗、備援或日期未確認），略過 Google Sheets 同步")
+                elif client:
+                    try:
+                        with st.spinner("正在寫入雲端..."):
+                            # 只寫入新增或變更的 (日期, 股票代號)，重複同步不會產生重複資料
+                            sync_result = sync_to_sheets(df_top, client, SHEET_NAME, diagnostics=diagnostics)
                     
-                    st.success(f"✅ 已成功同步 {len(df_top)} 筆資料至 Google Sheets！")
-                    st.info(f"📄 工作表: {SHEET_NAME}")
+                            st.success(
+                                f"✅ 已同步至 Google Sheets：新增 {sync_result.inserted} 筆、"
+                                f"更新 {sync_result.updated} 筆、未變更 {sync_result.unchanged} 筆"
+                            )
+                            st.info(f"📄 工作表: {SHEET_NAME}")
                     
-            except Exception as e:
-                st.error(f"❌ Google Sheets 同步失敗: {e}")
-        else:
-            st.warning("⚠️ 未連接 Google Sheets")
+                    except Exception as e:
+                        st.error(f"❌ Google Sheets 同步失敗: {e}")
+                else:
+                    st.warning("⚠️ 未連接 Google Sheets")
+        
+        show_diagnostics(diagnostics, ranking_diagnostics)
 
 # ===== 第二個分頁：Excel 更新工具 =====
 with tab2:
@@ -253,7 +794,7 @@ with tab2:
         **功能說明:**
         1. 上傳包含股票代號的 Excel 檔案
         2. 系統會自動識別今日的資料列
-        3. 從證交所 API 或 yfinance 獲取最新交易資訊
+        3. 從證交所 API、yfinance 或本地歷史資料庫獲取交易資訊
         4. 自動計算並填入交易值指標到 D 欄
         
         **Excel 格式要求:**
@@ -263,242 +804,86 @@ with tab2:
         - D 欄: 交易值指標 (將被更新)
         """)
     
+    batch_mode = st.toggle(
+        "📦 批次模式（多個檔案或 zip）", key="batch_mode",
+        help="一次上傳多個工作簿或 zip 壓縮檔；合併所有代號只取得一次行情，再平行更新並打包下載"
+    )
+    
+    if batch_mode:
+        batch_files = st.file_uploader(
+            "上傳多個 Excel / CSV 檔案或 zip", type=['xlsx', 'xls', 'csv', 'zip'],
+            accept_multiple_files=True, key="batch_upload"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            batch_source = st.radio(
+                "資料來源",
+                ["🏛️ 證交所 API (推薦)", "📈 yfinance", "🗄️ 本地歷史資料庫"],
+                help="所有檔案共用同一次取得的行情",
+                key="batch_source"
+            )
+        with col2:
+            batch_filter = st.radio("更新範圍", ["僅今日", "所有日期"], key="batch_filter")
+        batch_profile = st.checkbox("🔬 cProfile 剖析", key="batch_profile", help="剖析主程序各階段的函式耗時（不含子程序）")
+        
+        if st.button("🚀 開始批次更新", type="primary", key="batch_update", disabled=not batch_files):
+            diagnostics = Diagnostics(profile=batch_profile)
+            try:
+                run_batch_update(batch_files, batch_source, batch_filter, diagnostics)
+            except Exception as e:
+                st.error(f"❌ 批次處理時發生錯誤: {e}")
+            show_diagnostics(diagnostics)
+    
     # 上傳檔案
-    uploaded_file = st.file_uploader("上傳 Excel 檔案", type=['xlsx', 'xls', 'csv'], key="excel_upload")
+    uploaded_file = None if batch_mode else st.file_uploader("上傳 Excel 檔案", type=['xlsx', 'xls', 'csv'], key="excel_upload")
     
     if uploaded_file is not None:
+        streaming_mode = st.checkbox(
+            "🚰 大型檔案串流模式",
+            help="分批讀取與寫出，適合數十萬列的檔案；僅預覽前 10 列",
+            key="streaming_mode"
+        )
+        profile_enabled = st.checkbox("🔬 cProfile 剖析", key="tab2_profile", help="剖析本次各階段的函式耗時")
+        
         try:
-            # 讀取檔案
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            else:
-                try:
-                    df = pd.read_excel(uploaded_file, engine='openpyxl')
-                except:
-                    try:
-                        df = pd.read_excel(uploaded_file)
-                    except Exception as e:
-                        st.error(f"❌ 無法讀取 Excel 檔案: {e}")
-                        st.info("💡 請確認已安裝 openpyxl: `pip install openpyxl`")
-                        st.stop()
-            
-            st.success(f"✅ 成功讀取檔案，共 {len(df)} 列資料")
-            
-            # 顯示原始資料
-            st.subheader("📊 原始資料預覽")
-            st.dataframe(df.head(10), use_container_width=True)
-            
-            # 檢查欄位
-            if len(df.columns) < 2:
-                st.error("❌ 檔案至少需要 2 欄 (日期、股票代號)")
-                st.stop()
-            
-            # 重新命名欄位
-            if '日期' not in df.columns:
-                col_names = ['日期', '股票代號', '收盤價格', '交易值指標'] if len(df.columns) >= 4 else ['日期', '股票代號'] + list(df.columns[2:])
-                df.columns = col_names[:len(df.columns)]
-            
-            # 確保有必要的欄位
-            if '收盤價格' not in df.columns:
-                df['收盤價格'] = None
-            if '交易值指標' not in df.columns:
-                df['交易值指標'] = None
-            
-            # 選擇更新方式
-            st.subheader("⚙️ 更新設定")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                data_source = st.radio(
-                    "資料來源",
-                    ["🏛️ 證交所 API (推薦)", "📈 yfinance"],
-                    help="證交所 API 更快但僅限當日；yfinance 較慢但更靈活",
-                    key="data_source"
-                )
-            
-            with col2:
-                date_filter = st.radio(
-                    "更新範圍",
-                    ["僅今日", "所有日期"],
-                    help="僅今日：只更新今天的資料；所有日期：更新所有列",
-                    key="date_filter"
-                )
-            
-            if st.button("🚀 開始更新交易值指標", type="primary", key="tab2_update"):
-                
-                # 轉換日期欄位
-                try:
-                    df['日期'] = pd.to_datetime(df['日期'])
-                except:
-                    st.warning("⚠️ 日期欄位格式無法識別，將更新所有列")
-                    date_filter = "所有日期"
-                
-                # 篩選今日資料
-                today = datetime.now().strftime('%Y-%m-%d')
-                
-                if date_filter == "僅今日":
-                    mask = df['日期'].dt.strftime('%Y-%m-%d') == today
-                    rows_to_update = df[mask].index.tolist()
-                    
-                    if len(rows_to_update) == 0:
-                        st.warning(f"⚠️ 沒有找到今日 ({today}) 的資料")
-                        st.info("💡 您可以選擇「所有日期」來更新全部資料")
-                        st.stop()
-                    
-                    st.info(f"📍 找到 {len(rows_to_update)} 列今日資料需要更新")
-                else:
-                    rows_to_update = df.index.tolist()
-                    st.info(f"📍 將更新全部 {len(rows_to_update)} 列資料")
+            df = read_upload(uploaded_file, streaming_mode)
+            if df is not None:
+                # 重新命名欄位並補上缺少的欄位
+                normalize_columns(df)
                 
-                # 獲取股票代號列表
-                stock_codes = df.loc[rows_to_update, '股票代號'].unique().tolist()
-                
-                # 清理股票代號格式
-                stock_codes_clean = []
-                for code in stock_codes:
-                    code_str = str(code).strip().replace('.TW', '').replace('.tw', '')
-                    if code_str.replace('.', '').isdigit():
-                        stock_codes_clean.append(code_str)
-                
-                st.write(f"需要查詢 {len(stock_codes_clean)} 支股票")
-                
-                # 根據選擇的資料來源獲取資料
-                stock_value_map = {}
-                
-                if data_source == "🏛️ 證交所 API (推薦)":
-                    with st.spinner("📡 正在從證交所 API 獲取資料..."):
-                        try:
-                            url = 'https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_data'
-                            twse_data = pd.read_csv(url)
-                            
-                            for idx, row in twse_data.iterrows():
-                                try:
-                                    stock_code = str(row.iloc[0]).strip()
-                                    
-                                    if stock_code not in stock_codes_clean:
-                                        continue
-                                    
-                                    close_price = str(row.iloc[7]).replace(',', '').replace('--', '0')
-                                    if close_price == '' or close_price == '--':
-                                        continue
-                                    close_price = float(close_price)
-                                    
-                                    volume = str(row.iloc[2]).replace(',', '').replace('--', '0')
-                                    if volume == '' or volume == '--':
-                                        continue
-                                    volume = float(volume)
-                                    
-                                    if close_price <= 0 or volume <= 0:
-                                        continue
-                                    
-                                    trading_value = (close_price * volume) / 1e8
-                                    
-                                    stock_value_map[stock_code] = {
-                                        'price': close_price,
-                                        'value': round(trading_value, 4)
-                                    }
-                                    
-                                except:
-                                    continue
-                            
-                            st.success(f"✅ 成功獲取 {len(stock_value_map)} 支股票的資料")
-                            
-                        except Exception as e:
-                            st.error(f"❌ 證交所 API 失敗: {e}")
-                            st.stop()
-                
-                else:  # yfinance
-                    with st.spinner("📈 正在從 yfinance 下載資料..."):
-                        try:
-                            tickers = [f"{code}.TW" for code in stock_codes_clean]
-                            data = yf.download(tickers, period="5d", group_by='ticker', threads=True, progress=False)
-                            
-                            for code in stock_codes_clean:
-                                ticker = f"{code}.TW"
-                                try:
-                                    if isinstance(data.columns, pd.MultiIndex):
-                                        if ticker not in data.columns.get_level_values(0):
-                                            continue
-                                        ticker_data = data[ticker].dropna()
-                                    else:
-                                        ticker_data = data.dropna()
-                                    
-                                    if ticker_data.empty:
-                                        continue
-                                    
-                                    last_row = ticker_data.iloc[-1]
-                                    
-                                    if 'Close' not in ticker_data.columns or 'Volume' not in ticker_data.columns:
-                                        continue
-                                    
-                                    price = float(last_row['Close'])
-                                    volume = float(last_row['Volume'])
-                                    
-                                    if price <= 0 or volume <= 0:
-                                        continue
-                                    
-                                    trading_value = (price * volume) / 1e8
-                                    
-                                    stock_value_map[code] = {
-                                        'price': round(price, 2),
-                                        'value': round(trading_value, 4)
-                                    }
-                                    
-                                except:
-                                    continue
-                            
-                            st.success(f"✅ 成功獲取 {len(stock_value_map)} 支股票的資料")
-                            
-                        except Exception as e:
-                            st.error(f"❌ yfinance 下載失敗: {e}")
-                            st.stop()
-                
-                # 更新 DataFrame
-                update_count = 0
-                
-                for idx in rows_to_update:
-                    stock_code = str(df.loc[idx, '股票代號']).strip().replace('.TW', '').replace('.tw', '')
-                    
-                    if stock_code in stock_value_map:
-                        df.loc[idx, '收盤價格'] = stock_value_map[stock_code]['price']
-                        df.loc[idx, '交易值指標'] = stock_value_map[stock_code]['value']
-                        update_count += 1
+                # 選擇更新方式
+                st.subheader("⚙️ 更新設定")
                 
-                st.success(f"✅ 成功更新 {update_count} 列的交易值指標！")
-                
-                # 顯示更新後的資料
-                st.subheader("📊 更新後的資料")
-                st.dataframe(df.head(20), use_container_width=True)
-                
-                # 統計資訊
-                col1, col2, col3 = st.columns(3)
+                col1, col2 = st.columns(2)
                 with col1:
-                    st.metric("總列數", len(df))
-                with col2:
-                    st.metric("已更新", update_count)
-                with col3:
-                    success_rate = (update_count / len(rows_to_update) * 100) if len(rows_to_update) > 0 else 0
-                    st.metric("成功率", f"{success_rate:.1f}%")
+                    data_source = st.radio(
+                        "資料來源",
+                        ["🏛️ 證交所 API (推薦)", "📈 yfinance", "🗄️ 本地歷史資料庫"],
+                        help="「所有日期」時依每列日期填入當日行情；證交所 API 較快（依日期回補只含上市股票），yfinance 會快取已下載的日線（含上櫃）；本地歷史資料庫只讀取已存檔的上市日期",
+                        key="data_source"
+                    )
                 
-                # 提供下載
-                st.subheader("💾 下載更新後的檔案")
+                with col2:
+                    date_filter = st.radio(
+                        "更新範圍",
+                        ["僅今日", "所有日期"],
+                        help="僅今日：只更新今天的資料；所有日期：更新所有列",
+                        key="date_filter"
+                    )
                 
-                output, file_format = create_excel_file(df)
+                export_format = st.selectbox(
+                    "輸出格式", available_formats(), format_func=lambda key: FORMATS[key].label, key="export_format",
+                    help="Parquet / Feather 可由 notebook 以 pd.read_parquet / pd.read_feather 直接載入；串流模式依上傳檔案輸出 Excel 或 CSV"
+                )
                 
-                if file_format == "xlsx":
-                    st.download_button(
-                        label="📥 下載更新後的 Excel",
-                        data=output,
-                        file_name=f"updated_stock_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                else:
-                    st.download_button(
-                        label="📥 下載更新後的 CSV",
-                        data=output,
-                        file_name=f"updated_stock_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
+                if st.button("🚀 開始更新交易值指標", type="primary", key="tab2_update"):
+                    diagnostics = Diagnostics(profile=profile_enabled)
+                    
+                    if streaming_mode:
+                        run_streaming_update(uploaded_file, data_source, date_filter, diagnostics)
+                    else:
+                        run_table_update(df, data_source, date_filter, export_format, diagnostics)
+                    show_diagnostics(diagnostics)
                 
         except Exception as e:
             st.error(f"❌ 讀取或處理檔案時發生錯誤: {e}")
@@ -506,7 +891,7 @@ with tab2:
             with st.expander("查看詳細錯誤"):
                 st.code(traceback.format_exc())
     
-    else:
+    elif not batch_mode:
         # 提供範例檔案
         st.info("👆 請上傳 Excel 或 CSV 檔案開始使用")
         
@@ -518,39 +903,240 @@ with tab2:
                 '交易值指標': [None] * 5
             })
             
-            if EXCEL_ENGINES:
-                output, file_format = create_excel_file(sample_data)
-                
-                if file_format == "xlsx":
-                    st.write("下載範例 Excel 檔案：")
-                    st.download_button(
-                        label="📥 下載範例 Excel",
-                        data=output,
-                        file_name="sample_stock_template.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key="download_sample"
-                    )
-                else:
-                    st.write("下載範例 CSV 檔案：")
-                    st.download_button(
-                        label="📥 下載範例 CSV",
-                        data=output,
-                        file_name="sample_stock_template.csv",
-                        mime="text/csv",
-                        key="download_sample"
-                    )
+            st.write("下載範例檔案：")
+            download_frame(sample_data, "xlsx" if EXCEL_ENGINES else "csv", "sample_stock_template", "📥 下載範例", key="download_sample")
+
+# ===== 第三個分頁：多日流動性排行 =====
+with tab3:
+    st.header("📈 多日流動性排行")
+    st.write("**以本地歷史資料庫的 N 日平均交易值排名，降低單日爆量的影響**")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        window = st.selectbox("滾動視窗（交易日）", [5, 10, 20, 60], index=2, key="tab3_window")
+    with col2:
+        liquidity_top_n = st.number_input("前 N 名股票", min_value=10, max_value=500, value=100, step=10, key="tab3_top_n")
+    with col3:
+        sort_by = st.selectbox(
+            "排序方式", ["排名", "排名變化", "量能倍數"], key="tab3_sort",
+            help="排名：N 日平均交易值；排名變化：較前一日上升最多；量能倍數：當日成交股數 ÷ 前 N 日平均"
+        )
+    
+    if st.button("📈 計算多日排行", type="primary", key="tab3_analyze"):
+        st.session_state["tab3_active"] = True
+    
+    # 引擎在程序內共用，之後只會增量加入新的交易日
+    if st.session_state.get("tab3_active"):
+        liquidity = None
+        try:
+            with st.spinner("📈 正在計算滾動統計..."):
+                liquidity, engine = get_liquidity_ranking(window)
+        except Exception as e:
+            st.error(f"❌ 無法讀取本地歷史資料庫: {e}")
+        
+        if liquidity is None:
+            pass
+        elif liquidity.empty:
+            st.warning("⚠️ 本地歷史資料庫尚無資料，請先在「市場掃描與排行」抓取資料，或以 Excel 更新工具回補歷史行情")
+        else:
+            if len(engine.dates) < window:
+                st.info(f"💡 目前只有 {len(engine.dates)} 個交易日，天數不足 {window} 日時以現有天數計算")
+            
+            df_liquidity = liquidity.sort_values(sort_by, ascending=(sort_by == "排名"), kind="stable")
+            df_liquidity = df_liquidity.head(liquidity_top_n)
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("最新交易日", engine.dates[-1])
+            with col2:
+                st.metric("歷史交易日數", f"{len(engine.dates)} 天")
+            with col3:
+                st.metric("量能倍數 ≥ 2 的股票", f"{int((liquidity['量能倍數'] >= 2).sum())} 檔")
+            
+            st.dataframe(df_liquidity, use_container_width=True)
+
+# ===== 第四個分頁：條件選股 =====
+with tab4:
+    st.header("🔎 條件選股")
+    st.write("**以自訂條件篩選最新交易日的全市場行情（上市 + 上櫃）**")
+    
+    st.info("""
+    ✍️ **條件格式:** 每行一條「欄位 運算子 數值」，全部符合（或任一符合）才列出  
+    🔣 **運算子:** `>` `>=` `<` `<=` `==` `!=`、`between 下限, 上限`、`in 代號, 代號`、`not in 代號, 代號`  
+    📋 **欄位:** 收盤價格、成交股數、交易值指標、交易值排名、代號；納入多日統計時另有 平均交易值、中位數交易值、排名、排名變化、量能倍數、百分位
+    """)
+    
+    saved_screens = load_screens()
+    saved_by_name = {screen.name: screen for screen in saved_screens}
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        preset = st.selectbox("儲存的篩選", ["（自訂）"] + list(saved_by_name), key="tab4_preset")
+    with col2:
+        screen_window = st.selectbox(
+            "多日統計視窗", [0, 5, 10, 20, 60], index=3, key="tab4_window",
+            format_func=lambda days: "不納入" if days == 0 else f"{days} 日"
+        )
+    
+    preset_screen = saved_by_name.get(preset)
+    rules_text = st.text_area(
+        "篩選條件",
+        value=preset_screen.describe() if preset_screen else "收盤價格 between 20, 500\n交易值指標 >= 5",
+        height=140, key=f"tab4_rules_{preset}"
+    )
+    match_any = st.checkbox(
+        "任一條件符合即列出", value=bool(preset_screen and preset_screen.mode == "any"), key=f"tab4_any_{preset}"
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        screen_clicked = st.button("🔎 開始篩選", type="primary", key="tab4_run")
+    with col2:
+        run_all_clicked = st.button("📋 執行全部儲存的篩選", key="tab4_run_all", disabled=not saved_screens)
+    with col3:
+        save_name = st.text_input("儲存名稱", value=preset if preset_screen else "", key=f"tab4_name_{preset}")
+        save_clicked = st.button("💾 儲存篩選", key="tab4_save", disabled=not save_name.strip())
+    
+    screen = None
+    try:
+        screen = screen_from_text(rules_text, name=save_name.strip() or "自訂篩選", mode="any" if match_any else "all")
+    except ScreenError as e:
+        st.error(f"❌ {e}")
+    
+    if save_clicked and screen is not None:
+        save_screen(screen)
+        st.success(f"✅ 已儲存篩選「{screen.name}」")
+    
+    if screen_clicked or run_all_clicked:
+        st.session_state["tab4_active"] = "all" if run_all_clicked else "single"
+    
+    # 行情與多日統計皆來自快取，修改條件只會重新計算遮罩
+    tab4_mode = st.session_state.get("tab4_active")
+    if tab4_mode == "single" and screen is None:
+        # 條件有誤（已顯示錯誤），修正後自動重新篩選
+        tab4_mode = None
+    ranking = None
+    if tab4_mode:
+        try:
+            with st.spinner("📡 正在載入最新行情..."):
+                ranking = load_market_ranking(current_trade_date_key())
+                liquidity = get_liquidity_ranking(screen_window)[0] if screen_window else None
+        except Exception as e:
+            st.error(f"❌ 無法載入行情: {e}")
+    
+    results = None
+    if ranking is not None:
+        universe = build_universe(ranking.ranked, liquidity)
+        screens = saved_screens if tab4_mode == "all" else [screen]
+        try:
+            diagnostics = Diagnostics()
+            with diagnostics.stage("screen", screens=len(screens)) as record:
+                results = run_screens(screens, universe)
+                record.rows_in = len(universe)
+                record.rows_out = sum(len(matched) for matched in results.values())
+        except ScreenError as e:
+            st.error(f"❌ {e}")
+    
+    if results is not None:
+        st.caption(f"📅 {ranking.trade_date}・共 {len(universe)} 檔・{describe_sources(ranking.sources)}・篩選耗時 {diagnostics.total_seconds * 1000:.1f} ms")
+        for name, matched in results.items():
+            st.subheader(f"🔎 {name}：符合 {len(matched)} 檔")
+            st.dataframe(matched, use_container_width=True)
+
+# ===== 第五個分頁：盤中即時排行 =====
+with tab5:
+    st.header("⚡ 盤中即時排行")
+    st.write("**定期輪詢即時報價，只將有異動的報價套用到排序，標記新進榜、跌出榜與名次變化**")
+    
+    st.info(
+        f"📡 **報價來源:** {INTRADAY_QUOTE_URL}" if INTRADAY_QUOTE_URL else
+        "📡 **報價來源:** 證交所基本市況報導（追蹤前一交易日交易值前幾名）  \n"
+        "💡 可設定環境變數 STOCK_INTRADAY_URL 指向相容的 JSON 端點，例如 `python -m stock_core intraday-server` 的本地模擬行情"
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        intraday_top_n = st.number_input("前 N 名股票", min_value=10, max_value=200, value=30, step=10, key="tab5_top_n")
+    with col2:
+        interval = st.number_input("更新間隔（秒）", min_value=2, max_value=60, value=INTRADAY_INTERVAL, key="tab5_interval")
+    with col3:
+        watch = st.number_input(
+            "追蹤檔數", min_value=50, max_value=1000, value=300, step=50, key="tab5_watch",
+            disabled=bool(INTRADAY_QUOTE_URL), help="使用證交所報價時，追蹤前一交易日交易值前幾名"
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        live = st.toggle("▶️ 即時更新", key="tab5_live")
+    with col2:
+        if st.button("🔄 更新一次", key="tab5_poll"):
+            st.session_state["tab5_active"] = True
+    
+    if live or st.session_state.get("tab5_active"):
+        st.session_state["tab5_active"] = True
+        monitor = None
+        try:
+            monitor = get_intraday_monitor(intraday_top_n, watch)
+        except Exception as e:
+            st.error(f"❌ 無法建立盤中報價來源: {e}")
+        
+        if monitor is not None:
+            # 即時模式只重新執行這個區塊，不會重跑其他分頁
+            st.fragment(run_every=interval if live else None)(render_intraday)(monitor)
+
+# ===== 第六個分頁：歷史排行 =====
+with tab6:
+    st.header("🗂️ 歷史排行")
+    st.write("**查詢本地排行結果資料庫（每次排行自動保存，不受 Google Sheets 配額限制）**")
+    
+    result_store = get_default_result_store()
+    stored_dates = result_store.dates()
+    
+    if not stored_dates:
+        st.info("💡 本地排行結果資料庫尚無資料，請先在「市場掃描與排行」執行一次分析")
+    
+    with st.expander("☁️ 從 Google Sheets 匯入既有歷史"):
+        st.write(f"將工作表「{SHEET_NAME}」的歷史一次匯入本地資料庫（已有的日期不會被覆蓋）")
+        if st.button("📥 匯入", key="tab6_import"):
+            client = get_gspread_client()
+            if client is None:
+                st.warning("⚠️ 未連接 Google Sheets")
             else:
-                # 直接提供 CSV
-                csv_output = BytesIO()
-                csv_data = sample_data.to_csv(index=False).encode('utf-8-sig')
-                csv_output.write(csv_data)
-                csv_output.seek(0)
-                
-                st.write("下載範例 CSV 檔案：")
-                st.download_button(
-                    label="📥 下載範例 CSV",
-                    data=csv_output,
-                    file_name="sample_stock_template.csv",
-                    mime="text/csv",
-                    key="download_sample"
-                )
+                try:
+                    with st.spinner("正在讀取 Google Sheets..."):
+                        imported = import_from_sheets(client, SHEET_NAME, result_store)
+                    st.success(f"✅ 已匯入 {imported} 筆")
+                    stored_dates = result_store.dates()
+                except Exception as e:
+                    st.error(f"❌ 匯入失敗: {e}")
+    
+    if stored_dates:
+        query = st.radio("查詢", ["指定日期前 N 名", "個股歷史", "進榜天數"], horizontal=True, key="tab6_query")
+        
+        if query == "指定日期前 N 名":
+            col1, col2 = st.columns(2)
+            with col1:
+                query_date = st.selectbox("日期", stored_dates[::-1], key="tab6_date")
+            with col2:
+                history_top_n = st.number_input("前 N 名股票", min_value=10, max_value=500, value=100, step=10, key="tab6_top_n")
+            result = result_store.top(query_date, history_top_n)
+        
+        elif query == "個股歷史":
+            stock_code = st.text_input("股票代號", value="2330", key="tab6_code")
+            result = result_store.history(stock_code)
+            if not result.empty:
+                st.line_chart(result.set_index("日期")[["交易值指標"]], height=220)
+        
+        else:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                history_top_n = st.number_input("前 N 名", min_value=5, max_value=500, value=20, step=5, key="tab6_days_n")
+            with col2:
+                start_date = st.selectbox("起始日期", stored_dates, key="tab6_start")
+            with col3:
+                end_date = st.selectbox("結束日期", stored_dates[::-1], key="tab6_end")
+            result = result_store.days_in_top(history_top_n, start_date, end_date)
+        
+        st.caption(f"🗄️ {result_store.path}・{len(stored_dates)} 個交易日（{stored_dates[0]} ~ {stored_dates[-1]}）・{len(result)} 筆")
+        st.dataframe(result, use_container_width=True, hide_index=True)
+
@@ -0,0 +1 @@
+"""台股交易值分析系統的核心邏輯（不依賴 Streamlit）"""
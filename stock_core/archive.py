@@ -0,0 +1,155 @@
+"""每日 STOCK_DAY_ALL 快照的欄式歷史資料庫（每日一個 Arrow IPC 檔，可記憶體映射）"""
+import os
+import re
+import threading
+
+import pandas as pd
+
+from stock_core.config import CACHE_DIR
+from stock_core.parser import parse_stock_day_all
+
+# 存檔欄位（日期由檔名決定，不重複存於每列）
+ARCHIVE_COLUMNS = ["代號", "股票名稱", "收盤價格", "成交股數", "交易值指標"]
+
+# 存檔型別：代號、名稱以字典編碼，價格為 float32、交易值指標為 float64（舊檔的 float32 於讀取時轉換）
+def _archive_schema(pa):
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("代號", text),
+        ("股票名稱", text),
+        ("收盤價格", pa.float32()),
+        ("成交股數", pa.int64()),
+        ("交易值指標", pa.float64()),
+    ])
+
+
+_DATE_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.arrow$")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+    except ImportError as e:
+        raise ImportError("歷史資料庫需要 pyarrow：pip install pyarrow") from e
+    return pyarrow
+
+
+class HistoryArchive:
+    """
+    以交易日分割的本地歷史資料庫
+
+    每個交易日存成一個未壓縮的 Arrow IPC (Feather v2) 檔，讀取時以記憶體映射載入，
+    多個月的查詢只需讀取對應日期的檔案，不需連線或讀取 Google Sheets。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or CACHE_DIR, "archive")
+        self._lock = threading.Lock()
+
+    def _path(self, trade_date):
+        return os.path.join(self.root, f"{trade_date}.arrow")
+
+    def dates(self, start=None, end=None):
+        """已存檔的交易日（遞增排序），可限定日期區間"""
+        if not os.path.isdir(self.root):
+            return []
+        found = sorted(m.group(1) for m in map(_DATE_FILE.match, os.listdir(self.root)) if m)
+        start = _date_str(start)
+        end = _date_str(end)
+        return [d for d in found if (start is None or d >= start) and (end is None or d <= end)]
+
+    def has(self, trade_date):
+        return os.path.exists(self._path(_date_str(trade_date)))
+
+    def append(self, trade_date, parsed):
+        """寫入（或覆寫）某交易日的解析結果"""
+        pa = _require_pyarrow()
+        trade_date = _date_str(trade_date)
+        frame = parsed[ARCHIVE_COLUMNS].reset_index(drop=True)
+        table = pa.Table.from_pandas(frame, preserve_index=False).cast(_archive_schema(pa))
+
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(trade_date)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pa.feather.write_feather(table, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+
+    def _read_table(self, trade_date, codes=None, columns=None):
+        pa = _require_pyarrow()
+        import pyarrow.compute as pc
+
+        table = pa.feather.read_table(self._path(trade_date), columns=columns, memory_map=True)
+        # 舊檔可能以一般字串儲存，統一轉為存檔型別以便合併
+        table = table.cast(pa.schema([_archive_schema(pa).field(name) for name in table.column_names]))
+        if codes is not None:
+            table = table.filter(pc.is_in(table["代號"], value_set=pa.array(codes, type=pa.string())))
+        return table
+
+    def load_day(self, trade_date, codes=None):
+        """讀取單一交易日，找不到時回傳 None"""
+        trade_date = _date_str(trade_date)
+        if not self.has(trade_date):
+            return None
+        return self._read_table(trade_date, _code_list(codes)).to_pandas()
+
+    def query_long(self, codes=None, start=None, end=None, fields=None):
+        """回傳長表：每列一個 (日期, 代號)，欄位為 fields（預設全部）"""
+        pa = _require_pyarrow()
+        codes = _code_list(codes)
+        columns = None if fields is None else ["代號"] + [f for f in fields if f != "代號"]
+
+        tables = []
+        for trade_date in self.dates(start, end):
+            table = self._read_table(trade_date, codes, columns)
+            tables.append(table.append_column("日期", pa.array([trade_date] * table.num_rows, type=pa.string())))
+
+        if not tables:
+            return pd.DataFrame(columns=["日期"] + (columns or ARCHIVE_COLUMNS))
+        frame = pa.concat_tables(tables).to_pandas()
+        frame["日期"] = frame["日期"].astype("category")
+        return frame[["日期"] + [c for c in frame.columns if c != "日期"]]
+
+    def query(self, codes=None, start=None, end=None, field="交易值指標"):
+        """回傳股票 × 日期面板（列為代號、欄為日期），缺值為 NaN"""
+        long = self.query_long(codes, start, end, fields=[field])
+        long = long.astype({"代號": str, "日期": str})
+        panel = long.pivot(index="代號", columns="日期", values=field)
+        panel.columns.name = None
+        return panel
+
+
+def _date_str(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _code_list(codes):
+    if codes is None:
+        return None
+    return sorted({str(c).strip() for c in codes})
+
+
+def archive_snapshot(snapshot, archive=None):
+    """將快照解析後存入歷史資料庫（已存在則略過），回傳是否有寫入"""
+    archive = archive or get_default_archive()
+    if archive.has(snapshot.trade_date):
+        return False
+    parsed, _ = parse_stock_day_all(snapshot.data, trade_date=snapshot.trade_date, code_pattern=None)
+    archive.append(snapshot.trade_date, parsed)
+    return True
+
+
+_default_archive = None
+
+
+def get_default_archive():
+    """程序內共用的歷史資料庫"""
+    global _default_archive
+    if _default_archive is None:
+        _default_archive = HistoryArchive()
+    return _default_archive
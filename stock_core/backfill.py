@@ -0,0 +1,170 @@
+"""
+歷史回補：依日期分組，每個交易日一次批次查詢，並以限速的執行緒池並行處理
+
+資料來源為證交所 MI_INDEX，只包含上市證券；上櫃股票沒有指定日期的回補來源，
+依日期查詢時會列為未找到的代號（需要上櫃歷史行情時請改用 yfinance）。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from stock_core.archive import get_default_archive
+from stock_core.config import MI_INDEX_URL
+from stock_core.http_client import get_default_client
+from stock_core.parser import parse_stock_day_all
+from stock_core.schema import compact
+
+# 回補結果欄位
+BACKFILL_COLUMNS = ["日期", "代號", "收盤價格", "成交股數", "交易值指標"]
+
+
+class RateLimiter:
+    """確保任兩次請求的開始時間至少相隔 min_interval 秒（執行緒安全）"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _find_quote_table(payload):
+    """從 MI_INDEX 回應中找出個股收盤行情表，回傳 (fields, data)"""
+    candidates = [(t.get("fields"), t.get("data")) for t in payload.get("tables", [])]
+    candidates += [
+        (payload.get(key), payload.get("data" + key[len("fields"):]))
+        for key in payload if key.startswith("fields")
+    ]
+    for fields, data in candidates:
+        if fields and "證券代號" in fields and "收盤價" in fields:
+            return fields, data or []
+    return None, None
+
+
+def fetch_daily_report(trade_date, session=None, timeout=30):
+    """
+    取得證交所指定日期的每日收盤行情（欄位標題與 STOCK_DAY_ALL 相同，可直接解析）
+
+    非交易日或查無資料時回傳 None。
+    """
+    session = session or get_default_client()
+    params = {
+        "date": pd.Timestamp(trade_date).strftime('%Y%m%d'),
+        "type": "ALLBUT0999",
+        "response": "json",
+    }
+    response = session.get(MI_INDEX_URL, params=params, timeout=timeout)
+    if response.status_code != 200:
+        raise Exception(f"HTTP 狀態碼: {response.status_code}")
+
+    payload = response.json()
+    if payload.get("stat") != "OK":
+        return None
+
+    fields, data = _find_quote_table(payload)
+    if not data:
+        return None
+
+    return pd.DataFrame(data, columns=fields)
+
+
+@dataclass
+class BackfillReport:
+    """回補統計"""
+    dates_total: int = 0
+    from_archive: int = 0
+    fetched: int = 0
+    no_data: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)
+
+
+def backfill(dates, codes=None, archive=None, allow_network=True, fetcher=fetch_daily_report,
+             max_workers=4, min_interval=2.0, retries=2, progress=None):
+    """
+    取得多個日期的每日行情
+
+    每個不重複的日期只處理一次：已存檔者直接讀本地歷史資料庫，其餘以執行緒池向證交所
+    批次查詢（整體受 RateLimiter 限速），下載結果會寫回歷史資料庫供下次使用。
+    回傳 (長表 DataFrame, BackfillReport)，長表欄位為 BACKFILL_COLUMNS。
+    """
+    archive = archive or get_default_archive()
+    code_list = None if codes is None else sorted({str(c).strip() for c in codes})
+    unique_dates = sorted({pd.Timestamp(d).strftime('%Y-%m-%d') for d in dates if not pd.isna(d)})
+    report = BackfillReport(dates_total=len(unique_dates))
+
+    frames = []
+    to_fetch = []
+    for trade_date in unique_dates:
+        if pd.Timestamp(trade_date).weekday() >= 5:
+            report.no_data.append(trade_date)
+        elif archive.has(trade_date):
+            frames.append(_select(archive.load_day(trade_date, code_list), trade_date))
+            report.from_archive += 1
+        elif allow_network:
+            to_fetch.append(trade_date)
+        else:
+            report.skipped.append(trade_date)
+
+    done = report.from_archive + len(report.no_data) + len(report.skipped)
+    if progress:
+        progress(done, report.dates_total)
+
+    limiter = RateLimiter(min_interval)
+
+    def fetch_one(trade_date):
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                raw = fetcher(trade_date)
+                break
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(min_interval * (2 ** attempt))
+        if raw is None:
+            return None
+        parsed, _ = parse_stock_day_all(raw, trade_date=trade_date, code_pattern=None)
+        archive.append(trade_date, parsed)
+        return parsed
+
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(fetch_one, d): d for d in to_fetch}
+            for future in as_completed(futures):
+                trade_date = futures[future]
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    report.failed[trade_date] = str(e)
+                else:
+                    if parsed is None or parsed.empty:
+                        report.no_data.append(trade_date)
+                    else:
+                        if code_list is not None:
+                            parsed = parsed[parsed["代號"].isin(code_list)]
+                        frames.append(_select(parsed, trade_date))
+                        report.fetched += 1
+                done += 1
+                if progress:
+                    progress(done, report.dates_total)
+
+    report.no_data.sort()
+    if not frames:
+        return pd.DataFrame(columns=BACKFILL_COLUMNS), report
+    return compact(pd.concat(frames, ignore_index=True)), report
+
+
+def _select(frame, trade_date):
+    frame = frame.assign(日期=trade_date)
+    return frame[BACKFILL_COLUMNS]
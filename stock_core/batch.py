@@ -0,0 +1,223 @@
+"""
+批次更新多個工作簿：所有檔案的代號合併後只取得一次行情，再以多程序平行更新
+
+流程為 平行掃描（收集代號與日期）→ 呼叫端以聯集取得行情 → 平行串流更新，
+結果打包為 zip（各檔案加上 summary.csv 摘要）。單一檔案失敗只記錄在摘要中。
+"""
+import multiprocessing
+import os
+import posixpath
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+
+import pandas as pd
+
+from stock_core.workbook_io import ScanResult, scan_workbook, stream_update
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+
+def _is_supported(name):
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def expand_uploads(files):
+    """
+    展開上傳的檔案：files 為 [(檔名, bytes)]，zip 內的工作簿逐一取出
+
+    略過資料夾、macOS 的 __MACOSX 與不支援的副檔名；同名檔案加上序號避免覆蓋。
+    """
+    expanded = []
+    for name, data in files:
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    inner = info.filename
+                    if info.is_dir() or inner.startswith('__MACOSX/') or not _is_supported(inner):
+                        continue
+                    expanded.append((posixpath.basename(inner), archive.read(info)))
+        elif _is_supported(name):
+            expanded.append((name, data))
+
+    seen = {}
+    unique = []
+    for name, data in expanded:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        if count:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}_{count + 1}{ext}"
+        unique.append((name, data))
+    return unique
+
+
+def output_name(name):
+    """xls 無法串流寫出，改輸出 xlsx"""
+    stem, ext = os.path.splitext(name)
+    return name if ext.lower() in ('.csv', '.xlsx') else f"{stem}.xlsx"
+
+
+@dataclass
+class FileSummary:
+    """單一檔案的處理結果"""
+    name: str
+    rows_total: int = 0
+    rows_selected: int = 0
+    updated: int = 0
+    unmatched_codes: list = field(default_factory=list)
+    seconds: float = 0.0
+    error: str = None
+
+    @property
+    def success_rate(self):
+        return self.updated / self.rows_selected * 100 if self.rows_selected else 0.0
+
+
+@dataclass
+class BatchResult:
+    """批次結果：各檔案摘要與打包好的 zip"""
+    summaries: list
+    archive: bytes = b""
+    codes: list = field(default_factory=list)
+    dates: list = field(default_factory=list)
+
+    @property
+    def failed(self):
+        return [summary for summary in self.summaries if summary.error]
+
+    def to_frame(self):
+        """各檔案摘要表（UI 顯示與 summary.csv 共用）"""
+        rows = []
+        for summary in self.summaries:
+            row = asdict(summary)
+            row["unmatched_codes"] = "、".join(summary.unmatched_codes)
+            row["success_rate"] = round(summary.success_rate, 1)
+            row["seconds"] = round(summary.seconds, 3)
+            rows.append(row)
+        columns = ["name", "rows_total", "rows_selected", "updated", "success_rate", "unmatched_codes", "seconds", "error"]
+        return pd.DataFrame(rows, columns=columns).rename(columns={
+            "name": "檔案", "rows_total": "總列數", "rows_selected": "選取列數", "updated": "已更新",
+            "success_rate": "成功率 (%)", "unmatched_codes": "未找到的代號", "seconds": "秒", "error": "錯誤",
+        })
+
+
+# --- 子程序工作（須為模組層級函式才能傳給 ProcessPoolExecutor） ---
+def _scan_file(name, data, only_today, today):
+    try:
+        return scan_workbook(BytesIO(data), name, only_today, today), None
+    except Exception as e:
+        return ScanResult(), f"{type(e).__name__}: {e}"
+
+
+def _update_file(name, data, values, only_today, today, by_date):
+    start = time.perf_counter()
+    output = BytesIO()
+    try:
+        result = stream_update(BytesIO(data), name, output, values, only_today, today, by_date=by_date,
+                               output_kind='csv' if name.lower().endswith('.csv') else 'xlsx')
+    except Exception as e:
+        return None, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return output.getvalue(), result, time.perf_counter() - start, None
+
+
+def _executor(workers):
+    # Streamlit 執行於多執行緒環境，fork 可能複製到被鎖住的鎖，一律以 spawn 啟動子程序
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class BatchUpdater:
+    """
+    多檔案批次更新
+
+    with BatchUpdater(files, only_today, today) as batch:
+        scans = batch.scan()
+        values = 取得行情(batch.codes, batch.dates)
+        result = batch.update(values, by_date)
+
+    掃描與更新共用同一個程序池；檔案數或 max_workers 為 1 時直接在目前程序執行。
+    """
+
+    def __init__(self, files, only_today, today, max_workers=None):
+        self.files = list(files)
+        self.only_today = only_today
+        self.today = today
+        self.max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(self.files) or 1))
+        self.summaries = [FileSummary(name=name) for name, _ in self.files]
+        self.codes = []
+        self.dates = []
+        self._pool = None
+
+    def __enter__(self):
+        if self.max_workers > 1:
+            self._pool = _executor(self.max_workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _map(self, func, *iterables):
+        if self._pool is None:
+            return [func(*args) for args in zip(*iterables)]
+        return list(self._pool.map(func, *iterables))
+
+    def scan(self):
+        """平行掃描所有檔案，收集代號與日期的聯集"""
+        n = len(self.files)
+        names = [name for name, _ in self.files]
+        datas = [data for _, data in self.files]
+        scans = self._map(_scan_file, names, datas, [self.only_today] * n, [self.today] * n)
+
+        codes, dates = set(), set()
+        for summary, (scan, error) in zip(self.summaries, scans):
+            summary.error = error
+            summary.rows_total = scan.rows_total
+            summary.rows_selected = scan.rows_selected
+            codes.update(scan.codes)
+            dates.update(scan.dates)
+        self.codes = sorted(codes)
+        self.dates = sorted(dates)
+        return [scan for scan, _ in scans]
+
+    def update(self, values, by_date=False):
+        """以同一份行情表平行更新所有可讀取的檔案並打包為 zip"""
+        # 沒有需要更新的列也照樣寫出，zip 內保有所有檔案
+        pending = [i for i, summary in enumerate(self.summaries) if not summary.error]
+        n = len(pending)
+        outputs = {}
+        if pending:
+            updates = self._map(
+                _update_file,
+                [self.files[i][0] for i in pending], [self.files[i][1] for i in pending],
+                [values] * n, [self.only_today] * n, [self.today] * n, [by_date] * n,
+            )
+            for i, (content, result, seconds, error) in zip(pending, updates):
+                summary = self.summaries[i]
+                summary.seconds = seconds
+                summary.error = error
+                if result is not None:
+                    summary.updated = result.updated
+                    summary.unmatched_codes = result.unmatched_codes
+                    outputs[i] = content
+
+        result = BatchResult(summaries=self.summaries, codes=self.codes, dates=self.dates)
+        result.archive = build_archive(
+            [(output_name(self.files[i][0]), outputs[i]) for i in sorted(outputs)], result.to_frame()
+        )
+        return result
+
+
+def build_archive(files, summary):
+    """打包更新後的檔案與 summary.csv；xlsx 本身已壓縮，以不壓縮方式存入"""
+    output = BytesIO()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for name, content in files:
+            compression = zipfile.ZIP_STORED if name.lower().endswith('.xlsx') else zipfile.ZIP_DEFLATED
+            archive.writestr(name, content, compress_type=compression)
+        archive.writestr("summary.csv", summary.to_csv(index=False).encode('utf-8-sig'),
+                         compress_type=zipfile.ZIP_DEFLATED)
+    return output.getvalue()
@@ -0,0 +1,244 @@
+"""
+效能基準：以合成的 STOCK_DAY_ALL 與上傳工作簿量測各熱點路徑（不需網路）
+
+量測項目為快照解析與排序、分頁 2 的更新流程（一次讀入與串流）、檔案匯出，
+以及對本地假工作表的 Google Sheets 同步。結果輸出為 JSON（耗時與峰值記憶體），
+並可與儲存的基準比較，超出容許範圍時回傳非 0 結束碼。
+"""
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from stock_core.excel_update import apply_values, normalize_columns, queryable_codes, select_rows
+from stock_core.export import available_formats, write_frame
+from stock_core.parser import clean_code, parse_stock_day_all, rank_by_trading_value
+from stock_core.sheets_sync import MemoryWorksheet, SheetSync
+from stock_core.snapshot import read_snapshot_csv
+from stock_core.workbook_io import stream_update
+
+# 儲存的基準檔
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "baseline.json")
+
+# 各項目的資料列數
+PROFILES = {
+    "quick": {
+        "parse": [1_000, 10_000],
+        "update": [1_000, 10_000],
+        "stream": [10_000],
+        "export": [1_000],
+        "sync": [1_000],
+    },
+    "full": {
+        "parse": [1_000, 10_000, 100_000],
+        "update": [1_000, 10_000, 100_000, 500_000],
+        "stream": [100_000, 500_000],
+        "export": [1_000, 10_000, 100_000],
+        "sync": [1_000, 10_000],
+    },
+}
+
+STOCK_DAY_ALL_HEADER = ["證券代號", "證券名稱", "成交股數", "成交金額", "開盤價", "最高價", "最低價", "收盤價", "漲跌價差", "成交筆數"]
+
+
+# --- 合成資料 ---
+def synthetic_codes(rows):
+    """4 位數普通股為主，另混入 ETF（00 開頭 5 碼）與 6 碼權證"""
+    codes = [f"{1101 + i:04d}" for i in range(min(rows, 8_000))]
+    codes += [f"00{600 + i:03d}" for i in range(min(max(rows - len(codes), 0), 300))]
+    codes += [f"{700000 + i:06d}" for i in range(max(rows - len(codes), 0))]
+    return codes
+
+
+def _with_commas(values):
+    return pd.Series(values).map("{:,}".format)
+
+
+def synthetic_stock_day_all(rows, seed=0, missing_ratio=0.03):
+    """產生 STOCK_DAY_ALL CSV 內容（bytes），含千分位逗號與停牌的 `--`"""
+    rng = np.random.default_rng(seed)
+    close = rng.uniform(5, 1_000, rows).round(2)
+    volume = rng.integers(1_000, 50_000_000, rows)
+    missing = rng.random(rows) < missing_ratio
+
+    close_text = pd.Series(close).map("{:,.2f}".format).mask(missing, "--")
+    frame = pd.DataFrame({
+        "證券代號": synthetic_codes(rows),
+        "證券名稱": [f"股票{i}" for i in range(rows)],
+        "成交股數": _with_commas(volume),
+        "成交金額": _with_commas((close * volume).astype("int64")),
+        "開盤價": close_text,
+        "最高價": close_text,
+        "最低價": close_text,
+        "收盤價": close_text,
+        "漲跌價差": "0.00",
+        "成交筆數": _with_commas(rng.integers(1, 100_000, rows)),
+    }, columns=STOCK_DAY_ALL_HEADER)
+    return frame.to_csv(index=False).encode("utf-8")
+
+
+def synthetic_workbook(rows, codes, today, seed=0, days=20):
+    """產生上傳工作簿（日期、股票代號、收盤價格、交易值指標），約 1/days 為今日資料"""
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(0, days, rows)
+    dates = [(today - timedelta(days=int(d))).strftime('%Y-%m-%d') for d in offsets]
+    picked = np.asarray(codes, dtype=object)[rng.integers(0, len(codes), rows)]
+    suffix = np.where(rng.random(rows) < 0.5, ".TW", "")
+    return pd.DataFrame({
+        "日期": dates,
+        "股票代號": picked + suffix,
+        "收盤價格": None,
+        "交易值指標": None,
+    })
+
+
+# --- 量測 ---
+def measure(func, repeat=3, memory=True):
+    """回傳 {seconds: 最佳耗時, peak_mb: 峰值記憶體}；每次執行前由 func 自行準備輸入"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    result = {"seconds": round(min(timings), 6)}
+    if memory:
+        # tracemalloc 會拖慢執行，另跑一次只量記憶體
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_mb"] = round(peak / 2 ** 20, 3)
+    return result
+
+
+def run_benchmarks(profile="quick", repeat=3, memory=True, seed=0, progress=None):
+    """執行指定規模的所有項目，回傳 {項目/列數: 結果}"""
+    sizes = PROFILES[profile]
+    today = date.today()
+    results = {}
+
+    def record(name, rows, func, times=repeat):
+        key = f"{name}/{rows}"
+        if progress:
+            progress(key)
+        results[key] = dict(measure(func, repeat=times, memory=memory), rows=rows)
+
+    for rows in sizes["parse"]:
+        content = synthetic_stock_day_all(rows, seed)
+
+        def parse():
+            parsed, _ = parse_stock_day_all(read_snapshot_csv(content), trade_date=today.strftime('%Y-%m-%d'))
+            rank_by_trading_value(parsed, limit=100)
+
+        record("parse", rows, parse)
+
+    # 行情表：與證交所 API 來源相同，為整份快照解析結果
+    feed_rows = 1_500
+    values, _ = parse_stock_day_all(
+        read_snapshot_csv(synthetic_stock_day_all(feed_rows, seed)),
+        trade_date=today.strftime('%Y-%m-%d'), code_pattern=None
+    )
+    codes = synthetic_codes(feed_rows)
+
+    for rows in sizes["update"]:
+        workbook = synthetic_workbook(rows, codes, today, seed)
+
+        def update():
+            df = workbook.copy()
+            normalize_columns(df)
+            target = select_rows(df, True, today.strftime('%Y-%m-%d'))
+            clean = clean_code(df.loc[target, '股票代號'])
+            queryable_codes(clean)
+            apply_values(df, target, values, clean_codes=clean)
+
+        record("update", rows, update)
+
+    for rows in sizes["stream"]:
+        content = synthetic_workbook(rows, codes, today, seed).to_csv(index=False).encode("utf-8")
+
+        def stream():
+            output = BytesIO()
+            stream_update(BytesIO(content), "upload.csv", output, values, True, today.strftime('%Y-%m-%d'))
+
+        record("stream", rows, stream, times=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes["export"]:
+            frame = synthetic_workbook(rows, codes, today, seed)
+            frame["收盤價格"] = 100.0
+            frame["交易值指標"] = 1.2345
+
+            for fmt in available_formats():
+                path = os.path.join(tmp, f"export.{fmt}")
+                record(f"export_{fmt}", rows, lambda: write_frame(frame, path, fmt), times=1 if fmt == "xlsx" else repeat)
+
+    for rows in sizes["sync"]:
+        parsed, _ = parse_stock_day_all(
+            read_snapshot_csv(synthetic_stock_day_all(rows, seed, missing_ratio=0)),
+            trade_date=today.strftime('%Y-%m-%d'), code_pattern=None
+        )
+        ranked = rank_by_trading_value(parsed, limit=rows)
+
+        def sync():
+            # 第一次全部新增，第二次應全部未變更
+            sync = SheetSync(MemoryWorksheet(), sleep=lambda seconds: None)
+            sync.upsert(ranked)
+            sync.upsert(ranked)
+
+        record("sync", rows, sync)
+
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_delta=0.005):
+    """
+    與基準比較，回傳 [(項目, 基準秒數, 目前秒數, 比值)] 中超出容許範圍者
+
+    耗時超過基準 (1 + tolerance) 倍且差距大於 min_delta 秒才視為退步，避免極短項目的雜訊。
+    """
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = current["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+        if ratio > 1 + tolerance and current["seconds"] - base["seconds"] > min_delta:
+            regressions.append((key, base["seconds"], current["seconds"], ratio))
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(path, profile, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        "created_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "profile": profile,
+        "environment": environment(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
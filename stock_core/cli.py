@@ -0,0 +1,368 @@
+"""命令列入口：供排程執行每日排行、匯出與 Google Sheets 同步，不需啟動 Streamlit"""
+import argparse
+import logging
+import os
+import sys
+
+from stock_core.config import (
+    DEFAULT_MARKETS,
+    INTRADAY_INTERVAL,
+    INTRADAY_QUOTE_URL,
+    LOG_FORMAT,
+    SCREENS_FILE,
+    SERVICE_ACCOUNT_FILE,
+    SHEET_NAME,
+)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m stock_core", description="台股交易值分析系統（命令列）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="輸出除錯訊息")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rank = commands.add_parser("rank", help="抓取上市、上櫃資料並計算交易值排行")
+    rank.add_argument("--market", action="append", choices=DEFAULT_MARKETS, dest="markets",
+                      help="只納入指定市場（twse 上市、tpex 上櫃），可重複指定；預設全部")
+    rank.add_argument("--top-n", type=int, default=100, help="取前 N 名（預設 100）")
+    rank.add_argument("-o", "--output", action="append", default=[],
+                      help="輸出檔案，依副檔名決定格式（.csv/.parquet/.feather/.xlsx），可重複指定")
+    rank.add_argument("--refresh", action="store_true", help="忽略快取重新下載")
+    rank.add_argument("--no-archive", action="store_true", help="不寫入本地歷史資料庫")
+    rank.add_argument("--no-store", action="store_true", help="不寫入本地排行結果資料庫")
+    rank.add_argument("--sync", action="store_true", help="同步至 Google Sheets（選用的鏡像）")
+    rank.add_argument("--sheet", default=SHEET_NAME, help=f"Google Sheets 名稱（預設 {SHEET_NAME}）")
+    rank.add_argument("--credentials", default=SERVICE_ACCOUNT_FILE, help="服務帳戶金鑰 JSON 檔")
+    rank.add_argument("--cprofile", action="store_true", help="以 cProfile 剖析各階段並輸出至 stderr")
+
+    liquidity = commands.add_parser("liquidity", help="依本地歷史資料庫計算多日流動性排行")
+    liquidity.add_argument("--window", type=int, default=20, help="滾動視窗天數（預設 20）")
+    liquidity.add_argument("--lookback", type=int, default=250, help="保留的交易日數（預設 250）")
+    liquidity.add_argument("--top-n", type=int, default=100, help="取前 N 名（預設 100）")
+    liquidity.add_argument("-o", "--output", action="append", default=[],
+                           help="輸出檔案，依副檔名決定格式（.csv/.parquet/.feather/.xlsx），可重複指定")
+
+    history = commands.add_parser("history", help="查詢本地排行結果資料庫")
+    query = history.add_mutually_exclusive_group()
+    query.add_argument("--code", help="個股歷史排行，例如 2330")
+    query.add_argument("--date", help="指定日期的前 N 名（YYYY-MM-DD）；未指定任何查詢時為最新交易日")
+    query.add_argument("--days-in-top", type=int, metavar="N", help="期間內各股進入前 N 名的天數")
+    query.add_argument("--import-sheets", action="store_true", help="將 Google Sheets 既有的歷史匯入本地資料庫")
+    history.add_argument("--start", help="起始日期（YYYY-MM-DD）")
+    history.add_argument("--end", help="結束日期（YYYY-MM-DD）")
+    history.add_argument("--top-n", type=int, default=20, help="前 N 名 / 顯示筆數（預設 20）")
+    history.add_argument("--sheet", default=SHEET_NAME, help=f"Google Sheets 名稱（預設 {SHEET_NAME}）")
+    history.add_argument("--credentials", default=SERVICE_ACCOUNT_FILE, help="服務帳戶金鑰 JSON 檔")
+    history.add_argument("-o", "--output", help="輸出檔案（依副檔名決定格式）")
+
+    screen = commands.add_parser("screen", help="以條件篩選最新交易日的全市場行情")
+    screen.add_argument("-r", "--rule", action="append", default=[],
+                        help="篩選條件，例如「交易值指標 >= 5」「收盤價格 between 50, 200」，可重複指定（全部符合）")
+    screen.add_argument("--name", action="append", default=[],
+                        help="執行儲存的篩選（可重複指定）；未指定條件與名稱時執行全部")
+    screen.add_argument("--file", default=SCREENS_FILE, help=f"儲存的篩選設定檔（預設 {SCREENS_FILE}）")
+    screen.add_argument("--save", metavar="NAME", help="將 --rule 指定的條件以此名稱存入設定檔")
+    screen.add_argument("--window", type=int, default=20,
+                        help="併入的多日流動性統計視窗天數（平均交易值、排名變化、量能倍數等；預設 20，0 為不併入）")
+    screen.add_argument("--top-n", type=int, default=50, help="每組篩選顯示前 N 檔（預設 50）")
+    screen.add_argument("-o", "--output", help="輸出符合的股票（依副檔名決定格式；多組篩選時加上「篩選」欄位）")
+
+    intraday = commands.add_parser("intraday", help="盤中輪詢即時報價，增量更新交易值前 N 名")
+    intraday.add_argument("--url", default=INTRADAY_QUOTE_URL or None,
+                          help="異動報價 JSON 端點（例如 http://127.0.0.1:8765/quotes）；未指定時使用證交所基本市況報導")
+    intraday.add_argument("--watch", type=int, default=300, help="使用證交所報價時追蹤前一交易日交易值前幾名（預設 300）")
+    intraday.add_argument("--interval", type=float, default=INTRADAY_INTERVAL, help=f"輪詢間隔秒數（預設 {INTRADAY_INTERVAL}）")
+    intraday.add_argument("--top-n", type=int, default=20, help="取前 N 名（預設 20）")
+    intraday.add_argument("--polls", type=int, help="輪詢次數，未指定時持續執行")
+
+    server = commands.add_parser("intraday-server", help="啟動本地模擬盤中行情伺服器（測試 intraday 用）")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+    server.add_argument("--step", type=float, default=1.0, help="每隔幾秒產生一批成交（預設 1）")
+    server.add_argument("--changes", type=int, default=50, help="每批異動的股票數（預設 50）")
+    server.add_argument("--rows", type=int, default=1800, help="本地歷史資料庫沒有資料時產生的股票數（預設 1800）")
+
+    prefetch = commands.add_parser("prefetch", help="常駐 worker：每日收盤後預先下載並計算排行")
+    prefetch.add_argument("--once", action="store_true", help="只執行一次（適合由 cron 排程呼叫）")
+
+    bench = commands.add_parser("bench", help="以合成資料量測解析、更新、匯出與同步的效能（不需網路）")
+    bench.add_argument("--profile", choices=["quick", "full"], default="quick",
+                       help="資料規模：quick 為數千至一萬列，full 為十萬至五十萬列")
+    bench.add_argument("--repeat", type=int, default=3, help="每項重複次數，取最佳耗時（預設 3）")
+    bench.add_argument("--no-memory", action="store_true", help="不量測峰值記憶體（較快）")
+    bench.add_argument("-o", "--output", help="結果 JSON 輸出路徑")
+    bench.add_argument("--baseline", help="比較用的基準 JSON（預設 benchmarks/baseline.json）")
+    bench.add_argument("--save-baseline", action="store_true", help="將本次結果存為基準")
+    bench.add_argument("--tolerance", type=float, default=0.25, help="容許的變慢比例（預設 0.25）")
+    return parser
+
+
+def cmd_rank(args):
+    from stock_core.diagnostics import Diagnostics
+    from stock_core.pipeline import authorize_gspread, export_frame, run_daily_ranking, sync_to_sheets
+
+    diagnostics = Diagnostics(profile=args.cprofile)
+    ranking = run_daily_ranking(
+        force_refresh=args.refresh, archive=not args.no_archive, markets=tuple(args.markets or DEFAULT_MARKETS),
+        diagnostics=diagnostics, save_results=not args.no_store
+    )
+    top = ranking.top(args.top_n)
+    for market, error in ranking.errors.items():
+        if ranking.sources.get(market) == "yfinance":
+            print(f"{market} 行情取得失敗，已改用 yfinance 備援（結果不保存）: {error}", file=sys.stderr)
+        else:
+            print(f"{market} 行情取得失敗，已略過: {error}", file=sys.stderr)
+    for market in ranking.unverified:
+        print(f"{market} 資料日期未確認，結果不保存", file=sys.stderr)
+    print(f"{ranking.trade_date} 交易值前 {len(top)} 名（共 {ranking.report.rows_out} 檔，來源 {ranking.source}）")
+
+    for path in args.output:
+        export_frame(top, path, diagnostics=diagnostics)
+        print(f"已輸出 {path}")
+
+    if not args.output and not args.sync:
+        print(top.to_string(index=False))
+
+    status = 0
+    if args.sync and not ranking.complete:
+        print("排行不完整（部分市場失敗、備援或日期未確認），略過 Google Sheets 同步", file=sys.stderr)
+    elif args.sync:
+        client = authorize_gspread(credentials_file=args.credentials)
+        if client is None:
+            print(f"找不到服務帳戶金鑰: {args.credentials}", file=sys.stderr)
+            status = 1
+        else:
+            result = sync_to_sheets(top, client, args.sheet, diagnostics=diagnostics)
+            print(f"Google Sheets：新增 {result.inserted} 筆、更新 {result.updated} 筆、未變更 {result.unchanged} 筆")
+
+    if args.cprofile:
+        print(diagnostics.profile_report(), file=sys.stderr)
+    # 排行不完整（市場失敗、備援或日期未確認）時以 2 結束，方便排程判斷
+    if status == 0 and not ranking.complete:
+        status = 2
+    return status
+
+
+def cmd_liquidity(args):
+    from stock_core.liquidity import get_liquidity_ranking
+    from stock_core.pipeline import export_frame
+
+    ranking, engine = get_liquidity_ranking(args.window, args.lookback)
+    if ranking.empty:
+        print("本地歷史資料庫沒有資料，請先執行 rank 或回補歷史行情", file=sys.stderr)
+        return 1
+    top = ranking.head(args.top_n)
+    print(f"{engine.dates[-1]} {args.window} 日平均交易值前 {len(top)} 名（共 {len(engine.dates)} 個交易日）")
+
+    for path in args.output:
+        export_frame(top, path)
+        print(f"已輸出 {path}")
+    if not args.output:
+        print(top.to_string(index=False))
+    return 0
+
+
+def cmd_history(args):
+    from stock_core.pipeline import authorize_gspread, export_frame
+    from stock_core.result_store import get_default_result_store, import_from_sheets
+
+    store = get_default_result_store()
+    if args.import_sheets:
+        client = authorize_gspread(credentials_file=args.credentials)
+        if client is None:
+            print(f"找不到服務帳戶金鑰: {args.credentials}", file=sys.stderr)
+            return 1
+        print(f"已從 Google Sheets 匯入 {import_from_sheets(client, args.sheet, store)} 筆至 {store.path}")
+        return 0
+
+    if args.code:
+        result = store.history(args.code, args.start, args.end)
+        title = f"{args.code} 歷史排行（{len(result)} 個交易日）"
+    elif args.days_in_top:
+        result = store.days_in_top(args.days_in_top, args.start, args.end)
+        title = f"進入前 {args.days_in_top} 名天數（{len(result)} 檔）"
+        result = result.head(args.top_n)
+    else:
+        trade_date = args.date or store.latest_date()
+        result = store.top(trade_date, args.top_n)
+        title = f"{trade_date} 交易值前 {len(result)} 名"
+    if result.empty:
+        print(f"本地排行結果資料庫沒有符合的資料（{store.path}）", file=sys.stderr)
+        return 1
+
+    print(title)
+    if args.output:
+        export_frame(result, args.output)
+        print(f"已輸出 {args.output}")
+    else:
+        print(result.to_string(index=False))
+    return 0
+
+
+def cmd_screen(args):
+    import pandas as pd
+
+    from stock_core.liquidity import get_liquidity_ranking
+    from stock_core.pipeline import export_frame
+    from stock_core.prefetch import get_daily_ranking
+    from stock_core.screening import build_universe, load_screens, run_screens, save_screen, screen_from_text
+
+    saved = load_screens(args.file)
+    screens = []
+    if args.rule:
+        screen = screen_from_text("\n".join(args.rule), name=args.save or "自訂篩選")
+        screens.append(screen)
+        if args.save:
+            save_screen(screen, args.file)
+            print(f"已儲存篩選「{args.save}」至 {args.file}")
+    if args.name:
+        by_name = {screen.name: screen for screen in saved}
+        missing = [name for name in args.name if name not in by_name]
+        if missing:
+            print(f"找不到儲存的篩選: {', '.join(missing)}", file=sys.stderr)
+            return 1
+        screens.extend(by_name[name] for name in args.name)
+    if not args.rule and not args.name:
+        screens = saved
+    if not screens:
+        print(f"沒有篩選條件：請以 --rule 指定，或在 {args.file} 儲存篩選", file=sys.stderr)
+        return 1
+
+    ranking = get_daily_ranking()
+    liquidity = get_liquidity_ranking(args.window)[0] if args.window else None
+    universe = build_universe(ranking.ranked, liquidity)
+    results = run_screens(screens, universe)
+
+    for name, matched in results.items():
+        print(f"[{name}] {ranking.trade_date} 符合 {len(matched)} 檔（共 {len(universe)} 檔）")
+        if not args.output and not matched.empty:
+            print(matched.head(args.top_n).to_string(index=False))
+
+    if args.output:
+        frames = [matched.assign(篩選=name) for name, matched in results.items()]
+        export_frame(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0], args.output)
+        print(f"已輸出 {args.output}")
+    return 0
+
+
+def cmd_intraday(args):
+    from stock_core.intraday import HttpQuoteSource, IntradayMonitor, MisQuoteSource
+
+    if args.url:
+        source = HttpQuoteSource(args.url)
+    else:
+        from stock_core.prefetch import get_daily_ranking
+        source = MisQuoteSource(get_daily_ranking().top(args.watch)["股票代號"].tolist())
+    monitor = IntradayMonitor(source, top_n=args.top_n, interval=args.interval)
+    print(f"盤中報價來源：{source.label}，每 {args.interval:g} 秒更新")
+
+    def show(delta):
+        stamp = delta.updated_at.strftime('%H:%M:%S')
+        print(f"[{stamp}] 異動 {delta.changed} 筆、新進榜 {len(delta.entered)}、跌出榜 {len(delta.exited)}、"
+              f"名次變化 {len(delta.moved)}（{delta.seconds * 1000:.2f} ms）")
+        if delta.has_changes or monitor.polls == 1:
+            print(monitor.ranking.frame().to_string(index=False))
+        if delta.exited:
+            print("跌出榜: " + "、".join(delta.exited))
+
+    try:
+        monitor.run(polls=args.polls, on_update=show)
+    except KeyboardInterrupt:
+        pass
+    return 0 if monitor.polls else 1
+
+
+def cmd_intraday_server(args):
+    from stock_core.archive import get_default_archive
+    from stock_core.benchmark import synthetic_codes
+    from stock_core.intraday import QuoteServer, SimulatedMarket
+
+    archive = get_default_archive()
+    dates = archive.dates()
+    if dates:
+        market = SimulatedMarket.from_frame(archive.load_day(dates[-1]), changes=args.changes)
+        print(f"以 {dates[-1]} 收盤行情為起點，共 {len(market.codes)} 檔")
+    else:
+        market = SimulatedMarket(synthetic_codes(args.rows), changes=args.changes)
+        print(f"本地歷史資料庫沒有資料，以 {args.rows} 檔合成股票模擬")
+
+    server = QuoteServer(market, args.host, args.port, step_interval=args.step)
+    print(f"模擬行情伺服器：http://{args.host}:{server.server_port}/quotes")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+def cmd_prefetch(args):
+    from stock_core.prefetch import PrefetchScheduler
+
+    scheduler = PrefetchScheduler()
+    if args.once:
+        warmed = scheduler.run_once()
+        print(f"已預先載入 {scheduler.warmed_date}" if warmed else "尚未取得完整的當日資料，未預先載入")
+        return 0 if warmed else 1
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_bench(args):
+    from stock_core import benchmark
+
+    results = benchmark.run_benchmarks(
+        args.profile, repeat=args.repeat, memory=not args.no_memory,
+        progress=lambda key: print(f"量測 {key} ...", file=sys.stderr)
+    )
+    for key, result in results.items():
+        peak = f"  峰值 {result['peak_mb']:.1f} MB" if "peak_mb" in result else ""
+        print(f"{key:<20} {result['seconds'] * 1000:>10.1f} ms{peak}")
+
+    if args.output:
+        benchmark.save_results(args.output, args.profile, results)
+        print(f"已輸出 {args.output}")
+
+    baseline_path = args.baseline or benchmark.BASELINE_FILE
+    if args.save_baseline:
+        benchmark.save_results(baseline_path, args.profile, results)
+        print(f"已更新基準 {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"找不到基準檔 {baseline_path}，略過比較", file=sys.stderr)
+        return 0
+
+    regressions = benchmark.compare(results, benchmark.load_results(baseline_path)["results"], args.tolerance)
+    for key, base, current, ratio in regressions:
+        print(f"效能退步 {key}: {base * 1000:.1f} ms → {current * 1000:.1f} ms（{ratio:.2f} 倍）", file=sys.stderr)
+    if regressions:
+        return 1
+    print(f"與基準比較：沒有超過 {args.tolerance:.0%} 的退步")
+    return 0
+
+
+COMMANDS = {
+    "rank": cmd_rank, "history": cmd_history, "liquidity": cmd_liquidity, "screen": cmd_screen,
+    "intraday": cmd_intraday, "intraday-server": cmd_intraday_server, "prefetch": cmd_prefetch, "bench": cmd_bench,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format=LOG_FORMAT
+    )
+    try:
+        return COMMANDS[args.command](args)
+    except Exception as e:
+        logging.getLogger("stock_core").error("執行失敗: %s", e, exc_info=args.verbose)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""共用設定：資料來源網址、快取目錄與台股交易時間"""
+import os
+from datetime import datetime, time, timedelta, timezone
+
+# 每日收盤行情：上市 (證交所) 與上櫃 (櫃買中心)，可用環境變數改指向本地測試伺服器
+STOCK_DAY_ALL_URL = os.environ.get(
+    "STOCK_TWSE_URL", 'https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_data'
+)
+TPEX_DAILY_CLOSE_URL = os.environ.get(
+    "STOCK_TPEX_URL", 'https://www.tpex.org.tw/openapi/v1/tpex_mainboard_daily_close_quotes'
+)
+
+# 指定日期的每日收盤行情（全部上市證券，不含權證）；歷史回補只有上市資料
+MI_INDEX_URL = 'https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX'
+
+# 盤中即時報價：證交所基本市況報導網站；設定 STOCK_INTRADAY_URL 時改用相容的 JSON 端點
+# （例如 `python -m stock_core intraday-server` 啟動的本地模擬行情）
+MIS_QUOTE_URL = os.environ.get("STOCK_MIS_URL", 'https://mis.twse.com.tw/stock/api/getStockInfo.jsp')
+INTRADAY_QUOTE_URL = os.environ.get("STOCK_INTRADAY_URL", "")
+
+# 盤中輪詢間隔（秒）
+INTRADAY_INTERVAL = 5
+
+# Google Sheets 歷史紀錄
+SHEET_NAME = "Stock_Predictions_History"
+SERVICE_ACCOUNT_FILE = "eco-precept-485904-j5-7ef3cdda1b03.json"
+GOOGLE_SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+# 預設合併排行的市場
+DEFAULT_MARKETS = ("twse", "tpex")
+
+# Streamlit 程序內是否啟動收盤後預先載入（另有獨立 worker 時可設為 0）
+PREFETCH_ENABLED = os.environ.get("STOCK_PREFETCH", "1") != "0"
+
+# 本地快取根目錄，可用環境變數 STOCK_CACHE_DIR 覆寫
+CACHE_DIR = os.environ.get("STOCK_CACHE_DIR", ".cache")
+
+# 每日排行結果資料庫（SQLite），可用環境變數 STOCK_RESULTS_DB 覆寫
+RESULTS_DB = os.environ.get("STOCK_RESULTS_DB", os.path.join(CACHE_DIR, "results.sqlite"))
+
+# 儲存的條件選股設定（JSON），可用環境變數 STOCK_SCREENS_FILE 覆寫
+SCREENS_FILE = os.environ.get("STOCK_SCREENS_FILE", "screens.json")
+
+# 日誌格式（CLI 與 Streamlit 共用）
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+# 台灣時區（無日光節約時間）
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# 收盤時間與證交所開放資料通常完成更新的時間
+MARKET_CLOSE = time(13, 30)
+PUBLISH_TIME = time(14, 30)
+
+# 平日此時間之後開放資料仍停在前一交易日時，視為休市日（國定假日），不再輪詢到下次更新時間
+HOLIDAY_CUTOFF = time(17, 0)
+
+
+def now_taipei():
+    """目前的台北時間"""
+    return datetime.now(TAIPEI_TZ)
+
+
+def previous_weekday(day):
+    """前一個週一至週五的日期"""
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def expected_trading_date(now=None):
+    """依目前時間推算開放資料應對應的交易日（未考慮國定假日）"""
+    now = now or now_taipei()
+    today = now.date()
+    if today.weekday() < 5 and now.time() >= PUBLISH_TIME:
+        return today
+    return previous_weekday(today)
+
+
+def next_publish_time(after):
+    """`after` 之後下一次開放資料更新的時間"""
+    day = after.date()
+    candidate = datetime.combine(day, PUBLISH_TIME, tzinfo=TAIPEI_TZ)
+    while candidate <= after or candidate.weekday() >= 5:
+        day += timedelta(days=1)
+        candidate = datetime.combine(day, PUBLISH_TIME, tzinfo=TAIPEI_TZ)
+    return candidate
@@ -0,0 +1,132 @@
+"""
+各處理階段的效能紀錄：耗時、傳輸量、輸入 / 輸出列數與剔除原因
+
+每個階段結束時輸出一行 key=value 格式的日誌（logger 名稱 stock_core.diagnostics），
+供監控系統擷取；可選擇以 cProfile 剖析各階段。
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 標準階段名稱
+STAGES = ("fetch", "parse", "rank", "store", "update", "export", "sync")
+
+
+@dataclass
+class StageRecord:
+    """單一階段的紀錄；extra 為各階段自訂的欄位（例如資料來源、同步筆數）"""
+    name: str
+    seconds: float = 0.0
+    bytes: int = 0
+    rows_in: int = None
+    rows_out: int = None
+    dropped: dict = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+    error: str = None
+
+    def log_fields(self):
+        fields = {"stage": self.name, "seconds": f"{self.seconds:.4f}", "bytes": self.bytes}
+        if self.rows_in is not None:
+            fields["rows_in"] = self.rows_in
+        if self.rows_out is not None:
+            fields["rows_out"] = self.rows_out
+        if self.dropped:
+            fields["dropped"] = sum(self.dropped.values())
+        fields.update(self.extra)
+        if self.error:
+            fields["error"] = self.error
+        return fields
+
+
+def _format_value(value):
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return json.dumps(text, ensure_ascii=False) if any(c in text for c in ' ="') else text
+
+
+class Diagnostics:
+    """
+    一次執行（一次點擊或一次命令列呼叫）的各階段紀錄
+
+    以 `with diagnostics.stage("parse") as record:` 包住階段，並在區塊內填入
+    record.rows_in 等欄位；profile 為 True 時同時以 cProfile 剖析。
+    """
+
+    def __init__(self, profile=False):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.started_at = datetime.now()
+        self.stages = []
+        self.profiler = cProfile.Profile() if profile else None
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name, **extra):
+        record = StageRecord(name=name, extra=dict(extra))
+        profiling = self.profiler is not None and self._depth == 0
+        self._depth += 1
+        if profiling:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            if profiling:
+                self.profiler.disable()
+            self._depth -= 1
+            self.stages.append(record)
+            self._log(record)
+
+    def _log(self, record):
+        fields = {"run_id": self.run_id, **record.log_fields()}
+        logger.info(" ".join(f"{key}={_format_value(value)}" for key, value in fields.items()))
+
+    def extend(self, records):
+        """加入其他執行（例如快取中的排行計算）的紀錄"""
+        self.stages.extend(records)
+        return self
+
+    @property
+    def total_seconds(self):
+        return sum(record.seconds for record in self.stages)
+
+    def to_frame(self):
+        """各階段紀錄表，供 UI 顯示"""
+        rows = []
+        for record in self.stages:
+            row = asdict(record)
+            row["seconds"] = round(record.seconds, 4)
+            row["dropped"] = "、".join(f"{k} {v}" for k, v in record.dropped.items() if v) or ""
+            row["extra"] = ", ".join(f"{k}={v}" for k, v in record.extra.items())
+            rows.append(row)
+        columns = ["name", "seconds", "bytes", "rows_in", "rows_out", "dropped", "extra", "error"]
+        frame = pd.DataFrame(rows, columns=columns).astype({"rows_in": "Int64", "rows_out": "Int64"})
+        return frame.rename(columns={
+            "name": "階段", "seconds": "秒", "bytes": "位元組", "rows_in": "輸入列數",
+            "rows_out": "輸出列數", "dropped": "剔除", "extra": "其他", "error": "錯誤",
+        })
+
+    def profile_report(self, limit=30, sort="cumulative"):
+        """cProfile 結果（依累計時間排序的前 limit 個函式），未啟用時回傳 None"""
+        if self.profiler is None:
+            return None
+        output = io.StringIO()
+        try:
+            pstats.Stats(self.profiler, stream=output).sort_stats(sort).print_stats(limit)
+        except TypeError:
+            # 尚未剖析任何階段
+            return ""
+        return output.getvalue()
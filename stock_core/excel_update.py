@@ -0,0 +1,117 @@
+"""Excel 更新工具的向量化合併：一次清理代號、一次查表寫回收盤價格與交易值指標"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from stock_core.parser import clean_code
+from stock_core.schema import DISPLAY_DECIMALS
+
+# 行情表欄位：代號（無後綴）、收盤價格、交易值指標，依日期更新時另含「日期」
+VALUE_COLUMNS = ["代號", "收盤價格", "交易值指標"]
+
+# 原工具接受的代號：數字（可含小數點），例如 2330、0050
+QUERYABLE_CODE_PATTERN = r"[\d.]+"
+
+
+# 上傳檔案的標準欄位：A 日期、B 股票代號、C 收盤價格、D 交易值指標
+TEMPLATE_COLUMNS = ['日期', '股票代號', '收盤價格', '交易值指標']
+
+
+def normalize_column_names(columns):
+    """沒有「日期」標題時，依位置將前四欄命名為標準欄位"""
+    columns = list(columns)
+    if '日期' in columns:
+        return columns
+    col_names = TEMPLATE_COLUMNS if len(columns) >= 4 else ['日期', '股票代號'] + columns[2:]
+    return col_names[:len(columns)] + columns[len(col_names):]
+
+
+def normalize_columns(df):
+    """重新命名欄位並補上缺少的 收盤價格 / 交易值指標 欄（原地修改）"""
+    df.columns = normalize_column_names(df.columns)
+    if '收盤價格' not in df.columns:
+        df['收盤價格'] = None
+    if '交易值指標' not in df.columns:
+        df['交易值指標'] = None
+    return df
+
+
+def select_rows(df, only_today, today):
+    """回傳要更新的列索引：僅今日時只取日期等於 today 的列"""
+    if not only_today:
+        return df.index
+    row_dates = pd.to_datetime(df['日期'], errors='coerce')
+    return df.index[(row_dates.dt.strftime('%Y-%m-%d') == today).to_numpy()]
+
+
+@dataclass
+class UpdateResult:
+    """合併統計"""
+    rows_total: int = 0
+    updated: int = 0
+    unmatched_codes: list = field(default_factory=list)
+
+    @property
+    def success_rate(self):
+        return self.updated / self.rows_total * 100 if self.rows_total else 0.0
+
+    def merge(self, other):
+        """累加另一批次的統計（串流模式逐塊合併時使用）"""
+        self.rows_total += other.rows_total
+        self.updated += other.updated
+        self.unmatched_codes = sorted(set(self.unmatched_codes) | set(other.unmatched_codes))
+        return self
+
+
+def queryable_codes(clean_codes):
+    """由已清理的代號欄取出需查詢的不重複代號"""
+    unique = pd.Series(clean_codes.dropna().unique(), dtype="string")
+    return unique[unique.str.fullmatch(QUERYABLE_CODE_PATTERN)].tolist()
+
+
+def apply_values(df, rows, values, clean_codes=None, by_date=False):
+    """
+    將行情表合併回 df 的指定列（原地更新 收盤價格、交易值指標）
+
+    rows 為要更新的列索引；clean_codes 可傳入已清理好的代號欄以免重複計算；
+    by_date 為 True 時以 (日期, 代號) 對應，否則只以代號對應。
+    """
+    target_index = pd.Index(rows)
+    if clean_codes is None:
+        clean_codes = clean_code(df.loc[target_index, '股票代號'])
+    else:
+        clean_codes = clean_codes.loc[target_index]
+    result = UpdateResult(rows_total=len(target_index))
+    if result.rows_total == 0:
+        return result
+
+    code_values = clean_codes.astype(object).to_numpy()
+    key_columns = ['日期', '代號'] if by_date else ['代號']
+    lookup = values.astype({column: str for column in key_columns})
+    lookup = lookup.drop_duplicates(subset=key_columns, keep='last').set_index(key_columns)
+    if by_date:
+        row_dates = pd.to_datetime(df.loc[target_index, '日期'], errors='coerce').dt.strftime('%Y-%m-%d').astype(object)
+        keys = pd.MultiIndex.from_arrays([row_dates.to_numpy(), code_values])
+    else:
+        keys = pd.Index(code_values)
+
+    if lookup.empty:
+        positions = np.full(len(keys), -1)
+    else:
+        positions = lookup.index.get_indexer(keys)
+    matched = positions >= 0
+
+    matched_index = target_index[matched]
+    for column in ('收盤價格', '交易值指標'):
+        # 數值欄統一為 float64；其他型別（全空或混有文字）改為 object 以保留原內容
+        if pd.api.types.is_numeric_dtype(df[column]) or df[column].isna().all():
+            df[column] = df[column].astype("float64")
+        else:
+            df[column] = df[column].astype(object)
+        column_values = lookup[column].astype("float64").round(DISPLAY_DECIMALS[column]).to_numpy()
+        df.loc[matched_index, column] = column_values[positions[matched]]
+
+    result.updated = int(matched.sum())
+    result.unmatched_codes = sorted(clean_codes[~matched].dropna().astype(str).unique())
+    return result
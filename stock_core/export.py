@@ -0,0 +1,97 @@
+"""
+資料表匯出：XLSX、CSV、Parquet 與 Arrow IPC (Feather)
+
+輸出直接寫入目標路徑或二進位檔案物件，不經過中間字串；XLSX 有安裝 xlsxwriter 時
+以常數記憶體模式逐列寫出，否則使用 openpyxl 唯寫模式。Parquet / Feather 需要 pyarrow，
+可由 notebook 以 pd.read_parquet / pd.read_feather 直接載入。
+"""
+import importlib.util
+import os
+from dataclasses import dataclass
+from io import BytesIO
+
+from stock_core.workbook_io import ChunkWriter
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    key: str
+    ext: str
+    label: str
+    mime: str
+
+
+FORMATS = {
+    "xlsx": ExportFormat("xlsx", ".xlsx", "Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ExportFormat("csv", ".csv", "CSV", "text/csv"),
+    "parquet": ExportFormat("parquet", ".parquet", "Parquet", "application/vnd.apache.parquet"),
+    "feather": ExportFormat("feather", ".feather", "Arrow IPC (Feather)", "application/vnd.apache.arrow.file"),
+}
+
+# 副檔名對應的格式（.arrow 與 .feather 同為 Arrow IPC 檔案格式）
+EXTENSIONS = {fmt.ext: key for key, fmt in FORMATS.items()}
+EXTENSIONS[".arrow"] = "feather"
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def xlsx_engine():
+    """XLSX 寫出引擎：優先 xlsxwriter（常數記憶體），其次 openpyxl，都沒有時回傳 None"""
+    if _installed("xlsxwriter"):
+        return "xlsxwriter"
+    if _installed("openpyxl"):
+        return "openpyxl"
+    return None
+
+
+def available_formats():
+    """目前環境可輸出的格式（依 FORMATS 順序）"""
+    formats = []
+    for key in FORMATS:
+        if key == "xlsx" and xlsx_engine() is None:
+            continue
+        if key in ("parquet", "feather") and not _installed("pyarrow"):
+            continue
+        formats.append(key)
+    return formats
+
+
+def format_for_path(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXTENSIONS:
+        raise ValueError(f"不支援的輸出格式: {ext}（可用 {'、'.join(EXTENSIONS)}）")
+    return EXTENSIONS[ext]
+
+
+def write_frame(df, target, fmt):
+    """將 df 以 fmt 格式寫入 target（路徑或二進位檔案物件）"""
+    if fmt == "csv":
+        # 直接以 utf-8-sig 編碼寫入，不先產生整份字串
+        df.to_csv(target, index=False, encoding='utf-8-sig')
+    elif fmt == "parquet":
+        df.to_parquet(target, index=False)
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(target)
+    elif fmt == "xlsx":
+        writer = ChunkWriter(target, 'xlsx')
+        try:
+            writer.write(df)
+        finally:
+            writer.close()
+    else:
+        raise ValueError(f"不支援的輸出格式: {fmt}")
+    return target
+
+
+def export_bytes(df, fmt):
+    """
+    輸出為 bytes，可直接交給 st.download_button（或作為延遲下載的 callable）
+
+    資料只寫入一個 BytesIO；緩衝區沒有其他參照（未呼叫 getbuffer）時，getvalue() 直接交出
+    內部記憶體而不複製。st.download_button 不接受 memoryview，因此不回傳 getbuffer()。
+    """
+    output = BytesIO()
+    write_frame(df, output, fmt)
+    return output.getvalue()
@@ -0,0 +1,160 @@
+"""共用 HTTP 連線：保持連線的連線池、壓縮傳輸、指數退避重試與依主機區分的斷路器"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 視為暫時性錯誤而重試的 HTTP 狀態碼
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "Mozilla/5.0 (Smart-stock-selection)",
+}
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，暫停對該主機發出請求"""
+
+
+class CircuitBreaker:
+    """
+    連續失敗達 failure_threshold 次即開啟，期間直接拒絕請求
+
+    開啟 reset_timeout 秒後進入半開狀態，只放行一個試探請求：
+    成功即恢復，失敗則重新開啟。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._probing = False
+
+
+class HttpClient:
+    """
+    供各資料來源共用的 GET 用戶端
+
+    連線錯誤、逾時與 429/5xx 以指數退避加抖動重試（優先採用 Retry-After），
+    其餘狀態碼（含 304）原樣回傳由呼叫端處理。與 requests.get 介面相容。
+    """
+
+    def __init__(self, session=None, retries=3, base_delay=1.0, max_delay=30.0,
+                 failure_threshold=5, reset_timeout=60.0, pool_size=16, sleep=time.sleep):
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(DEFAULT_HEADERS)
+        self.session = session
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sleep = sleep
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        """該網址主機的斷路器"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+        return min(self.base_delay * (2 ** attempt), self.max_delay) + random.uniform(0, self.base_delay)
+
+    def get(self, url, **kwargs):
+        breaker = self.breaker(url)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"{urlsplit(url).netloc} 連續失敗，暫停請求 {self.reset_timeout:.0f} 秒")
+
+            response = None
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.RequestException:
+                # 其他請求錯誤不重試，但仍計入失敗，半開狀態的試探也隨之結束
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    breaker.record_success()
+                    return response
+                error = Exception(f"HTTP 狀態碼: {response.status_code}")
+
+            breaker.record_failure()
+            if attempt == self.retries:
+                # 最後一次仍為 5xx 時回傳回應，由呼叫端依狀態碼處理
+                if response is not None:
+                    return response
+                raise error
+            logger.info("請求失敗，第 %d 次重試 url=%s error=%s", attempt + 1, url, error)
+            self.sleep(self._delay(attempt, response))
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_default_client():
+    """程序內共用的 HTTP 用戶端（共用連線池與斷路器狀態）"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,342 @@
+"""
+盤中即時排行：輪詢報價來源，只將有異動的報價套用到記憶體中的排序索引
+
+排序索引為依交易值由大到小排列的串列，每筆異動以二分搜尋移除舊位置、插入新位置，
+更新成本取決於異動筆數而非全市場檔數；每次更新與前一次的前 N 名比較，
+標記新進榜、跌出榜與名次變化。
+
+報價來源可替換：MisQuoteSource 為證交所基本市況報導網站，HttpQuoteSource 為
+以序號取得異動報價的 JSON 端點（SimulatedMarket / QuoteServer 為本地模擬行情伺服器）。
+"""
+import json
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from stock_core.config import INTRADAY_INTERVAL, MIS_QUOTE_URL
+from stock_core.http_client import get_default_client
+
+logger = logging.getLogger(__name__)
+
+# 報價表欄位：代號、股票名稱、最新價、累計成交股數
+QUOTE_COLUMNS = ["代號", "股票名稱", "最新價", "累計成交股數"]
+
+
+def quotes_frame(records):
+    """由 [{code, name, price, volume}] 建立報價表"""
+    frame = pd.DataFrame.from_records(records, columns=["code", "name", "price", "volume"])
+    frame.columns = QUOTE_COLUMNS
+    return frame.astype({"代號": str, "股票名稱": str, "最新價": "float64", "累計成交股數": "float64"})
+
+
+# --- 報價來源 ---
+class HttpQuoteSource:
+    """
+    以序號取得異動報價的 JSON 端點
+
+    GET {url}?since=序號 回傳 {"seq": 目前序號, "quotes": [{code, name, price, volume}]}，
+    只包含 since 之後有異動的報價；since=0 時為全部。
+    """
+
+    def __init__(self, url, session=None, timeout=10):
+        self.url = url
+        self.session = session or get_default_client()
+        self.timeout = timeout
+        self.seq = 0
+
+    @property
+    def label(self):
+        return f"JSON 端點 {self.url}"
+
+    def fetch(self):
+        response = self.session.get(self.url, params={"since": self.seq}, timeout=self.timeout)
+        response.raise_for_status()
+        payload = response.json()
+        if payload["seq"] < self.seq:
+            # 伺服器重新啟動，序號歸零：重新取得全部報價
+            self.seq = 0
+            return self.fetch()
+        self.seq = payload["seq"]
+        return quotes_frame(payload["quotes"])
+
+
+def _mis_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MisQuoteSource:
+    """
+    證交所基本市況報導網站 (MIS) 即時報價
+
+    每次輪詢查詢 codes 的最新成交價（z）與累計成交量（v，單位為張），每批最多
+    batch_size 檔；尚無成交（z 為 "-"）的股票略過。codes 的 .TWO 後綴視為上櫃。
+    """
+
+    def __init__(self, codes, session=None, batch_size=50, timeout=10):
+        self.channels = [
+            f"otc_{code[:-4]}.tw" if code.endswith(".TWO") else f"tse_{code.split('.')[0]}.tw" for code in codes
+        ]
+        self.session = session or get_default_client()
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    @property
+    def label(self):
+        return f"證交所基本市況報導（{len(self.channels)} 檔）"
+
+    def fetch(self):
+        records = []
+        for start in range(0, len(self.channels), self.batch_size):
+            channels = "|".join(self.channels[start:start + self.batch_size])
+            response = self.session.get(
+                MIS_QUOTE_URL, params={"ex_ch": channels, "json": 1, "delay": 0}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            for item in response.json().get("msgArray", []):
+                price, lots = _mis_number(item.get("z")), _mis_number(item.get("v"))
+                if price is None or lots is None:
+                    continue
+                records.append({"code": item.get("c"), "name": item.get("n", ""), "price": price, "volume": lots * 1000})
+        return quotes_frame(records)
+
+
+# --- 排序索引 ---
+@dataclass
+class RankingDelta:
+    """一次更新的結果：異動報價數與前 N 名的變化（moved 為 {代號: 名次上升數}）"""
+    changed: int = 0
+    entered: list = field(default_factory=list)
+    exited: list = field(default_factory=list)
+    moved: dict = field(default_factory=dict)
+    seconds: float = 0.0
+    updated_at: datetime = None
+
+    @property
+    def has_changes(self):
+        return bool(self.entered or self.exited or self.moved)
+
+
+class IntradayRanking:
+    """
+    盤中前 N 名的增量排序
+
+    _quotes 為 {代號: (名稱, 最新價, 累計成交股數, 交易值)}，_order 為依 (-交易值, 代號)
+    排序的串列；apply 只處理與目前報價不同的筆數。
+    """
+
+    def __init__(self, top_n=100):
+        self.top_n = top_n
+        self._quotes = {}
+        self._order = []
+        self._top = []
+        self.last_delta = RankingDelta()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def apply(self, quotes):
+        """套用報價表（QUOTE_COLUMNS），回傳前 N 名的變化"""
+        start = time.perf_counter()
+        with self._lock:
+            changed = 0
+            for code, name, price, volume in quotes[QUOTE_COLUMNS].itertuples(index=False, name=None):
+                if not (math.isfinite(price) and math.isfinite(volume)):
+                    continue
+                old = self._quotes.get(code)
+                if old is not None:
+                    if old[1] == price and old[2] == volume:
+                        continue
+                    del self._order[bisect_left(self._order, (-old[3], code))]
+                value = round(price * volume / 1e8, 4)
+                insort(self._order, (-value, code))
+                self._quotes[code] = (name, price, volume, value)
+                changed += 1
+
+            previous = {code: rank for rank, code in enumerate(self._top)}
+            top = [code for _, code in self._order[:self.top_n]]
+            delta = RankingDelta(changed=changed, updated_at=datetime.now())
+            for rank, code in enumerate(top):
+                if code not in previous:
+                    delta.entered.append(code)
+                elif previous[code] != rank:
+                    delta.moved[code] = previous[code] - rank
+            current = set(top)
+            delta.exited = [code for code in self._top if code not in current]
+            self._top = top
+            delta.seconds = time.perf_counter() - start
+            self.last_delta = delta
+            return delta
+
+    def _rows(self, codes):
+        return [(code, *self._quotes[code]) for code in codes]
+
+    def frame(self):
+        """目前前 N 名，「變動」欄標記新進榜（🆕）與名次升降（▲ / ▼）"""
+        with self._lock:
+            rows = self._rows(self._top)
+            delta = self.last_delta
+        frame = pd.DataFrame(rows, columns=["代號", "股票名稱", "最新價", "累計成交股數", "交易值指標"])
+        frame.insert(0, "排名", np.arange(1, len(frame) + 1))
+        entered = set(delta.entered)
+
+        def marker(code):
+            if code in entered:
+                return "🆕"
+            change = delta.moved.get(code, 0)
+            return f"▲{change}" if change > 0 else f"▼{-change}" if change < 0 else ""
+
+        frame["變動"] = frame["代號"].map(marker)
+        return frame.astype({"累計成交股數": "int64"})
+
+    def exited_frame(self):
+        """最近一次更新跌出前 N 名的股票"""
+        with self._lock:
+            rows = self._rows(self.last_delta.exited)
+        frame = pd.DataFrame(rows, columns=["代號", "股票名稱", "最新價", "累計成交股數", "交易值指標"])
+        return frame.astype({"累計成交股數": "int64"})
+
+
+class IntradayMonitor:
+    """將報價來源與排序索引組合；poll 一次取得異動並更新排行"""
+
+    def __init__(self, source, top_n=100, interval=INTRADAY_INTERVAL):
+        self.source = source
+        self.ranking = IntradayRanking(top_n)
+        self.interval = interval
+        self.polls = 0
+        self.last_error = None
+        self.last_poll = None
+
+    def poll(self):
+        start = time.perf_counter()
+        self.last_poll = datetime.now()
+        try:
+            quotes = self.source.fetch()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning("盤中報價取得失敗: %s", e)
+            return None
+        self.last_error = None
+        self.polls += 1
+        delta = self.ranking.apply(quotes)
+        logger.debug(
+            "盤中更新 quotes=%d changed=%d entered=%d exited=%d moved=%d seconds=%.4f",
+            len(quotes), delta.changed, len(delta.entered), len(delta.exited), len(delta.moved),
+            time.perf_counter() - start
+        )
+        return delta
+
+    def run(self, polls=None, on_update=None):
+        """依 interval 持續輪詢（polls 為次數上限），每次更新後呼叫 on_update(delta)"""
+        count = 0
+        while polls is None or count < polls:
+            delta = self.poll()
+            if on_update and delta is not None:
+                on_update(delta)
+            count += 1
+            if polls is None or count < polls:
+                time.sleep(self.interval)
+
+
+# --- 本地模擬行情 ---
+class SimulatedMarket:
+    """
+    模擬盤中行情：每次 step 隨機選 changes 檔股票成交，價格小幅變動、累計成交量增加
+
+    seq 為每次異動的序號，quotes_since 只回傳序號大於 since 的報價，與 HttpQuoteSource 搭配。
+    """
+
+    def __init__(self, codes, names=None, prices=None, changes=50, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.codes = np.asarray(codes, dtype=object)
+        self.names = np.asarray(names if names is not None else codes, dtype=object)
+        n = len(self.codes)
+        self.prices = np.asarray(prices, dtype="float64") if prices is not None else self.rng.uniform(10, 1000, n).round(2)
+        self.volumes = self.rng.integers(1, 500, n).astype("float64") * 1000
+        self.updated = np.ones(n, dtype="int64")
+        self.changes = changes
+        self.seq = 1
+        self._lock = threading.Lock()
+
+    def step(self):
+        with self._lock:
+            self.seq += 1
+            picked = self.rng.choice(len(self.codes), size=min(self.changes, len(self.codes)), replace=False)
+            moves = 1 + self.rng.normal(0, 0.004, len(picked))
+            self.prices[picked] = np.maximum((self.prices[picked] * moves).round(2), 0.01)
+            self.volumes[picked] += self.rng.integers(1, 200, len(picked)) * 1000
+            self.updated[picked] = self.seq
+
+    def quotes_since(self, since=0):
+        with self._lock:
+            rows = np.flatnonzero(self.updated > since)
+            quotes = [
+                {"code": self.codes[i], "name": self.names[i], "price": self.prices[i], "volume": self.volumes[i]}
+                for i in rows
+            ]
+            return {"seq": self.seq, "time": datetime.now().isoformat(timespec="seconds"), "quotes": quotes}
+
+    @classmethod
+    def from_frame(cls, frame, changes=50, seed=0):
+        """以單日行情表（代號、股票名稱、收盤價格）為起點"""
+        frame = frame.dropna(subset=["收盤價格"])
+        return cls(frame["代號"].astype(str), frame["股票名稱"].astype(str), frame["收盤價格"], changes, seed)
+
+
+class _QuoteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path != "/quotes":
+            self.send_error(404)
+            return
+        try:
+            since = int(parse_qs(parts.query).get("since", ["0"])[0])
+        except ValueError:
+            self.send_error(400, "since must be an integer")
+            return
+        body = json.dumps(self.server.market.quotes_since(since), ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("quote server %s", format % args)
+
+
+class QuoteServer(ThreadingHTTPServer):
+    """
+    模擬行情伺服器（GET /quotes?since=序號），背景執行緒每 step_interval 秒 step 一次
+
+    以 serve_forever() 執行、shutdown() 停止（同時停止模擬）。
+    """
+    daemon_threads = True
+
+    def __init__(self, market, host="127.0.0.1", port=8765, step_interval=1.0):
+        super().__init__((host, port), _QuoteHandler)
+        self.market = market
+        self._stop = threading.Event()
+        self._ticker = threading.Thread(target=self._tick, args=(step_interval,), name="quote-simulator", daemon=True)
+        self._ticker.start()
+
+    def _tick(self, step_interval):
+        while not self._stop.wait(step_interval):
+            self.market.step()
+
+    def shutdown(self):
+        self._stop.set()
+        super().shutdown()
@@ -0,0 +1,247 @@
+"""
+多日流動性排行：以歷史資料庫的股票 × 日期面板計算滾動統計
+
+單日交易值容易被一次爆量影響，這裡改以 N 日平均 / 中位數交易值排名，並提供
+排名變化、量能倍數與全市場百分位。新交易日只附加一欄並增量更新視窗總和，
+不需重算整個回溯期間。
+"""
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from stock_core.archive import get_default_archive
+
+# 排行輸出欄位
+LIQUIDITY_COLUMNS = [
+    "日期", "代號", "股票名稱", "交易值指標", "平均交易值", "中位數交易值",
+    "排名", "前日排名", "排名變化", "量能倍數", "百分位",
+]
+
+
+def _finite(matrix):
+    return np.isfinite(matrix)
+
+
+def _window_sum(matrix, end, window):
+    """各列在 [end - window, end) 欄的有效值總和與個數"""
+    block = matrix[:, max(end - window, 0):end]
+    finite = _finite(block)
+    return np.where(finite, block, 0).sum(axis=1, dtype="float64"), finite.sum(axis=1)
+
+
+def _mean(total, count, min_periods):
+    """有效值不足 min_periods 者為 NaN"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count >= max(min_periods, 1), total / np.maximum(count, 1), np.nan)
+
+
+def _rank_desc(values):
+    """由大到小排名（1 為最大，並列取最小名次），NaN 不排名"""
+    return pd.Series(values).rank(ascending=False, method="min").to_numpy()
+
+
+class LiquidityEngine:
+    """
+    股票 × 日期的滾動流動性統計
+
+    value / volume 為 (股票數, 日期數) 的二維陣列，最多保留 lookback 個交易日；
+    _sum / _count 為最近 window 日交易值的總和與有效天數，新增一天時以
+    加入新欄、扣除離開視窗的欄增量更新（前一日的值保留為 _prev_sum / _prev_count）。
+    歷史天數少於 min_periods 時以現有天數為門檻。
+    """
+
+    def __init__(self, window=20, lookback=250, min_periods=None):
+        if window > lookback:
+            raise ValueError("window 不可大於 lookback")
+        self.window = window
+        self.lookback = lookback
+        self.min_periods = min_periods or max(1, window // 2)
+        self.codes = np.array([], dtype=object)
+        self.names = {}
+        self.dates = []
+        self.value = np.empty((0, 0), dtype="float32")
+        self.volume = np.empty((0, 0), dtype="float64")
+        self._row = {}
+        self._sum = np.empty(0)
+        self._count = np.empty(0, dtype="int64")
+        self._prev_sum = np.empty(0)
+        self._prev_count = np.empty(0, dtype="int64")
+        self._lock = threading.Lock()
+
+    # --- 建立與更新 ---
+    @classmethod
+    def from_history(cls, history, window=20, lookback=250, min_periods=None):
+        """由長表（日期、代號、股票名稱、交易值指標、成交股數）一次建立"""
+        engine = cls(window, lookback, min_periods)
+        if history.empty:
+            return engine
+        history = history.astype({"日期": str, "代號": str})
+        dates = sorted(history["日期"].unique())[-lookback:]
+        history = history[history["日期"].isin(dates)]
+
+        value = history.pivot(index="代號", columns="日期", values="交易值指標").reindex(columns=dates)
+        volume = history.pivot(index="代號", columns="日期", values="成交股數").reindex(index=value.index, columns=dates)
+        engine.codes = value.index.to_numpy(dtype=object)
+        engine._row = {code: i for i, code in enumerate(engine.codes)}
+        engine.dates = list(dates)
+        engine.value = value.to_numpy(dtype="float32")
+        engine.volume = volume.to_numpy(dtype="float64")
+        engine.names = dict(zip(history["代號"], history["股票名稱"].astype(str)))
+
+        end = len(dates)
+        engine._sum, engine._count = _window_sum(engine.value, end, window)
+        engine._prev_sum, engine._prev_count = _window_sum(engine.value, end - 1, window)
+        return engine
+
+    @classmethod
+    def from_archive(cls, archive=None, end=None, window=20, lookback=250, min_periods=None):
+        """讀取歷史資料庫最近 lookback 個交易日建立"""
+        archive = archive or get_default_archive()
+        dates = archive.dates(end=end)[-lookback:]
+        if not dates:
+            return cls(window, lookback, min_periods)
+        history = archive.query_long(start=dates[0], end=dates[-1], fields=["股票名稱", "交易值指標", "成交股數"])
+        return cls.from_history(history, window, lookback, min_periods)
+
+    def _grow(self, codes):
+        """加入新出現的股票（例如新上市），新列以 NaN 補齊"""
+        new = [code for code in codes if code not in self._row]
+        if not new:
+            return
+        for i, code in enumerate(new, start=len(self.codes)):
+            self._row[code] = i
+        self.codes = np.concatenate([self.codes, np.array(new, dtype=object)])
+        pad = np.full((len(new), self.value.shape[1]), np.nan)
+        self.value = np.vstack([self.value, pad.astype("float32")])
+        self.volume = np.vstack([self.volume, pad])
+        self._sum = np.concatenate([self._sum, np.zeros(len(new))])
+        self._count = np.concatenate([self._count, np.zeros(len(new), dtype="int64")])
+        self._prev_sum = np.concatenate([self._prev_sum, np.zeros(len(new))])
+        self._prev_count = np.concatenate([self._prev_count, np.zeros(len(new), dtype="int64")])
+
+    def update(self, trade_date, day):
+        """
+        加入新交易日（day 為單日行情表：代號、股票名稱、交易值指標、成交股數）
+
+        只附加一欄、以新欄與離開視窗的欄更新總和，不重算整個回溯期間。
+        已存在或較舊的日期會被略過，回傳是否有更新。
+        """
+        with self._lock:
+            if self.dates and trade_date <= self.dates[-1]:
+                return False
+            codes = day["代號"].astype(str).to_numpy()
+            self._grow(codes)
+            self.names.update(zip(codes, day["股票名稱"].astype(str)))
+
+            rows = np.fromiter((self._row[code] for code in codes), dtype="int64", count=len(codes))
+            value = np.full(len(self.codes), np.nan, dtype="float32")
+            volume = np.full(len(self.codes), np.nan)
+            value[rows] = day["交易值指標"].to_numpy(dtype="float32")
+            volume[rows] = day["成交股數"].to_numpy(dtype="float64")
+
+            # 目前的視窗總和成為「前日」基準
+            self._prev_sum = self._sum.copy()
+            self._prev_count = self._count.copy()
+
+            width = self.value.shape[1]
+            if width >= self.window:
+                leaving = self.value[:, width - self.window]
+                self._sum -= np.where(_finite(leaving), leaving, 0)
+                self._count -= _finite(leaving)
+            self._sum += np.where(_finite(value), value, 0)
+            self._count += _finite(value)
+
+            keep = self.lookback - 1
+            self.value = np.column_stack([self.value[:, -keep:] if keep else self.value[:, :0], value])
+            self.volume = np.column_stack([self.volume[:, -keep:] if keep else self.volume[:, :0], volume])
+            self.dates = (self.dates + [trade_date])[-self.lookback:]
+            return True
+
+    def refresh(self, archive=None):
+        """將歷史資料庫中較新的交易日逐日增量加入，回傳加入的日期"""
+        archive = archive or get_default_archive()
+        start = self.dates[-1] if self.dates else None
+        added = []
+        for trade_date in archive.dates(start=start):
+            day = archive.load_day(trade_date)
+            if day is not None and self.update(trade_date, day):
+                added.append(trade_date)
+        return added
+
+    def missing_dates(self, archive=None):
+        """
+        歷史資料庫中落在已載入期間、卻未載入的交易日（事後回補的較舊日期）
+
+        refresh 只附加較新的日期，有缺漏時需重新建立。
+        """
+        if not self.dates:
+            return []
+        archive = archive or get_default_archive()
+        loaded = set(self.dates)
+        return [d for d in archive.dates(end=self.dates[-1])[-self.lookback:] if d not in loaded]
+
+    # --- 統計 ---
+    def stats(self):
+        """最新交易日的各股統計（LIQUIDITY_COLUMNS），依平均交易值排名"""
+        with self._lock:
+            if not self.dates:
+                return pd.DataFrame(columns=LIQUIDITY_COLUMNS)
+            end = self.value.shape[1]
+            window = self.value[:, max(end - self.window, 0):end]
+            with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+                # 視窗內全為 NaN（停牌）的股票 nanmedian 會發出警告，結果仍為 NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                min_periods = min(self.min_periods, end)
+                prior_periods = min(self.min_periods, end - 1)
+                mean = _mean(self._sum, self._count, min_periods)
+                median = np.where(np.isfinite(mean), np.nanmedian(window, axis=1).astype("float64"), np.nan)
+                prev_mean = _mean(self._prev_sum, self._prev_count, prior_periods) if end > 1 else np.full(len(mean), np.nan)
+                # 量能倍數：當日成交股數 ÷ 前 window 日平均成交股數
+                prior_volume = _mean(*_window_sum(self.volume, end - 1, self.window), prior_periods)
+                surge = self.volume[:, -1] / prior_volume
+
+            rank = _rank_desc(mean)
+            prev_rank = _rank_desc(prev_mean)
+            percentile = pd.Series(mean).rank(pct=True).to_numpy() * 100
+
+            frame = pd.DataFrame({
+                "日期": self.dates[-1],
+                "代號": self.codes,
+                "股票名稱": [self.names.get(code, code) for code in self.codes],
+                "交易值指標": self.value[:, -1].astype("float64"),
+                "平均交易值": mean,
+                "中位數交易值": median,
+                "排名": rank,
+                "前日排名": prev_rank,
+                "排名變化": prev_rank - rank,
+                "量能倍數": surge,
+                "百分位": percentile,
+            })
+
+        frame = frame[frame["排名"].notna()].sort_values("排名", kind="stable")
+        frame = frame.astype({"排名": "int64", "前日排名": "Int64", "排名變化": "Int64"})
+        decimals = {"交易值指標": 4, "平均交易值": 4, "中位數交易值": 4, "量能倍數": 2, "百分位": 1}
+        return frame.round(decimals).reset_index(drop=True)
+
+    def top(self, n=100):
+        return self.stats().head(n)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_liquidity_ranking(window=20, lookback=250):
+    """
+    程序內共用、依 (window, lookback) 快取的引擎：第一次由歷史資料庫建立，
+    之後每次呼叫只增量加入新的交易日（回補了較舊的日期時重新建立），回傳 (排行 DataFrame, 引擎)
+    """
+    with _engines_lock:
+        engine = _engines.get((window, lookback))
+        if engine is None or engine.missing_dates():
+            engine = LiquidityEngine.from_archive(window=window, lookback=lookback)
+            _engines[(window, lookback)] = engine
+    engine.refresh()
+    return engine.stats(), engine
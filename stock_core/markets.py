@@ -0,0 +1,147 @@
+"""多市場每日收盤行情：上市 (證交所) 與上櫃 (櫃買中心) 並行抓取，解析為同一格式後合併"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from stock_core.config import DEFAULT_MARKETS, STOCK_DAY_ALL_URL, TPEX_DAILY_CLOSE_URL, now_taipei
+from stock_core.parser import LISTED_CODE_PATTERN, ParseReport, parse_stock_day_all
+from stock_core.schema import compact
+from stock_core.snapshot import SnapshotStore, get_default_store, read_snapshot_csv, read_snapshot_json, roc_data_date
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Market:
+    """行情來源：代碼、名稱、提供者、網址、代號後綴與回應格式"""
+    key: str
+    label: str
+    provider: str
+    url: str
+    suffix: str
+    reader: object = read_snapshot_csv
+    ext: str = ".csv"
+    data_date: object = roc_data_date
+
+
+MARKETS = {
+    "twse": Market("twse", "上市", "證交所", STOCK_DAY_ALL_URL, ".TW"),
+    # 原始 JSON 與快取資訊同目錄，副檔名需與 {日期}.json 區隔
+    "tpex": Market("tpex", "上櫃", "櫃買中心", TPEX_DAILY_CLOSE_URL, ".TWO",
+                   reader=read_snapshot_json, ext=".raw.json"),
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_market_store(key):
+    """程序內共用的各市場快照存放區（上市沿用 get_default_store）"""
+    if key == "twse":
+        return get_default_store()
+    with _stores_lock:
+        if key not in _stores:
+            market = MARKETS[key]
+            _stores[key] = SnapshotStore(
+                url=market.url, name=key, reader=market.reader, ext=market.ext, data_date=market.data_date
+            )
+        return _stores[key]
+
+
+def market_versions(markets=DEFAULT_MARKETS):
+    """各市場目前快照的版本（見 SnapshotStore.version），不連線"""
+    return tuple((key, get_market_store(key).version()) for key in markets)
+
+
+@dataclass
+class MarketFetch:
+    """各市場快照與失敗原因（皆以市場代碼為鍵）"""
+    snapshots: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def trade_date(self):
+        return max(snapshot.trade_date for snapshot in self.snapshots.values())
+
+    @property
+    def sources(self):
+        return {key: snapshot.source for key, snapshot in self.snapshots.items()}
+
+    @property
+    def unverified(self):
+        """無法確認資料日期的市場"""
+        return [key for key, snapshot in self.snapshots.items() if not snapshot.verified]
+
+
+class MarketFetchError(Exception):
+    """所有市場皆取得失敗；result 為各市場的失敗原因（MarketFetch）"""
+
+    def __init__(self, result):
+        super().__init__("；".join(f"{MARKETS[key].label}: {error}" for key, error in result.errors.items()))
+        self.result = result
+
+
+def fetch_markets(markets=DEFAULT_MARKETS, stores=None, force_refresh=False, now=None):
+    """
+    並行取得各市場的最新快照，總耗時約為最慢的單一來源
+
+    stores 可依市場代碼替換存放區（例如指向本地測試伺服器）；
+    部分市場失敗時記錄於 errors，全部失敗才拋出 MarketFetchError。
+    資料日期早於其他市場的快照（該市場尚未更新）不納入合併，同樣記錄於 errors，
+    呼叫端因此不會快取或保存混合日期的排行。
+    """
+    stores = stores or {}
+    now = now or now_taipei()
+    result = MarketFetch()
+
+    with ThreadPoolExecutor(max_workers=len(markets)) as pool:
+        futures = {
+            key: pool.submit((stores.get(key) or get_market_store(key)).get, force_refresh=force_refresh, now=now)
+            for key in markets
+        }
+
+    first_error = None
+    for key, future in futures.items():
+        try:
+            result.snapshots[key] = future.result()
+        except Exception as e:
+            logger.warning("%s 行情取得失敗: %s", MARKETS[key].label, e)
+            result.errors[key] = str(e)
+            first_error = first_error or e
+
+    if not result.snapshots:
+        raise MarketFetchError(result) from first_error
+    newest = result.trade_date
+    for key, snapshot in list(result.snapshots.items()):
+        if snapshot.trade_date < newest:
+            logger.warning("%s 資料日期 %s 早於 %s，不納入合併", MARKETS[key].label, snapshot.trade_date, newest)
+            result.errors[key] = f"資料日期 {snapshot.trade_date} 早於 {newest}（尚未更新）"
+            del result.snapshots[key]
+    return result
+
+
+def parse_markets(snapshots, listed_only=True):
+    """
+    解析並合併各市場快照，回傳 (DataFrame, ParseReport)
+
+    股票代號依市場加上 .TW / .TWO 後綴；listed_only 時只保留 4 位數普通股。
+    各市場的資料日期必須相同，否則拋出 ValueError。
+    """
+    dates = {key: snapshot.trade_date for key, snapshot in snapshots.items()}
+    if len(set(dates.values())) > 1:
+        raise ValueError(f"各市場資料日期不一致: {dates}")
+    frames = []
+    report = ParseReport()
+    for key, snapshot in snapshots.items():
+        parsed, part = parse_stock_day_all(
+            snapshot.data,
+            trade_date=snapshot.trade_date,
+            code_pattern=LISTED_CODE_PATTERN if listed_only else None,
+            suffix=MARKETS[key].suffix
+        )
+        frames.append(parsed)
+        report.merge(part)
+    return compact(pd.concat(frames, ignore_index=True)), report
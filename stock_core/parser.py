@@ -0,0 +1,116 @@
+"""證交所 STOCK_DAY_ALL 快照的向量化解析與排序引擎"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+from stock_core.schema import STOCK_DAY_ALL_SCHEMA, compact, resolve_columns, to_display
+
+# 排行輸出欄位（與 Google Sheets / Excel 匯出一致）
+RANK_COLUMNS = ["日期", "股票代號", "股票名稱", "收盤價格", "成交股數", "交易值指標"]
+
+# 上市普通股代號：4 位數字
+LISTED_CODE_PATTERN = r"^\d{4}$"
+
+DROP_INVALID_CODE = "代號格式不符"
+DROP_MISSING_PRICE = "缺少收盤價"
+DROP_MISSING_VOLUME = "缺少成交股數"
+DROP_NON_POSITIVE = "價格或成交量為零"
+
+
+@dataclass
+class ParseReport:
+    """解析統計：輸入列數、輸出列數與各原因的剔除數量"""
+    rows_in: int = 0
+    rows_out: int = 0
+    dropped: dict = field(default_factory=dict)
+
+    @property
+    def total_dropped(self):
+        return sum(self.dropped.values())
+
+    def summary(self):
+        """以文字列出剔除原因，供 UI 顯示"""
+        parts = [f"{reason} {count} 筆" for reason, count in self.dropped.items() if count]
+        return "、".join(parts) if parts else "無"
+
+    def merge(self, other):
+        """累加另一份解析統計（合併多個市場時使用）"""
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        for reason, count in other.dropped.items():
+            self.dropped[reason] = self.dropped.get(reason, 0) + count
+        return self
+
+
+def clean_numeric(series):
+    """整欄去除千分位逗號與 `--`，轉為浮點數（無法轉換者為 NaN）"""
+    text = series.astype("string").str.strip().str.replace(",", "", regex=False)
+    text = text.mask(text.isin(["", "--", "---", "----"]))
+    return pd.to_numeric(text, errors="coerce").astype("float64")
+
+
+def clean_code(series):
+    """整欄清理股票代號：去除空白與 .TW / .TWO 後綴"""
+    return (
+        series.astype("string")
+        .str.strip()
+        .str.replace(r"\.(?:TWO|TW)$", "", case=False, regex=True)
+    )
+
+
+def parse_stock_day_all(data, trade_date=None, code_pattern=LISTED_CODE_PATTERN, suffix=".TW",
+                        schema=STOCK_DAY_ALL_SCHEMA):
+    """
+    將 STOCK_DAY_ALL 原始資料整欄解析為交易值表
+
+    欄位依標題名稱對應（見 stock_core.schema），回傳 (DataFrame, ParseReport)。
+    DataFrame 含 `代號`（無後綴）及 RANK_COLUMNS，並使用 MARKET_DTYPES 的精簡型別；
+    code_pattern 為 None 時不限制代號格式（例如 ETF）。
+    """
+    report = ParseReport(rows_in=len(data))
+    if trade_date is None:
+        trade_date = datetime.now().strftime('%Y-%m-%d')
+
+    columns = resolve_columns(data, schema)
+    codes = data[columns["代號"]].astype("string").str.strip()
+    names = data[columns["股票名稱"]].astype("string").str.strip()
+    volume = clean_numeric(data[columns["成交股數"]])
+    close = clean_numeric(data[columns["收盤價格"]])
+
+    # 依序套用剔除條件，每列只記入第一個不符合的原因
+    keep = pd.Series(True, index=data.index)
+    checks = [
+        (DROP_INVALID_CODE, codes.str.fullmatch(code_pattern).fillna(False) if code_pattern else codes.notna()),
+        (DROP_MISSING_PRICE, close.notna()),
+        (DROP_MISSING_VOLUME, volume.notna()),
+        (DROP_NON_POSITIVE, (close > 0) & (volume > 0)),
+    ]
+    for reason, ok in checks:
+        ok = ok.astype(bool)
+        report.dropped[reason] = int((keep & ~ok).sum())
+        keep &= ok
+
+    close = close[keep]
+    volume = volume[keep]
+    codes = codes[keep]
+
+    result = compact(pd.DataFrame({
+        "代號": codes,
+        "日期": trade_date,
+        "股票代號": codes + suffix,
+        "股票名稱": names[keep],
+        "收盤價格": close.round(2),
+        "成交股數": volume,
+        "交易值指標": (close * volume / 1e8).round(4),
+    }).reset_index(drop=True))
+
+    report.rows_out = len(result)
+    return result, report
+
+
+def rank_by_trading_value(parsed, limit=100):
+    """依交易值指標由大到小排序並取前 limit 名（轉為輸出用型別）"""
+    ranked = parsed.sort_values(by="交易值指標", ascending=False, kind="stable")
+    return to_display(ranked.head(limit)[RANK_COLUMNS])
+
@@ -0,0 +1,307 @@
+"""
+抓取 → 排序 → 匯出 / 同步 的無介面流程
+
+供 Streamlit 介面與排程 (cron) 共用；gspread、google-auth 等較重的套件只在實際使用時才載入。
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from stock_core.archive import archive_snapshot, get_default_archive
+from stock_core.config import DEFAULT_MARKETS, GOOGLE_SCOPES, SERVICE_ACCOUNT_FILE, SHEET_NAME, now_taipei
+from stock_core.diagnostics import Diagnostics
+from stock_core.export import format_for_path, write_frame
+from stock_core.markets import MARKETS, MarketFetchError, fetch_markets, get_market_store, parse_markets
+from stock_core.parser import LISTED_CODE_PATTERN, ParseReport, parse_stock_day_all, rank_by_trading_value
+from stock_core.result_store import get_default_result_store
+from stock_core.schema import compact
+from stock_core.yf_fetcher import get_default_fetcher, ohlcv_to_values
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DailyRanking:
+    """
+    單日排行結果；sources、errors 以市場代碼為鍵，unverified 為無法確認資料日期的市場，
+    diagnostics 為各階段紀錄
+    """
+    ranked: object
+    report: object
+    trade_date: str
+    source: str
+    sources: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    diagnostics: object = None
+    unverified: list = field(default_factory=list)
+
+    @property
+    def complete(self):
+        """所有市場皆取得成功、資料日期皆已確認且非 yfinance 備援；只有完整的排行才會保存或快取"""
+        return not (self.errors or self.unverified or self.ranked.empty or "yfinance" in self.sources.values())
+
+    def top(self, n):
+        return self.ranked.head(n)
+
+
+def parse_snapshot(snapshot, listed_only=True):
+    """解析快照；listed_only 時只保留 4 位數上市股票"""
+    return parse_stock_day_all(
+        snapshot.data,
+        trade_date=snapshot.trade_date,
+        code_pattern=LISTED_CODE_PATTERN if listed_only else None
+    )
+
+
+def save_to_archive(snapshot):
+    """存入本地歷史資料庫；資料日期未確認時略過，失敗（例如缺少 pyarrow）只記錄警告，回傳錯誤訊息或 None"""
+    if not snapshot.verified:
+        return "無法確認資料日期"
+    try:
+        archive_snapshot(snapshot)
+    except Exception as e:
+        logger.warning("略過歷史資料庫寫入: %s", e)
+        return str(e)
+    return None
+
+
+def save_results_to_store(ranking):
+    """將完整的排行（DailyRanking）寫入本地排行結果資料庫；不完整時略過，失敗只記錄警告，回傳寫入筆數"""
+    if not ranking.complete:
+        logger.info("排行不完整，略過排行結果資料庫寫入 trade_date=%s", ranking.trade_date)
+        return 0
+    try:
+        return get_default_result_store().save(ranking.ranked)
+    except Exception as e:
+        logger.warning("略過排行結果資料庫寫入: %s", e)
+        return 0
+
+
+def _needs_store(ranking):
+    """有市場重新下載，或該日期尚未寫入排行結果資料庫時才需要寫入（休市日重複輪詢不重寫）"""
+    if any(source == "network" for source in ranking.sources.values()):
+        return True
+    try:
+        return not get_default_result_store().has_date(ranking.trade_date)
+    except Exception as e:
+        logger.warning("無法讀取排行結果資料庫: %s", e)
+        return False
+
+
+def yfinance_fallback(codes, names=None, suffix=".TW", fetcher=None):
+    """
+    行情 API 無法使用時，以 yfinance 取得指定代號最近一筆行情
+
+    回傳 (DataFrame, FetchReport)，DataFrame 含 `代號` 及 RANK_COLUMNS；
+    names 為 {代號: 股票名稱}，缺少時以代號代替。
+    """
+    tickers = {f"{code}{suffix}": code for code in codes}
+    start = pd.Timestamp(now_taipei().date()) - pd.Timedelta(days=10)
+    frames, report = (fetcher or get_default_fetcher()).fetch(list(tickers), start)
+    values = ohlcv_to_values(frames, suffix_map=tickers)
+    values["股票代號"] = values["代號"] + suffix
+    values["股票名稱"] = values["代號"].map(names or {}).fillna(values["代號"])
+    return compact(values), report
+
+
+def _fallback_universe(key, store=None):
+    """備援查詢的代號與名稱：該市場最近一日的本地快照，上市另可取自歷史資料庫；都沒有時回傳空 dict"""
+    market = MARKETS[key]
+    try:
+        snapshot = (store or get_market_store(key)).latest()
+    except Exception as e:
+        logger.warning("無法讀取%s本地快照: %s", market.label, e)
+        snapshot = None
+    if snapshot is not None:
+        parsed, _ = parse_stock_day_all(
+            snapshot.data, trade_date=snapshot.trade_date, code_pattern=LISTED_CODE_PATTERN, suffix=market.suffix
+        )
+        return dict(zip(parsed["代號"].astype(str), parsed["股票名稱"].astype(str)))
+    if key != "twse":
+        return {}
+    try:
+        archive = get_default_archive()
+        dates = archive.dates()
+        latest = archive.load_day(dates[-1]) if dates else None
+    except Exception as e:
+        logger.warning("無法讀取歷史資料庫: %s", e)
+        latest = None
+    if latest is None or latest.empty:
+        return {}
+    latest = latest[latest["代號"].astype(str).str.fullmatch(LISTED_CODE_PATTERN)]
+    return dict(zip(latest["代號"].astype(str), latest["股票名稱"].astype(str)))
+
+
+def _fallback_market(key, diagnostics, store=None, fetcher=None):
+    """單一市場行情取得失敗時，以 yfinance 查詢該市場的代號；回傳 (DataFrame, ParseReport)，無法備援時為 (None, None)"""
+    market = MARKETS[key]
+    names = _fallback_universe(key, store)
+    if not names:
+        logger.warning("%s沒有可供備援查詢的代號清單，略過 yfinance 備援", market.label)
+        return None, None
+    with diagnostics.stage("fetch", source=f"{key}:yfinance") as record:
+        try:
+            parsed, report = yfinance_fallback(list(names), names, suffix=market.suffix, fetcher=fetcher)
+        except Exception as e:
+            logger.warning("%s yfinance 備援失敗: %s", market.label, e)
+            return None, None
+        record.rows_in = len(names)
+        record.rows_out = len(parsed)
+        record.extra["batches"] = report.batches
+    logger.warning(
+        "%s行情 API 無法使用，改用 yfinance rows=%d failures=%d", market.label, len(parsed), len(report.failures)
+    )
+    return parsed, ParseReport(rows_in=len(names), rows_out=len(parsed))
+
+
+def run_daily_ranking(store=None, force_refresh=False, archive=True, markets=DEFAULT_MARKETS, stores=None,
+                      fallback=True, diagnostics=None, save_results=True, fetcher=None):
+    """
+    並行取得各市場最新快照，合併後一次計算完整排行
+
+    store 為上市快照存放區（相容舊介面），stores 可依市場代碼替換存放區。
+    無法連線時先退回同一交易日的本地快照；仍失敗（或資料日期落後）的市場各自改以 yfinance
+    查詢該市場最近一日快照中的代號，再與其他市場合併（fallback 為 False 時不備援）。
+    所有市場皆無資料時拋出 MarketFetchError。備援的市場仍記錄於 errors，排行不視為完整。
+    歷史資料庫只收錄上市資料，與證交所每日收盤行情回補一致。
+    save_results 為 True 且排行完整（DailyRanking.complete）時，整批寫入本地排行結果資料庫。
+    各階段（fetch、parse、rank、store）記錄於 diagnostics；fetcher 為備援使用的 YFinanceFetcher。
+    """
+    diagnostics = diagnostics or Diagnostics()
+    stores = dict(stores or {})
+    if store is not None:
+        stores.setdefault("twse", store)
+    try:
+        with diagnostics.stage("fetch") as record:
+            fetched = fetch_markets(markets, stores, force_refresh=force_refresh)
+            # 只有實際下載的快照才計入傳輸量
+            record.bytes = sum(s.nbytes for s in fetched.snapshots.values() if s.source == "network")
+            record.rows_out = sum(len(s.data) for s in fetched.snapshots.values())
+            record.extra["source"] = ",".join(f"{key}:{src}" for key, src in fetched.sources.items())
+    except MarketFetchError as e:
+        if not fallback:
+            raise
+        error, fetched = e, e.result
+    else:
+        error = None
+    if archive and "twse" in fetched.snapshots:
+        with diagnostics.stage("archive"):
+            save_to_archive(fetched.snapshots["twse"])
+
+    with diagnostics.stage("parse") as record:
+        if fetched.snapshots:
+            parsed, report = parse_markets(fetched.snapshots)
+        else:
+            parsed, report = None, ParseReport()
+        record.rows_in = report.rows_in
+        record.rows_out = report.rows_out
+        record.dropped = dict(report.dropped)
+
+    sources = dict(fetched.sources)
+    trade_date = fetched.trade_date if fetched.snapshots else None
+    if fallback and fetched.errors:
+        backups = {}
+        for key in fetched.errors:
+            backup, backup_report = _fallback_market(key, diagnostics, stores.get(key), fetcher)
+            if backup is not None and not backup.empty:
+                backups[key] = (backup, backup_report)
+        if trade_date is None and backups:
+            trade_date = max(backup["日期"].astype(str).max() for backup, _ in backups.values())
+        frames = [] if parsed is None else [parsed]
+        for key, (backup, backup_report) in backups.items():
+            # 只合併與其他市場同一交易日的資料（停牌股票的最近一筆可能是更早的日期）
+            backup = backup[backup["日期"].astype(str) == trade_date]
+            if backup.empty:
+                continue
+            frames.append(backup)
+            report.merge(backup_report)
+            sources[key] = "yfinance"
+        if frames:
+            parsed = compact(pd.concat(frames, ignore_index=True))
+    if parsed is None:
+        raise error
+
+    with diagnostics.stage("rank") as record:
+        ranked = rank_by_trading_value(parsed, limit=len(parsed))
+        record.rows_in = len(parsed)
+        record.rows_out = len(ranked)
+    source = ",".join(f"{key}:{src}" for key, src in sources.items())
+    ranking = DailyRanking(
+        ranked=ranked, report=report, trade_date=trade_date, source=source,
+        sources=sources, errors=fetched.errors, diagnostics=diagnostics, unverified=fetched.unverified
+    )
+    if save_results and ranking.complete and _needs_store(ranking):
+        # 部分市場失敗或資料日期未確認時不寫入，避免以不完整的排行取代同一日期的資料
+        with diagnostics.stage("store") as record:
+            record.rows_in = len(ranked)
+            record.rows_out = save_results_to_store(ranking)
+    logger.info(
+        "排行完成 trade_date=%s source=%s rows_in=%d rows_out=%d",
+        trade_date, source, report.rows_in, report.rows_out
+    )
+    return ranking
+
+
+def export_frame(df, path, diagnostics=None):
+    """依副檔名輸出 CSV、Parquet、Feather (Arrow IPC) 或 XLSX"""
+    fmt = format_for_path(path)
+    with (diagnostics or Diagnostics()).stage("export", format=fmt) as record:
+        write_frame(df, path, fmt)
+        record.rows_in = record.rows_out = len(df)
+        record.bytes = os.path.getsize(path)
+    logger.info("已輸出 %d 筆至 %s", len(df), path)
+    return path
+
+
+def authorize_gspread(credentials_info=None, credentials_file=None):
+    """以服務帳戶授權 gspread；沒有可用憑證時回傳 None"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    if credentials_info:
+        creds = Credentials.from_service_account_info(credentials_info, scopes=GOOGLE_SCOPES)
+        return gspread.authorize(creds)
+
+    credentials_file = credentials_file or SERVICE_ACCOUNT_FILE
+    if os.path.exists(credentials_file):
+        creds = Credentials.from_service_account_file(credentials_file, scopes=GOOGLE_SCOPES)
+        return gspread.authorize(creds)
+    return None
+
+
+_sheet_syncs = {}
+_sheet_syncs_lock = threading.Lock()
+
+
+def get_sheet_sync(client, sheet_name=SHEET_NAME):
+    """程序內共用的 SheetSync（依 client 與工作表名稱），索引只在第一次同步時建立"""
+    from stock_core.sheets_sync import GspreadBackend, SheetSync
+
+    key = (id(client), sheet_name)
+    with _sheet_syncs_lock:
+        entry = _sheet_syncs.get(key)
+        # 保留 client 參照，避免 id 被其他物件重複使用
+        if entry is None or entry[0] is not client:
+            worksheet = client.open(sheet_name).get_worksheet(0)
+            entry = _sheet_syncs[key] = (client, SheetSync(GspreadBackend(worksheet)))
+        return entry[1]
+
+
+def sync_to_sheets(df, client, sheet_name=SHEET_NAME, diagnostics=None):
+    """將排行 upsert 至 Google Sheets 第一個工作表"""
+    with (diagnostics or Diagnostics()).stage("sync") as record:
+        sync = get_sheet_sync(client, sheet_name)
+        result = sync.upsert(df)
+        record.rows_in = len(df)
+        record.rows_out = result.inserted + result.updated
+        record.extra.update(
+            inserted=result.inserted, updated=result.updated, unchanged=result.unchanged, requests=result.requests
+        )
+    logger.info(
+        "Google Sheets 同步完成 inserted=%d updated=%d unchanged=%d",
+        result.inserted, result.updated, result.unchanged
+    )
+    return result
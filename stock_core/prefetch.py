@@ -0,0 +1,232 @@
+"""
+收盤後預先載入：背景輪詢直到取得當日資料，解析、排行並存檔一次
+
+互動請求透過 get_daily_ranking 直接取用已完成的排行；同一時間只有一個執行緒或程序
+（Streamlit 與獨立 worker 之間以檔案鎖協調）會實際下載與計算。
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import replace
+
+import pandas as pd
+
+from stock_core.config import CACHE_DIR, HOLIDAY_CUTOFF, expected_trading_date, next_publish_time, now_taipei
+from stock_core.parser import ParseReport
+from stock_core.pipeline import DailyRanking, run_daily_ranking
+from stock_core.snapshot import RETRY_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Windows：只做程序內協調
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_flight_locks = {}
+_flight_guard = threading.Lock()
+
+
+@contextmanager
+def single_flight(name, root=None):
+    """同一時間只允許一個執行緒 / 程序執行 name 工作，其餘等待前一個完成"""
+    with _flight_guard:
+        lock = _flight_locks.setdefault(name, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(root or CACHE_DIR, "locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{name}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RankingCache:
+    """
+    依交易日保存已完成的排行（記憶體 + 磁碟）
+
+    磁碟上每個交易日為 {日期}.arrow（排行表）與 {日期}.json（解析統計與來源），
+    不同程序（例如獨立 worker 與 Streamlit）可共用。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or CACHE_DIR, "rankings")
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, trade_date):
+        base = os.path.join(self.root, trade_date)
+        return base + ".arrow", base + ".json"
+
+    def load(self, trade_date):
+        """取得指定交易日的排行，不存在時回傳 None"""
+        with self._lock:
+            if trade_date in self._memory:
+                return self._memory[trade_date]
+        table_path, meta_path = self._paths(trade_date)
+        if not (os.path.exists(table_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            ranking = DailyRanking(
+                ranked=pd.read_feather(table_path),
+                report=ParseReport(**meta["report"]),
+                trade_date=trade_date,
+                source=meta["source"],
+                sources=meta["sources"],
+            )
+        except (OSError, ValueError, KeyError, ImportError) as e:
+            logger.warning("無法讀取預先載入的排行 trade_date=%s error=%s", trade_date, e)
+            return None
+        with self._lock:
+            self._memory[trade_date] = ranking
+        return ranking
+
+    def save(self, ranking):
+        with self._lock:
+            self._memory[ranking.trade_date] = ranking
+        table_path, meta_path = self._paths(ranking.trade_date)
+        meta = {
+            "report": {
+                "rows_in": ranking.report.rows_in,
+                "rows_out": ranking.report.rows_out,
+                "dropped": ranking.report.dropped,
+            },
+            "source": ranking.source,
+            "sources": ranking.sources,
+        }
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+            ranking.ranked.reset_index(drop=True).to_feather(table_path + tmp_suffix)
+            with open(meta_path + tmp_suffix, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(table_path + tmp_suffix, table_path)
+            os.replace(meta_path + tmp_suffix, meta_path)
+        except (OSError, ImportError) as e:
+            # 缺少 pyarrow 或無法寫入時只保留在記憶體
+            logger.warning("略過排行存檔: %s", e)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_ranking_cache():
+    """程序內共用的排行快取"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RankingCache()
+        return _default_cache
+
+
+def is_complete(ranking, trade_date):
+    """排行是否為該交易日的完整資料（DailyRanking.complete 且皆為當日）"""
+    if not ranking.complete:
+        return False
+    return set(ranking.ranked["日期"].astype(str).unique()) == {trade_date}
+
+
+def get_daily_ranking(force_refresh=False, now=None, cache=None, **kwargs):
+    """
+    取得最新交易日的完整排行
+
+    已預先載入時直接回傳（sources 標記為 "warm"）；否則在 single_flight 內計算，
+    等待中的請求在前一個完成後會直接取用其結果。其餘參數傳給 run_daily_ranking。
+    """
+    cache = cache or get_default_ranking_cache()
+    expected = expected_trading_date(now).strftime('%Y-%m-%d')
+
+    def warm():
+        ranking = None if force_refresh else cache.load(expected)
+        if ranking is not None:
+            return replace(ranking, sources={key: "warm" for key in ranking.sources})
+        return None
+
+    ranking = warm()
+    if ranking is not None:
+        return ranking
+    with single_flight("daily_ranking"):
+        ranking = warm()
+        if ranking is not None:
+            return ranking
+        ranking = run_daily_ranking(force_refresh=force_refresh, **kwargs)
+        if is_complete(ranking, expected):
+            cache.save(ranking)
+        return ranking
+
+
+class PrefetchScheduler:
+    """
+    背景排程：每個交易日開放資料更新後輪詢，直到取得完整的當日排行
+
+    取得後休眠到下一次更新時間；資料尚未更新或下載失敗時每隔 poll_interval 再試。
+    過了 HOLIDAY_CUTOFF 各市場仍完整回傳前一交易日的資料時視為休市日，同樣休眠到下一次更新時間。
+    """
+
+    def __init__(self, poll_interval=RETRY_INTERVAL, cache=None, clock=now_taipei):
+        self.poll_interval = poll_interval
+        self.cache = cache or get_default_ranking_cache()
+        self.clock = clock
+        self.last_run = None
+        self.last_error = None
+        self.warmed_date = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        """執行一次，回傳是否已取得預期交易日的完整排行"""
+        now = now or self.clock()
+        expected = expected_trading_date(now).strftime('%Y-%m-%d')
+        self.last_run = now
+        try:
+            ranking = get_daily_ranking(now=now, cache=self.cache)
+        except Exception as e:
+            logger.warning("預先載入失敗: %s", e)
+            self.last_error = str(e)
+            return False
+        self.last_error = None
+        if self.cache.load(expected) is None:
+            if ranking.complete and ranking.trade_date < expected and now.time() >= HOLIDAY_CUTOFF:
+                logger.info("%s 後資料仍為 %s，視為 %s 休市", HOLIDAY_CUTOFF.strftime('%H:%M'), ranking.trade_date, expected)
+                self.warmed_date = ranking.trade_date
+                return True
+            if ranking.errors:
+                logger.info("部分市場取得失敗 %s，稍後再試", ", ".join(ranking.errors))
+            else:
+                logger.info("資料尚未更新至 %s（目前 %s），稍後再試", expected, ranking.trade_date)
+            return False
+        self.warmed_date = expected
+        logger.info("預先載入完成 trade_date=%s", expected)
+        return True
+
+    def next_run(self, now, warmed):
+        return next_publish_time(now) if warmed else now + self.poll_interval
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            now = self.clock()
+            wait = (self.next_run(now, self.run_once(now)) - self.clock()).total_seconds()
+            self._stop.wait(max(wait, 1.0))
+
+    def start(self):
+        """以背景 daemon 執行緒啟動（重複呼叫不會產生第二個執行緒）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="stock-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
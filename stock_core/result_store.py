@@ -0,0 +1,209 @@
+"""
+本地排行結果資料庫（SQLite）：保存每日完整排行，取代 Google Sheets 作為歷史查詢來源
+
+每個交易日的完整排行以單一交易整批寫入（同一日期先刪除再寫入，重複執行結果相同）；
+一次只接受單一日期，不完整的排行由呼叫端略過（見 pipeline.save_results_to_store）。
+主鍵 (trade_date, code) 之外另有 (code, trade_date) 與 (trade_date, rank) 索引，
+支援個股歷史、指定日期前 N 名與進榜天數等查詢。Google Sheets 改為選用的鏡像。
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from stock_core.config import RESULTS_DB
+from stock_core.parser import clean_code
+from stock_core.sheets_sync import GspreadBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rankings (
+    trade_date TEXT NOT NULL,
+    code TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    name TEXT,
+    close REAL,
+    volume INTEGER,
+    value REAL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (trade_date, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rankings_code_date ON rankings (code, trade_date);
+CREATE INDEX IF NOT EXISTS rankings_date_rank ON rankings (trade_date, rank);
+"""
+
+# 資料庫欄位 → 輸出欄位
+OUTPUT_COLUMNS = {
+    "trade_date": "日期",
+    "code": "代號",
+    "ticker": "股票代號",
+    "name": "股票名稱",
+    "close": "收盤價格",
+    "volume": "成交股數",
+    "value": "交易值指標",
+    "rank": "排名",
+}
+_SELECT = ", ".join(OUTPUT_COLUMNS)
+
+
+def _optional(value, cast):
+    return None if pd.isna(value) else cast(value)
+
+
+class ResultStore:
+    """每日排行的本地資料庫；每次操作各自開啟連線，可在多執行緒（Streamlit）中共用"""
+
+    def __init__(self, path=None):
+        self.path = path or RESULTS_DB
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        with self._init_lock:
+            if not self._initialized:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with sqlite3.connect(self.path) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._initialized = True
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _query(self, sql, params=()):
+        with self._connect() as conn:
+            frame = pd.read_sql_query(sql, conn, params=params)
+        frame = frame.rename(columns=OUTPUT_COLUMNS)
+        return frame.astype({column: "Int64" for column in ("成交股數", "排名") if column in frame.columns})
+
+    # --- 寫入 ---
+    def _rows(self, ranked):
+        """轉為資料庫列；排名依各日期內的交易值指標由大到小計算"""
+        frame = ranked.assign(代號=clean_code(ranked["股票代號"]), 日期=ranked["日期"].astype(str))
+        frame = frame.sort_values(["日期", "交易值指標"], ascending=[True, False], kind="stable")
+        frame["排名"] = frame.groupby("日期").cumcount() + 1
+        return [
+            (
+                trade_date, code, ticker, name,
+                _optional(close, float), _optional(volume, int), _optional(value, float), rank,
+            )
+            for trade_date, code, ticker, name, close, volume, value, rank in frame[
+                ["日期", "代號", "股票代號", "股票名稱", "收盤價格", "成交股數", "交易值指標", "排名"]
+            ].itertuples(index=False, name=None)
+        ]
+
+    def save(self, ranked):
+        """
+        整批寫入單一交易日的完整排行（RANK_COLUMNS），回傳寫入筆數
+
+        該日期已有的資料整批取代，因此只應傳入完整的排行（見 DailyRanking.complete）；
+        資料包含多個日期時拋出 ValueError，避免以部分資料取代其他日期。
+        """
+        if ranked.empty:
+            return 0
+        dates = sorted(ranked["日期"].astype(str).unique())
+        if len(dates) != 1:
+            raise ValueError(f"排行須為單一交易日，收到 {len(dates)} 個日期: {', '.join(dates)}")
+        rows = self._rows(ranked)
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM rankings WHERE trade_date = ?", (dates[0],))
+            conn.executemany("INSERT INTO rankings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        logger.info("已寫入排行資料庫 trade_date=%s rows=%d", dates[0], len(rows))
+        return len(rows)
+
+    def import_sheet(self, values):
+        """
+        匯入 Google Sheets 既有的歷史（get_all_values() 的結果，第一列為標題）
+
+        工作表只有 日期、股票代號、收盤價格、交易值指標，成交股數以 交易值 ÷ 收盤價 回推，
+        股票名稱以代號代替；資料庫已有的日期不會被覆蓋。回傳匯入筆數。
+        """
+        if len(values) < 2:
+            return 0
+        frame = pd.DataFrame(values[1:], columns=values[0])
+        frame["日期"] = pd.to_datetime(frame["日期"], errors="coerce").dt.strftime('%Y-%m-%d')
+        frame = frame.dropna(subset=["日期"])
+        frame = frame[~frame["日期"].isin(self.dates())]
+        if frame.empty:
+            return 0
+        for column in ("收盤價格", "交易值指標"):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+        frame["成交股數"] = (frame["交易值指標"] * 1e8 / frame["收盤價格"]).round().astype("Int64")
+        frame["股票名稱"] = clean_code(frame["股票代號"])
+        frame = frame.drop_duplicates(["日期", "股票代號"], keep="last")
+        rows = self._rows(frame)
+        # 只新增資料庫沒有的日期，不取代既有資料
+        with self._connect() as conn, conn:
+            conn.executemany("INSERT OR IGNORE INTO rankings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        logger.info("已匯入 Google Sheets 歷史 dates=%d rows=%d", frame["日期"].nunique(), len(rows))
+        return len(rows)
+
+    # --- 查詢 ---
+    def dates(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT trade_date FROM rankings ORDER BY trade_date")]
+
+    def has_date(self, trade_date):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM rankings WHERE trade_date = ? LIMIT 1", (trade_date,)).fetchone() is not None
+
+    def latest_date(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT MAX(trade_date) FROM rankings").fetchone()[0]
+
+    def history(self, code, start=None, end=None):
+        """個股歷史（依日期排序）；code 可含 .TW / .TWO 後綴"""
+        code = clean_code(pd.Series([str(code)])).iloc[0]
+        return self._query(
+            f"SELECT {_SELECT} FROM rankings WHERE code = ? AND trade_date >= ? AND trade_date <= ? ORDER BY trade_date",
+            (code, start or "", end or "9999-99-99"),
+        )
+
+    def top(self, trade_date=None, n=100):
+        """指定日期（預設最新）的前 n 名"""
+        trade_date = trade_date or self.latest_date()
+        return self._query(
+            f"SELECT {_SELECT} FROM rankings WHERE trade_date = ? AND rank <= ? ORDER BY rank",
+            (trade_date or "", n),
+        )
+
+    def days_in_top(self, n=100, start=None, end=None):
+        """期間內各股進入前 n 名的天數、最佳 / 平均名次與首次、最近進榜日期"""
+        return self._query(
+            """
+            SELECT code AS 代號, MAX(name) AS 股票名稱, COUNT(*) AS 進榜天數,
+                   MIN(rank) AS 最佳排名, ROUND(AVG(rank), 1) AS 平均排名,
+                   MIN(trade_date) AS 首次進榜, MAX(trade_date) AS 最近進榜
+            FROM rankings
+            WHERE rank <= ? AND trade_date >= ? AND trade_date <= ?
+            GROUP BY code
+            ORDER BY 進榜天數 DESC, 最佳排名
+            """,
+            (n, start or "", end or "9999-99-99"),
+        )
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_result_store():
+    """程序內共用的排行結果資料庫"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ResultStore()
+        return _default_store
+
+
+def import_from_sheets(client, sheet_name, store=None):
+    """將 Google Sheets 歷史一次匯入本地資料庫，回傳匯入筆數"""
+    worksheet = client.open(sheet_name).get_worksheet(0)
+    return (store or get_default_result_store()).import_sheet(GspreadBackend(worksheet).read_all())
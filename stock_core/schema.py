@@ -0,0 +1,85 @@
+"""行情資料的欄位定義：依標題名稱對應欄位，並使用精簡的資料型別"""
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+class SchemaError(ValueError):
+    """來源資料缺少必要欄位"""
+
+
+@dataclass(frozen=True)
+class Column:
+    """標準欄位名稱與來源可能使用的標題（中文開放資料、英文 OpenAPI 等）"""
+    name: str
+    aliases: tuple
+    required: bool = True
+
+
+# STOCK_DAY_ALL（及相同內容的每日收盤行情、櫃買中心上櫃收盤行情）欄位
+STOCK_DAY_ALL_SCHEMA = (
+    Column("代號", ("證券代號", "代號", "股票代號", "Code", "SecuritiesCompanyCode")),
+    Column("股票名稱", ("證券名稱", "名稱", "股票名稱", "Name", "CompanyName")),
+    Column("成交股數", ("成交股數", "TradeVolume", "TradingShares")),
+    Column("成交金額", ("成交金額", "TradeValue", "TransactionAmount"), required=False),
+    Column("開盤價", ("開盤價", "開盤", "OpeningPrice", "Open"), required=False),
+    Column("最高價", ("最高價", "最高", "HighestPrice", "High"), required=False),
+    Column("最低價", ("最低價", "最低", "LowestPrice", "Low"), required=False),
+    Column("收盤價格", ("收盤價", "收盤", "ClosingPrice", "Close")),
+)
+
+# 解析後行情表的精簡型別：代號與名稱為類別、價格為 float32（兩位小數可完整還原）、成交股數為 int64，
+# 交易值指標（億元，四位小數）超過 float32 的有效位數，維持 float64；日期在單日資料中只有一個值，以類別儲存
+MARKET_DTYPES = {
+    "代號": "category",
+    "日期": "category",
+    "股票代號": "category",
+    "股票名稱": "category",
+    "收盤價格": "float32",
+    "成交股數": "int64",
+    "交易值指標": "float64",
+}
+
+# 對外輸出（畫面、Excel、Google Sheets）時的小數位數
+DISPLAY_DECIMALS = {"收盤價格": 2, "交易值指標": 4}
+
+
+def _normalize_header(label):
+    return str(label).replace("﻿", "").strip()
+
+
+def resolve_columns(frame, schema=STOCK_DAY_ALL_SCHEMA):
+    """
+    依標題名稱找出各標準欄位在 frame 中的欄位，回傳 {標準名稱: 原欄位}
+
+    缺少必要欄位時拋出 SchemaError，而不是依位置誤讀其他欄位。
+    """
+    headers = {_normalize_header(label): label for label in frame.columns}
+    mapping = {}
+    missing = []
+    for column in schema:
+        label = next((headers[a] for a in column.aliases if a in headers), None)
+        if label is not None:
+            mapping[column.name] = label
+        elif column.required:
+            missing.append(column.name)
+    if missing:
+        raise SchemaError(f"資料缺少必要欄位: {', '.join(missing)}（現有欄位: {', '.join(headers)}）")
+    return mapping
+
+
+def compact(frame):
+    """將已知欄位轉為 MARKET_DTYPES 定義的精簡型別"""
+    dtypes = {name: dtype for name, dtype in MARKET_DTYPES.items() if name in frame.columns}
+    return frame.astype(dtypes)
+
+
+def to_display(frame):
+    """轉為輸出用型別：文字欄為一般字串、數值欄為四捨五入後的 float64"""
+    frame = frame.copy()
+    for name in frame.columns:
+        if isinstance(frame[name].dtype, pd.CategoricalDtype):
+            frame[name] = frame[name].astype(object)
+        elif name in DISPLAY_DECIMALS:
+            frame[name] = frame[name].astype("float64").round(DISPLAY_DECIMALS[name])
+    return frame
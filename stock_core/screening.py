@@ -0,0 +1,237 @@
+"""
+條件選股：將宣告式規則編譯為向量化遮罩
+
+規則可寫成文字（每行一條，例如 `收盤價格 between 50, 200`、`交易值指標 >= 5`、
+`代號 in 2330, 2317`），或以 JSON 設定檔保存多組篩選。編譯結果依規則組快取，
+同一份資料執行多組篩選時，各欄位只轉換為 NumPy 陣列一次。
+"""
+import json
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from stock_core.config import SCREENS_FILE
+from stock_core.parser import clean_code
+
+NUMERIC_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+SET_OPS = ("in", "not in")
+OPERATORS = tuple(NUMERIC_OPS) + SET_OPS + ("between",)
+
+# 依長度排序，避免 `>=` 被誤判為 `>`
+_RULE_PATTERN = re.compile(
+    r"^\s*(?P<field>[^\s<>=!]+)\s*(?P<op>>=|<=|==|!=|>|<|not\s+in\b|in\b|between\b)\s*(?P<value>.+?)\s*$",
+    re.IGNORECASE,
+)
+
+
+class ScreenError(ValueError):
+    """規則格式錯誤或資料缺少規則使用的欄位"""
+
+
+@dataclass(frozen=True)
+class Rule:
+    """單一條件；value 在 in / not in 為代號等字串的 tuple，在 between 為 (下限, 上限)"""
+    field: str
+    op: str
+    value: object
+
+    def describe(self):
+        if self.op in SET_OPS:
+            return f"{self.field} {self.op} {', '.join(self.value)}"
+        if self.op == "between":
+            return f"{self.field} between {self.value[0]:g}, {self.value[1]:g}"
+        return f"{self.field} {self.op} {self.value:g}"
+
+
+@dataclass(frozen=True)
+class Screen:
+    """一組篩選：mode 為 all（全部符合）或 any（任一符合）"""
+    name: str
+    rules: tuple
+    mode: str = "all"
+
+    def describe(self):
+        return "\n".join(rule.describe() for rule in self.rules)
+
+
+def _number(text, rule_text):
+    try:
+        return float(text.replace(",", "").strip())
+    except ValueError:
+        raise ScreenError(f"無法解析數值「{text}」：{rule_text}") from None
+
+
+def make_rule(field, op, value):
+    """建立並驗證規則（value 可為字串、數值或清單）"""
+    op = " ".join(str(op).lower().split())
+    rule_text = f"{field} {op} {value}"
+    if op not in OPERATORS:
+        raise ScreenError(f"不支援的運算子「{op}」：{rule_text}")
+    if op in SET_OPS:
+        items = value if isinstance(value, (list, tuple)) else re.split(r"[,\s]+", str(value))
+        codes = tuple(sorted({clean_code(pd.Series([str(v)])).iloc[0] for v in items if str(v).strip()}))
+        if field in ("代號", "股票代號"):
+            field = "代號"
+        return Rule(field, op, codes)
+    if op == "between":
+        bounds = value if isinstance(value, (list, tuple)) else re.split(r"\s*(?:,|~|\.\.)\s*", str(value).strip())
+        if len(bounds) != 2:
+            raise ScreenError(f"between 需要上下限兩個數值：{rule_text}")
+        low, high = sorted(_number(str(b), rule_text) for b in bounds)
+        return Rule(field, op, (low, high))
+    return Rule(field, op, _number(str(value), rule_text))
+
+
+def parse_rules(text):
+    """解析文字規則：每行（或以 ; 分隔）一條，# 之後為註解"""
+    rules = []
+    for line in re.split(r"[;\n]", text or ""):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        match = _RULE_PATTERN.match(line)
+        if not match:
+            raise ScreenError(f"無法解析規則「{line}」（格式：欄位 運算子 數值，例如 交易值指標 >= 5）")
+        rules.append(make_rule(match["field"], match["op"], match["value"]))
+    return tuple(rules)
+
+
+def screen_from_text(text, name="自訂篩選", mode="all"):
+    return Screen(name=name, rules=parse_rules(text), mode=mode)
+
+
+def screen_from_config(config):
+    """由設定（{name, mode, rules: [規則字串或 {field, op, value}]}）建立"""
+    rules = []
+    for item in config.get("rules", []):
+        if isinstance(item, str):
+            rules.extend(parse_rules(item))
+        else:
+            rules.append(make_rule(item["field"], item["op"], item["value"]))
+    mode = config.get("mode", "all")
+    if mode not in ("all", "any"):
+        raise ScreenError(f"mode 只能是 all 或 any：{mode}")
+    return Screen(name=config.get("name", "未命名"), rules=tuple(rules), mode=mode)
+
+
+def screen_to_config(screen):
+    return {"name": screen.name, "mode": screen.mode, "rules": [rule.describe() for rule in screen.rules]}
+
+
+class ScreenContext:
+    """同一份資料的欄位陣列快取，多組篩選共用"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._numeric = {}
+        self._codes = {}
+
+    def _column(self, field):
+        if field not in self.frame.columns:
+            raise ScreenError(f"資料沒有「{field}」欄位（可用欄位: {', '.join(map(str, self.frame.columns))}）")
+        return self.frame[field]
+
+    def numeric(self, field):
+        if field not in self._numeric:
+            values = pd.to_numeric(self._column(field), errors="coerce")
+            self._numeric[field] = values.to_numpy(dtype="float64", na_value=np.nan)
+        return self._numeric[field]
+
+    def codes(self, field):
+        """代號類欄位轉為分類編碼，in 條件只需比對整數"""
+        if field not in self._codes:
+            column = self._column(field)
+            if field != "代號":
+                column = clean_code(column)
+            self._codes[field] = pd.Categorical(column.astype("string"))
+        return self._codes[field]
+
+
+def _rule_mask(rule, context):
+    if rule.op in SET_OPS:
+        categorical = context.codes(rule.field)
+        wanted = categorical.categories.get_indexer(list(rule.value))
+        mask = np.isin(categorical.codes, wanted[wanted >= 0])
+        return ~mask if rule.op == "not in" else mask
+
+    values = context.numeric(rule.field)
+    with np.errstate(invalid="ignore"):
+        if rule.op == "between":
+            return (values >= rule.value[0]) & (values <= rule.value[1])
+        # NaN 比較結果為 False，缺值不會通過任何數值條件
+        return NUMERIC_OPS[rule.op](values, rule.value)
+
+
+@lru_cache(maxsize=256)
+def compile_screen(screen):
+    """將篩選編譯為 context → 布林遮罩 的函式（依規則組快取）"""
+    rules = screen.rules
+    combine = np.logical_and if screen.mode == "all" else np.logical_or
+
+    def evaluate(context):
+        if not rules:
+            return np.ones(len(context.frame), dtype=bool)
+        mask = _rule_mask(rules[0], context)
+        for rule in rules[1:]:
+            mask = combine(mask, _rule_mask(rule, context))
+        return mask
+
+    return evaluate
+
+
+def apply_screen(screen, frame, context=None):
+    """回傳符合篩選的列（保留原排序）"""
+    context = context or ScreenContext(frame)
+    return frame[compile_screen(screen)(context)]
+
+
+def run_screens(screens, frame):
+    """對同一份資料執行多組篩選，回傳 {名稱: 符合的列}"""
+    context = ScreenContext(frame)
+    return {screen.name: apply_screen(screen, frame, context) for screen in screens}
+
+
+def build_universe(ranked, liquidity=None):
+    """
+    篩選用的資料表：單日排行加上 代號 與單日排名（交易值排名），
+    傳入多日流動性統計時併入 平均交易值、排名變化、量能倍數 等欄位
+    """
+    universe = ranked.reset_index(drop=True).copy()
+    universe["代號"] = clean_code(universe["股票代號"]).astype(object)
+    universe["交易值排名"] = np.arange(1, len(universe) + 1)
+    if liquidity is not None and not liquidity.empty:
+        extra = liquidity.drop(columns=["日期", "股票名稱", "交易值指標"], errors="ignore")
+        universe = universe.merge(extra.astype({"代號": object}), on="代號", how="left")
+    return universe
+
+
+# --- 儲存的篩選 ---
+def load_screens(path=None):
+    """讀取儲存的篩選清單，檔案不存在時回傳空清單"""
+    path = path or SCREENS_FILE
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [screen_from_config(item) for item in json.load(f)]
+
+
+def save_screen(screen, path=None):
+    """新增或覆寫同名篩選"""
+    path = path or SCREENS_FILE
+    screens = [s for s in load_screens(path) if s.name != screen.name] + [screen]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([screen_to_config(s) for s in screens], f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return screens
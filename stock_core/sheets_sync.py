@@ -0,0 +1,259 @@
+"""Google Sheets 同步引擎：以 (日期, 股票代號) 為鍵的冪等 upsert，分批寫入並在配額錯誤時退避重試"""
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 工作表欄位（第一列為標題）
+SHEET_COLUMNS = ["日期", "股票代號", "收盤價格", "交易值指標"]
+KEY_COLUMNS = ("日期", "股票代號")
+
+# 視為可重試的 HTTP 狀態碼（配額、暫時性錯誤）
+RETRYABLE_STATUS = {429, 500, 502, 503}
+
+
+def _column_letter(n):
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _first_row(a1_range):
+    """由 A1 範圍（例如 'Sheet1'!A101:D150）取得起始列號，無法解析時回傳 None"""
+    match = re.search(r"(?:^|!)\$?[A-Z]+\$?(\d+)", a1_range or "")
+    return int(match.group(1)) if match else None
+
+
+class GspreadBackend:
+    """
+    將 gspread Worksheet 包裝成同步引擎使用的介面
+
+    read_keys 只讀取前 width 欄（鍵欄），read_rows 只讀取指定列；
+    append_rows 回傳實際寫入的起始列號（由 API 回應取得）。
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def read_all(self):
+        return self.worksheet.get_all_values()
+
+    def read_keys(self, width):
+        return [list(row) for row in self.worksheet.get(f"A:{_column_letter(width)}")]
+
+    def read_rows(self, row_numbers, width):
+        letter = _column_letter(width)
+        ranges = self.worksheet.batch_get([f"A{n}:{letter}{n}" for n in row_numbers])
+        return [list(value_range[0]) if value_range else [] for value_range in ranges]
+
+    def batch_update(self, updates):
+        data = [{"range": a1_range, "values": rows} for a1_range, rows in updates]
+        self.worksheet.batch_update(data, value_input_option="RAW")
+
+    def append_rows(self, rows):
+        response = self.worksheet.append_rows(rows, value_input_option="RAW")
+        return _first_row(((response or {}).get("updates") or {}).get("updatedRange"))
+
+
+class MemoryWorksheet:
+    """本地假工作表，介面與 GspreadBackend 相同，供測試與效能量測使用"""
+
+    def __init__(self, rows=None):
+        self.rows = [list(r) for r in rows or []]
+        self.calls = {"read_all": 0, "read_keys": 0, "read_rows": 0, "batch_update": 0, "append_rows": 0}
+
+    def read_all(self):
+        self.calls["read_all"] += 1
+        return [list(r) for r in self.rows]
+
+    def read_keys(self, width):
+        self.calls["read_keys"] += 1
+        return [list(r[:width]) for r in self.rows]
+
+    def read_rows(self, row_numbers, width):
+        self.calls["read_rows"] += 1
+        return [list(self.rows[n - 1][:width]) if n <= len(self.rows) else [] for n in row_numbers]
+
+    def batch_update(self, updates):
+        self.calls["batch_update"] += 1
+        for a1_range, values in updates:
+            start_row = int(re.match(r"[A-Z]+(\d+)", a1_range).group(1))
+            for offset, row in enumerate(values):
+                index = start_row - 1 + offset
+                while len(self.rows) <= index:
+                    self.rows.append([])
+                self.rows[index] = [str(v) for v in row]
+
+    def append_rows(self, rows):
+        self.calls["append_rows"] += 1
+        # 與 Google Sheets 相同，接在最後一個非空白列之後
+        while self.rows and not any(self.rows[-1]):
+            self.rows.pop()
+        first = len(self.rows) + 1
+        self.rows.extend([str(v) for v in row] for row in rows)
+        return first
+
+
+@dataclass
+class SyncResult:
+    """同步統計"""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    requests: int = 0
+
+
+def _normalize_date(value):
+    try:
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return str(value).strip()
+
+
+def _same_value(sheet_value, new_value):
+    """比較工作表上的字串與要寫入的值（數字以數值比較）"""
+    try:
+        return abs(float(sheet_value) - float(new_value)) < 1e-9
+    except (TypeError, ValueError):
+        return str(sheet_value).strip() == str(new_value).strip()
+
+
+def _is_retryable(error):
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+    message = str(error)
+    return "RESOURCE_EXHAUSTED" in message or "Quota exceeded" in message
+
+
+class SheetSync:
+    """
+    以本地索引記錄工作表上已有的 (日期, 股票代號) 所在列號，只寫入新增或變更的列
+
+    索引只讀取鍵欄（A:B）建立，不再整表讀取；upsert 時只讀取本批已存在鍵的那幾列比對內容，
+    若發現列號已被外部修改（列被刪除或插入），重新建立索引後再比對一次。
+    實例應在程序內共用（見 pipeline.get_sheet_sync），重複同步不需重建索引。
+    """
+
+    def __init__(self, backend, columns=SHEET_COLUMNS, key_columns=KEY_COLUMNS,
+                 chunk_size=500, max_retries=5, base_delay=1.0, sleep=time.sleep):
+        self.backend = backend
+        self.columns = list(columns)
+        self.key_positions = [self.columns.index(c) for c in key_columns]
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.sleep = sleep
+        self.index = None
+        self.row_count = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _call(self, func, *args):
+        """呼叫後端；遇到配額或暫時性錯誤時以指數退避加抖動重試"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.requests += 1
+                return func(*args)
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                self.sleep(self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay))
+
+    def _key(self, row):
+        date_pos, code_pos = self.key_positions
+        return _normalize_date(row[date_pos]), str(row[code_pos]).strip()
+
+    def refresh_index(self):
+        """重新讀取鍵欄並建立 {鍵: 列號} 索引"""
+        values = self._call(self.backend.read_keys, max(self.key_positions) + 1)
+        self.index = {}
+        self.row_count = len(values)
+        for row_number, row in enumerate(values[1:], start=2):
+            if len(row) <= max(self.key_positions) or not row[self.key_positions[1]]:
+                continue
+            self.index[self._key(row)] = row_number
+        return len(self.index)
+
+    def _read_existing(self, keys):
+        """讀取 keys 目前所在的列；任一列的鍵與索引不符時回傳 None"""
+        numbers = [self.index[key] for key in keys]
+        rows = []
+        for start in range(0, len(numbers), self.chunk_size):
+            rows.extend(self._call(self.backend.read_rows, numbers[start:start + self.chunk_size], len(self.columns)))
+        for key, row in zip(keys, rows):
+            if len(row) <= max(self.key_positions) or self._key(row) != key:
+                return None
+        return rows
+
+    def upsert(self, df):
+        """將 df 的 self.columns 欄位寫入工作表，回傳 SyncResult"""
+        with self._lock:
+            return self._upsert(df)
+
+    def _upsert(self, df):
+        before = self.requests
+        if self.index is None:
+            self.refresh_index()
+        result = SyncResult()
+
+        frame = df[self.columns].astype(object).where(df[self.columns].notna(), "")
+        # 同一批資料重複的鍵，以最後一筆為準
+        incoming = {}
+        for row in frame.itertuples(index=False, name=None):
+            row = list(row)
+            incoming[self._key(row)] = row
+
+        existing_keys = [key for key in incoming if key in self.index]
+        current = self._read_existing(existing_keys) if existing_keys else []
+        if current is None:
+            logger.info("工作表列號已變動，重新建立索引")
+            self.refresh_index()
+            existing_keys = [key for key in incoming if key in self.index]
+            current = self._read_existing(existing_keys) if existing_keys else []
+            if current is None:
+                raise RuntimeError("工作表在同步期間被修改，請稍後再試")
+        current = dict(zip(existing_keys, current))
+
+        width = _column_letter(len(self.columns))
+        updates = []
+        inserts = []
+        for key, row in incoming.items():
+            if key not in current:
+                inserts.append(row)
+            elif len(current[key]) >= len(row) and all(_same_value(old, new) for old, new in zip(current[key], row)):
+                result.unchanged += 1
+            else:
+                row_number = self.index[key]
+                updates.append((f"A{row_number}:{width}{row_number}", [row]))
+
+        for start in range(0, len(updates), self.chunk_size):
+            self._call(self.backend.batch_update, updates[start:start + self.chunk_size])
+        result.updated = len(updates)
+
+        if inserts and self.row_count == 0:
+            self._call(self.backend.append_rows, [self.columns])
+            self.row_count = 1
+        for start in range(0, len(inserts), self.chunk_size):
+            chunk = inserts[start:start + self.chunk_size]
+            first = self._call(self.backend.append_rows, chunk)
+            if first is None or self.index is None:
+                # 無法得知實際寫入位置，下次同步時重新建立索引
+                self.index = None
+                continue
+            for offset, row in enumerate(chunk):
+                self.index[self._key(row)] = first + offset
+            self.row_count = max(self.row_count, first + len(chunk) - 1)
+        result.inserted = len(inserts)
+
+        result.requests = self.requests - before
+        return result
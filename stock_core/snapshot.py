@@ -0,0 +1,318 @@
+"""每日行情快照層：單次下載、依交易日存於本地，並以 ETag / Last-Modified 條件式重新驗證"""
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+
+import pandas as pd
+
+from stock_core.config import (
+    CACHE_DIR,
+    STOCK_DAY_ALL_URL,
+    TAIPEI_TZ,
+    expected_trading_date,
+    next_publish_time,
+    now_taipei,
+)
+from stock_core.http_client import get_default_client
+
+logger = logging.getLogger(__name__)
+
+# 資料尚未更新到預期交易日（或無法確認資料日期）時，隔多久再重新驗證
+RETRY_INTERVAL = timedelta(minutes=10)
+
+# 資料本身可能帶有的日期欄（證交所、櫃買中心開放資料皆為民國日期）
+DATE_COLUMNS = ("日期", "Date")
+
+# 快取資訊檔名：{交易日}.json
+_META_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.json$")
+
+
+@dataclass
+class Snapshot:
+    """某交易日的每日行情原始資料與快取資訊"""
+    trade_date: str
+    data: pd.DataFrame
+    fetched_at: datetime
+    expires_at: datetime
+    etag: str = None
+    last_modified: str = None
+    source: str = "network"
+    nbytes: int = 0
+    verified: bool = True
+    extra: dict = field(default_factory=dict)
+
+    def is_fresh(self, now=None):
+        return (now or now_taipei()) < self.expires_at
+
+    def meta(self):
+        return {
+            "trade_date": self.trade_date,
+            "fetched_at": self.fetched_at.isoformat(),
+            "expires_at": self.expires_at.isoformat(),
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "nbytes": self.nbytes,
+        }
+
+
+def read_snapshot_csv(content):
+    """由回應內容解析 CSV；代號欄一律保留為字串以免遺失前導 0"""
+    return pd.read_csv(BytesIO(content), dtype=str)
+
+
+def read_snapshot_json(content):
+    """由回應內容解析 JSON 陣列（開放資料 OpenAPI 格式），欄位一律為字串"""
+    records = json.loads(content.decode("utf-8-sig"))
+    return pd.DataFrame(records, dtype=str)
+
+
+def roc_data_date(data, columns=DATE_COLUMNS):
+    """
+    由資料的日期欄（民國日期如 1151016、115/10/16，或西元 20261016）取得資料日期字串
+
+    沒有日期欄或無法解析時回傳 None。
+    """
+    column = next((c for c in columns if c in data.columns), None)
+    if column is None or data.empty:
+        return None
+    text = str(data[column].iloc[0]).strip().replace("/", "").replace("-", "")
+    if not text.isdigit() or len(text) < 7:
+        return None
+    year = int(text[:-4])
+    try:
+        return date(year if year > 1911 else year + 1911, int(text[-4:-2]), int(text[-2:])).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _modified_date(last_modified):
+    """將 Last-Modified 標頭轉為台北日期字串，無法解析時回傳 None"""
+    if not last_modified:
+        return None
+    try:
+        return parsedate_to_datetime(last_modified).astimezone(TAIPEI_TZ).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+class SnapshotStore:
+    """
+    以交易日為鍵的快照存放區
+
+    讀取順序為記憶體 → 磁碟 → 網路；過期時先帶條件標頭重新驗證，
+    收到 304 即沿用本地資料。同一程序內的並行請求共用一次下載；
+    無法連線時退回同一交易日的本地快照（source 為 "stale"）。
+    name 為子目錄（上市以外的市場各自存放），reader 將回應內容解析為 DataFrame，
+    data_date 由資料本身取得資料日期（優先於 Last-Modified）。
+    兩者皆無法判斷日期的快照標記為未確認（verified 為 False），只保留在記憶體並稍後再試，
+    不會以預期交易日寫入磁碟。
+    """
+
+    def __init__(self, cache_dir=None, url=STOCK_DAY_ALL_URL, timeout=30, session=None,
+                 name=None, reader=read_snapshot_csv, ext=".csv", data_date=roc_data_date):
+        self.cache_dir = os.path.join(cache_dir or CACHE_DIR, "snapshots", *([name] if name else []))
+        self.url = url
+        self.timeout = timeout
+        self.session = session or get_default_client()
+        self.reader = reader
+        self.ext = ext
+        self.data_date = data_date
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    # --- 磁碟存取 ---
+    def _paths(self, trade_date):
+        base = os.path.join(self.cache_dir, trade_date)
+        return base + self.ext, base + ".json"
+
+    def _load_disk(self, trade_date):
+        csv_path, meta_path = self._paths(trade_date)
+        if not (os.path.exists(csv_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(csv_path, "rb") as f:
+                content = f.read()
+            return Snapshot(
+                trade_date=trade_date,
+                data=self.reader(content),
+                fetched_at=datetime.fromisoformat(meta["fetched_at"]),
+                expires_at=datetime.fromisoformat(meta["expires_at"]),
+                etag=meta.get("etag"),
+                last_modified=meta.get("last_modified"),
+                source="disk",
+                nbytes=len(content),
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_atomic(self, path, content):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _save_meta(self, snapshot):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        _, meta_path = self._paths(snapshot.trade_date)
+        self._write_atomic(meta_path, json.dumps(snapshot.meta(), ensure_ascii=False).encode("utf-8"))
+
+    def _save(self, snapshot, content):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        csv_path, _ = self._paths(snapshot.trade_date)
+        self._write_atomic(csv_path, content)
+        self._save_meta(snapshot)
+
+    # --- 網路存取 ---
+    def _data_date(self, data, last_modified, expected_date):
+        """
+        資料所屬日期：優先由資料內容判斷（直接採用），其次為 Last-Modified
+
+        Last-Modified 只代表檔案更新時間（例如收盤前仍在更新前一日資料），不晚於預期交易日。
+        """
+        data_date = self.data_date(data) if self.data_date else None
+        if data_date:
+            return data_date
+        modified = _modified_date(last_modified)
+        return min(modified, expected_date) if modified else None
+
+    def _expiry(self, data_date, expected_date, now):
+        """資料已是預期交易日則保留到下次更新時間；尚未更新或無法確認日期時稍後再試"""
+        if data_date is not None and data_date >= expected_date:
+            return next_publish_time(now)
+        return now + RETRY_INTERVAL
+
+    def _fetch(self, expected_date, cached, now):
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            cached.fetched_at = now
+            cached.expires_at = self._expiry(
+                self._data_date(cached.data, cached.last_modified, expected_date), expected_date, now
+            )
+            cached.source = "revalidated"
+            if cached.verified:
+                self._save_meta(cached)
+            return cached
+
+        if response.status_code != 200:
+            raise Exception(f"HTTP 狀態碼: {response.status_code}")
+
+        content = response.content
+        data = self.reader(content)
+        if data.empty:
+            raise Exception("API 回傳資料為空")
+
+        last_modified = response.headers.get("Last-Modified")
+        data_date = self._data_date(data, last_modified, expected_date)
+        snapshot = Snapshot(
+            trade_date=data_date or expected_date,
+            data=data,
+            fetched_at=now,
+            expires_at=self._expiry(data_date, expected_date, now),
+            etag=response.headers.get("ETag"),
+            last_modified=last_modified,
+            source="network",
+            nbytes=len(content),
+            verified=data_date is not None,
+        )
+        if snapshot.verified:
+            self._save(snapshot, content)
+        else:
+            # 可能是尚未更新的前一日資料，不以預期交易日存檔
+            logger.warning("無法確認資料日期，暫不寫入本地快取 url=%s expected=%s", self.url, expected_date)
+        return snapshot
+
+    # --- 對外介面 ---
+    def get(self, force_refresh=False, now=None):
+        """取得最新快照，必要時才連線"""
+        now = now or now_taipei()
+        expected_date = expected_trading_date(now).strftime('%Y-%m-%d')
+
+        with self._lock:
+            cached = self._memory.get(expected_date)
+            if cached is not None and cached.is_fresh(now) and not force_refresh:
+                return replace(cached, source="memory")
+            if cached is None:
+                cached = self._load_disk(expected_date)
+            if cached is not None and cached.is_fresh(now) and not force_refresh:
+                self._memory[expected_date] = cached
+                return cached
+
+            try:
+                snapshot = self._fetch(expected_date, cached, now)
+            except Exception as e:
+                if cached is None:
+                    raise
+                logger.warning("無法更新快照，改用本地資料 trade_date=%s error=%s", cached.trade_date, e)
+                return replace(cached, source="stale")
+            self._memory[expected_date] = snapshot
+            if snapshot.trade_date != expected_date:
+                self._memory[snapshot.trade_date] = snapshot
+            return snapshot
+
+    def version(self, now=None):
+        """
+        目前可取用快照的版本 (交易日, ETag / Last-Modified / 下載時間)，不連線
+
+        供上層快取作為鍵的一部分：快照重新下載或更新後版本即改變。沒有快照時回傳 None。
+        """
+        expected_date = expected_trading_date(now).strftime('%Y-%m-%d')
+        with self._lock:
+            cached = self._memory.get(expected_date)
+        if cached is not None:
+            return cached.trade_date, cached.etag or cached.last_modified or cached.fetched_at.isoformat()
+        try:
+            with open(self._paths(expected_date)[1], encoding="utf-8") as f:
+                meta = json.load(f)
+            return meta["trade_date"], meta.get("etag") or meta.get("last_modified") or meta["fetched_at"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def latest(self):
+        """本地最近一個交易日的快照（不連線），沒有時回傳 None"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return None
+        dates = sorted((m.group(1) for m in map(_META_FILE.match, names) if m), reverse=True)
+        for trade_date in dates:
+            snapshot = self.load(trade_date)
+            if snapshot is not None:
+                return snapshot
+        return None
+
+    def load(self, trade_date):
+        """讀取指定交易日的本地快照（不連線），不存在時回傳 None"""
+        with self._lock:
+            snapshot = self._memory.get(trade_date) or self._load_disk(trade_date)
+            if snapshot is not None:
+                self._memory[trade_date] = snapshot
+            return snapshot
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    """程序內共用的快照存放區"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = SnapshotStore()
+        return _default_store
@@ -0,0 +1,219 @@
+"""大型工作簿的串流讀寫：分塊讀取上傳檔案、逐塊填入 C/D 欄並以常數記憶體寫出"""
+import csv
+import io
+from dataclasses import dataclass, field
+from itertools import islice
+
+import pandas as pd
+
+from stock_core.excel_update import (
+    UpdateResult,
+    apply_values,
+    normalize_column_names,
+    queryable_codes,
+    select_rows,
+)
+from stock_core.parser import clean_code
+
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def _file_kind(name):
+    name = name.lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.xls'):
+        return 'xls'
+    return 'xlsx'
+
+
+def _header_names(header):
+    return [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header)]
+
+
+def _keep_inner_blank_rows(rows, width):
+    """
+    保留中間的空白列（與 pd.read_excel 相同，讀為全 NaN 列，列位置才能對齊），
+    只略過結尾的空白列
+    """
+    blank = (None,) * width
+    pending = 0
+    for row in rows:
+        row = tuple(row[:width])
+        if all(value is None for value in row):
+            pending += 1
+            continue
+        for _ in range(pending):
+            yield blank
+        pending = 0
+        yield row
+
+
+def _iter_xlsx_chunks(source, chunksize):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        rows = _keep_inner_blank_rows(rows, len(columns))
+        while True:
+            batch = list(islice(rows, chunksize))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(source, name, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    依檔案類型分塊讀取第一個工作表，每塊為一個 DataFrame（第一列為標題）
+
+    xlsx 使用 openpyxl 唯讀模式，csv 使用 pandas 分塊讀取；
+    xls 格式無法串流，會整份讀入後再分塊。
+    """
+    kind = _file_kind(name)
+    if kind == 'csv':
+        yield from pd.read_csv(source, chunksize=chunksize)
+    elif kind == 'xlsx':
+        yield from _iter_xlsx_chunks(source, chunksize)
+    else:
+        frame = pd.read_excel(source)
+        for start in range(0, len(frame), chunksize):
+            yield frame.iloc[start:start + chunksize]
+
+
+def read_preview(source, name, rows=10):
+    """只讀取前幾列作為預覽"""
+    for chunk in iter_chunks(source, name, chunksize=rows):
+        return chunk
+    return pd.DataFrame()
+
+
+def _prepare_chunk(chunk):
+    chunk = chunk.copy()
+    chunk.columns = normalize_column_names(chunk.columns)
+    for column in ('收盤價格', '交易值指標'):
+        if column not in chunk.columns:
+            chunk[column] = None
+    return chunk
+
+
+@dataclass
+class ScanResult:
+    """串流掃描結果：需查詢的代號、被選取列的日期與列數統計"""
+    codes: list = field(default_factory=list)
+    dates: list = field(default_factory=list)
+    rows_total: int = 0
+    rows_selected: int = 0
+
+
+def scan_workbook(source, name, only_today, today, chunksize=DEFAULT_CHUNKSIZE):
+    """第一遍串流：只收集要查詢的代號與日期，不保留資料列"""
+    result = ScanResult()
+    codes = set()
+    dates = set()
+    for chunk in iter_chunks(source, name, chunksize):
+        chunk = _prepare_chunk(chunk)
+        rows = select_rows(chunk, only_today, today)
+        result.rows_total += len(chunk)
+        result.rows_selected += len(rows)
+        codes.update(queryable_codes(clean_code(chunk.loc[rows, '股票代號'])))
+        row_dates = pd.to_datetime(chunk.loc[rows, '日期'], errors='coerce').dropna()
+        dates.update(row_dates.dt.strftime('%Y-%m-%d').unique())
+    result.codes = sorted(codes)
+    result.dates = sorted(dates)
+    return result
+
+
+class ChunkWriter:
+    """
+    逐塊寫出結果：xlsx 優先使用 xlsxwriter 常數記憶體模式，否則使用 openpyxl 唯寫模式；
+    csv 直接逐塊附加
+    """
+
+    def __init__(self, target, kind='xlsx'):
+        self.target = target
+        self.kind = kind
+        self._header_written = False
+        self._book = None
+        self._sheet = None
+        self._text = None
+
+        if kind == 'csv':
+            if isinstance(target, str):
+                self._text = open(target, 'w', encoding='utf-8-sig', newline='')
+            else:
+                self._text = io.TextIOWrapper(target, encoding='utf-8-sig', newline='')
+            self._csv = csv.writer(self._text)
+            return
+
+        try:
+            import xlsxwriter
+            self._book = xlsxwriter.Workbook(target, {
+                'constant_memory': True,
+                'default_date_format': 'yyyy-mm-dd',
+                'in_memory': False,
+            })
+            self._sheet = self._book.add_worksheet('Sheet1')
+            self._row = 0
+            self.engine = 'xlsxwriter'
+        except ImportError:
+            import openpyxl
+            self._book = openpyxl.Workbook(write_only=True)
+            self._sheet = self._book.create_sheet('Sheet1')
+            self.engine = 'openpyxl'
+
+    def _append(self, values):
+        if self.kind == 'csv':
+            self._csv.writerow(values)
+        elif self.engine == 'xlsxwriter':
+            self._sheet.write_row(self._row, 0, values)
+            self._row += 1
+        else:
+            self._sheet.append(values)
+
+    def write(self, chunk):
+        if not self._header_written:
+            self._append(list(chunk.columns))
+            self._header_written = True
+        cleaned = chunk.astype(object).where(chunk.notna(), None)
+        for row in cleaned.itertuples(index=False, name=None):
+            self._append(list(row))
+
+    def close(self):
+        if self.kind == 'csv':
+            if isinstance(self.target, str):
+                self._text.close()
+            else:
+                self._text.flush()
+                self._text.detach()
+        elif self.engine == 'xlsxwriter':
+            self._book.close()
+        else:
+            self._book.save(self.target)
+
+
+def stream_update(source, name, target, values, only_today, today, by_date=False,
+                  chunksize=DEFAULT_CHUNKSIZE, output_kind=None):
+    """
+    第二遍串流：逐塊套用行情表並寫出到 target（路徑或二進位檔案物件）
+
+    回傳累計的 UpdateResult。
+    """
+    kind = output_kind or ('csv' if _file_kind(name) == 'csv' else 'xlsx')
+    writer = ChunkWriter(target, kind)
+    result = UpdateResult()
+    try:
+        for chunk in iter_chunks(source, name, chunksize):
+            chunk = _prepare_chunk(chunk)
+            rows = select_rows(chunk, only_today, today)
+            result.merge(apply_values(chunk, rows, values, by_date=by_date))
+            writer.write(chunk)
+    finally:
+        writer.close()
+    return result
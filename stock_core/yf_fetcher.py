@@ -0,0 +1,347 @@
+"""yfinance 批次下載：分批並行、重試退避、記錄個股失敗原因，並以本地 OHLCV 快取只補抓缺少的日期"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import pandas as pd
+
+from stock_core.config import CACHE_DIR, expected_trading_date, now_taipei
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# 同批其他股票有資料、該檔卻查無資料的天數達此值時視為代號無效
+INVALID_AFTER_MISSES = 3
+# 代號無效的負面快取保留天數，之後重新查詢
+INVALID_TTL = timedelta(days=7)
+
+
+class OhlcvCache:
+    """
+    每檔股票一個 Arrow IPC 檔的日線快取
+
+    另以 _meta.json 記錄每檔已確認到哪一天（含無交易的假日），
+    避免假日或停牌期間重複查詢。只有實際取得資料的股票才會記錄已確認區間；
+    查無資料的股票記錄查無日期（misses），累積到 INVALID_AFTER_MISSES 天才標記為無效（invalid）。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or CACHE_DIR, "ohlcv")
+        self._lock = threading.Lock()
+        self._meta = None
+
+    def _path(self, ticker):
+        return os.path.join(self.root, f"{ticker}.arrow")
+
+    def _meta_path(self):
+        return os.path.join(self.root, "_meta.json")
+
+    def _load_meta(self):
+        if self._meta is None:
+            try:
+                with open(self._meta_path(), encoding="utf-8") as f:
+                    self._meta = json.load(f)
+            except (OSError, ValueError):
+                self._meta = {}
+        return self._meta
+
+    def _write_meta(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_meta = f"{self._meta_path()}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_meta, self._meta_path())
+
+    def coverage(self, ticker):
+        """回傳 (最早日期, 已確認到的日期)，沒有快取時回傳 None"""
+        with self._lock:
+            entry = self._load_meta().get(ticker)
+        if not entry or "start" not in entry:
+            return None
+        return pd.Timestamp(entry["start"]), pd.Timestamp(entry["through"])
+
+    def invalid_since(self, ticker):
+        """標記為代號無效的日期，未標記時回傳 None"""
+        with self._lock:
+            entry = self._load_meta().get(ticker) or {}
+        return pd.Timestamp(entry["invalid"]) if "invalid" in entry else None
+
+    def record_miss(self, ticker, day):
+        """記錄查無資料的日期（同一天只算一次），達 INVALID_AFTER_MISSES 天時標記為無效；回傳是否已標記"""
+        day = pd.Timestamp(day).strftime('%Y-%m-%d')
+        with self._lock:
+            entry = self._load_meta().setdefault(ticker, {})
+            misses = sorted(set(entry.get("misses", [])) | {day})
+            entry["misses"] = misses
+            if len(misses) >= INVALID_AFTER_MISSES:
+                entry["invalid"] = day
+            self._write_meta()
+            return "invalid" in entry
+
+    def clear_invalid(self, ticker):
+        """負面快取過期：清除無效標記與查無日期，重新查詢"""
+        with self._lock:
+            entry = self._load_meta().get(ticker)
+            if entry is None:
+                return
+            entry.pop("invalid", None)
+            entry.pop("misses", None)
+            if not entry:
+                del self._meta[ticker]
+            self._write_meta()
+
+    def load(self, ticker, start=None, end=None):
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        frame = pd.read_feather(path).set_index("Date")
+        if start is not None:
+            frame = frame[frame.index >= pd.Timestamp(start)]
+        if end is not None:
+            frame = frame[frame.index <= pd.Timestamp(end)]
+        return frame
+
+    def save(self, ticker, frame, start, through):
+        """合併新資料並更新已確認區間"""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            existing = self.load(ticker)
+            merged = pd.concat([existing, frame[OHLCV_COLUMNS]]) if not existing.empty else frame[OHLCV_COLUMNS]
+            merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            merged.index.name = "Date"
+
+            path = self._path(ticker)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            merged.reset_index().to_feather(tmp_path)
+            os.replace(tmp_path, path)
+
+            meta = self._load_meta()
+            entry = meta.get(ticker)
+            if entry and "start" in entry:
+                start = min(pd.Timestamp(start), pd.Timestamp(entry["start"]))
+                through = max(pd.Timestamp(through), pd.Timestamp(entry["through"]))
+            # 取得資料即清除查無紀錄
+            meta[ticker] = {
+                "start": pd.Timestamp(start).strftime('%Y-%m-%d'),
+                "through": pd.Timestamp(through).strftime('%Y-%m-%d'),
+            }
+            self._write_meta()
+
+
+@dataclass
+class FetchReport:
+    """下載統計"""
+    requested: int = 0
+    from_cache: int = 0
+    downloaded: int = 0
+    batches: int = 0
+    failures: dict = field(default_factory=dict)
+
+
+def _split_download(data, tickers):
+    """將 yf.download 的結果拆成 {ticker: DataFrame}"""
+    frames = {}
+    if data is None or data.empty:
+        return frames
+    if isinstance(data.columns, pd.MultiIndex):
+        available = set(data.columns.get_level_values(0))
+        for ticker in tickers:
+            if ticker in available:
+                frames[ticker] = data[ticker]
+    elif len(tickers) == 1:
+        frames[tickers[0]] = data
+    return frames
+
+
+def _default_downloader(tickers, start, end):
+    import yfinance as yf
+
+    return yf.download(
+        tickers, start=start, end=end, group_by='ticker',
+        auto_adjust=False, threads=False, progress=False
+    )
+
+
+class YFinanceFetcher:
+    """分批並行下載多檔股票日線，已快取的區間不再請求"""
+
+    def __init__(self, cache=None, batch_size=50, max_workers=4, retries=3, base_delay=1.0,
+                 downloader=None, sleep=time.sleep, clock=now_taipei):
+        self.cache = cache or OhlcvCache()
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.base_delay = base_delay
+        self.downloader = downloader or _default_downloader
+        self.sleep = sleep
+        self.clock = clock
+
+    def _is_invalid(self, ticker, now):
+        """代號是否仍在無效的負面快取期間內（過期時清除標記）"""
+        since = self.cache.invalid_since(ticker)
+        if since is None:
+            return False
+        if pd.Timestamp(now.date()) - since < INVALID_TTL:
+            return True
+        self.cache.clear_invalid(ticker)
+        return False
+
+    def _missing_range(self, ticker, start, through):
+        """該檔股票還缺少的日期區間，已完整時回傳 None"""
+        covered = self.cache.coverage(ticker)
+        if covered is None:
+            return start, through
+        first, last = covered
+        if start < first:
+            # 往前補抓時一併補到目前已確認的日期，維持單一連續區間
+            return start, max(through, last)
+        if through > last:
+            return last + timedelta(days=1), through
+        return None
+
+    def _download(self, tickers, start, end):
+        for attempt in range(self.retries + 1):
+            try:
+                # yfinance 的 end 不含當日
+                return self.downloader(tickers, start.strftime('%Y-%m-%d'), (end + timedelta(days=1)).strftime('%Y-%m-%d'))
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self.sleep(self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay))
+
+    def fetch(self, tickers, start, end=None):
+        """
+        取得 tickers 在 [start, end] 的日線，回傳 ({ticker: DataFrame}, FetchReport)
+
+        已收盤交易日的資料會寫入快取；當日尚未收盤的資料只回傳不快取。
+        查無資料的股票不記錄為已確認，列入 failures 並於下次重新查詢；
+        只有多日確認為無效的代號才會暫時略過（failures 為「代號無效」）。
+        """
+        now = self.clock()
+        tickers = sorted(set(tickers))
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize() if end is not None else pd.Timestamp(now.date())
+        settled = min(end, pd.Timestamp(expected_trading_date(now)))
+        report = FetchReport(requested=len(tickers))
+
+        # 依缺少的區間分組，同一區間的股票合併成批次請求
+        groups = {}
+        for ticker in tickers:
+            if self._is_invalid(ticker, now):
+                report.failures[ticker] = "代號無效（近期多次查無資料）"
+                continue
+            missing = self._missing_range(ticker, start, settled)
+            if end > settled:
+                missing = (missing[0] if missing else settled + timedelta(days=1), end)
+            if missing is None:
+                report.from_cache += 1
+            else:
+                groups.setdefault(missing, []).append(ticker)
+
+        jobs = [
+            (group_range, group[i:i + self.batch_size])
+            for group_range, group in groups.items()
+            for i in range(0, len(group), self.batch_size)
+        ]
+        report.batches = len(jobs)
+        fresh = {}
+        empty = []
+
+        def run(job):
+            (range_start, range_end), batch = job
+            return _split_download(self._download(batch, range_start, range_end), batch)
+
+        if jobs:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(run, job): job for job in jobs}
+                for future in as_completed(futures):
+                    (range_start, range_end), batch = futures[future]
+                    try:
+                        frames = future.result()
+                    except Exception as e:
+                        for ticker in batch:
+                            report.failures[ticker] = f"下載失敗: {e}"
+                        continue
+                    for ticker in batch:
+                        frame = frames.get(ticker, pd.DataFrame(columns=OHLCV_COLUMNS))
+                        frame = frame.reindex(columns=OHLCV_COLUMNS).dropna(how="all")
+                        frame.index = pd.DatetimeIndex(frame.index).tz_localize(None).normalize()
+                        fresh[ticker] = frame
+                        if frame.empty:
+                            # 不記錄為已確認，下次重新查詢
+                            empty.append(ticker)
+                            continue
+                        report.downloaded += 1
+                        settled_frame = frame[frame.index <= settled]
+                        if range_start <= settled and not settled_frame.empty:
+                            # 只確認到實際取得的最後一根日線；來源尚未更新的日期下次仍會查詢
+                            through = min(range_end, settled, settled_frame.index.max())
+                            self.cache.save(ticker, settled_frame, range_start, through)
+
+        results = {}
+        for ticker in tickers:
+            frame = self.cache.load(ticker, start, settled)
+            if ticker in fresh:
+                unsettled = fresh[ticker][fresh[ticker].index > settled]
+                frame = pd.concat([frame, unsettled]) if not frame.empty else unsettled
+            if frame.empty:
+                if ticker not in empty:
+                    report.failures.setdefault(ticker, "查無資料")
+                continue
+            results[ticker] = frame
+
+        # 其他股票在同一期間有資料時，查無資料才可能是代號無效；全部皆空（假日或來源異常）不計
+        for ticker in empty:
+            if ticker in results:
+                # 已有快取資料，只是新區間尚無資料；未延伸已確認區間，下次仍會查詢
+                continue
+            if results and self.cache.record_miss(ticker, now.date()):
+                report.failures[ticker] = "代號無效（近期多次查無資料）"
+            else:
+                report.failures[ticker] = "查無資料（下次重新查詢）"
+        return results, report
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    """程序內共用的下載器（共用同一份快取索引）"""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = YFinanceFetcher()
+        return _default_fetcher
+
+
+def ohlcv_to_values(frames, suffix_map=None, dated=False):
+    """
+    將日線轉為行情表（代號、收盤價格、成交股數、交易值指標）
+
+    dated 為 True 時保留每日資料並加上「日期」欄，否則只取每檔最後一筆有效資料。
+    suffix_map 為 {ticker: 代號}，預設去除 .TW / .TWO 後綴。
+    """
+    rows = []
+    for ticker, frame in frames.items():
+        code = suffix_map[ticker] if suffix_map else ticker.rsplit(".", 1)[0]
+        frame = frame[["Close", "Volume"]].dropna()
+        frame = frame[(frame["Close"] > 0) & (frame["Volume"] > 0)]
+        if frame.empty:
+            continue
+        if not dated:
+            frame = frame.iloc[[-1]]
+        rows.append(pd.DataFrame({
+            "日期": frame.index.strftime('%Y-%m-%d'),
+            "代號": code,
+            "收盤價格": frame["Close"].round(2).to_numpy(),
+            "成交股數": frame["Volume"].astype("int64").to_numpy(),
+            "交易值指標": (frame["Close"] * frame["Volume"] / 1e8).round(4).to_numpy(),
+        }))
+    if not rows:
+        return pd.DataFrame(columns=["日期", "代號", "收盤價格", "成交股數", "交易值指標"])
+    return pd.concat(rows, ignore_index=True)
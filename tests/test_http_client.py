@@ -0,0 +1,66 @@
+import pytest
+import requests
+
+from stock_core.http_client import CircuitOpenError, HttpClient
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+
+class ScriptedSession:
+    """依序丟出或回傳預先排好的結果"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def get(self, url, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(outcomes, clock):
+    client = HttpClient(session=ScriptedSession(outcomes), retries=0, failure_threshold=1, reset_timeout=60.0)
+    client.breaker("http://twse.test/x").clock = clock
+    return client
+
+
+def test_other_request_error_during_probe_reopens_breaker():
+    clock = Clock()
+    client = make_client([
+        requests.ConnectionError("down"),
+        requests.exceptions.ChunkedEncodingError("broken"),
+        FakeResponse(),
+    ], clock)
+    with pytest.raises(requests.ConnectionError):
+        client.get("http://twse.test/x")
+
+    clock.now = 61.0
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get("http://twse.test/x")
+    assert client.breaker("http://twse.test/x").state == "open"
+
+    # 試探失敗後重新計時，逾時後仍可再次試探
+    clock.now = 122.0
+    assert client.get("http://twse.test/x").status_code == 200
+    assert client.breaker("http://twse.test/x").state == "closed"
+
+
+def test_open_breaker_rejects_requests():
+    client = make_client([requests.Timeout("slow")], Clock())
+    with pytest.raises(requests.Timeout):
+        client.get("http://twse.test/x")
+
+    with pytest.raises(CircuitOpenError):
+        client.get("http://twse.test/x")
@@ -0,0 +1,68 @@
+import threading
+
+import requests
+
+from stock_core.intraday import HttpQuoteSource, IntradayRanking, QuoteServer, SimulatedMarket, quotes_frame
+
+
+def quotes(*rows):
+    return quotes_frame([{"code": code, "name": code, "price": price, "volume": volume} for code, price, volume in rows])
+
+
+def test_entered_exited_and_moved():
+    ranking = IntradayRanking(top_n=2)
+    first = ranking.apply(quotes(("A", 10.0, 3e7), ("B", 10.0, 2e7), ("C", 10.0, 1e7)))
+    assert first.entered == ["A", "B"]
+
+    # C 超越 A 成為第一，B 跌出前 2 名
+    delta = ranking.apply(quotes(("C", 10.0, 4e7)))
+
+    assert delta.changed == 1
+    assert delta.entered == ["C"]
+    assert delta.exited == ["B"]
+    assert delta.moved == {"A": -1}
+    assert list(ranking.frame()["代號"]) == ["C", "A"]
+    assert list(ranking.frame()["變動"]) == ["🆕", "▼1"]
+    assert list(ranking.exited_frame()["代號"]) == ["B"]
+
+
+def test_unchanged_quotes_are_skipped():
+    ranking = IntradayRanking(top_n=2)
+    ranking.apply(quotes(("A", 10.0, 3e7), ("B", 10.0, 2e7)))
+
+    delta = ranking.apply(quotes(("A", 10.0, 3e7), ("B", 10.0, 2e7)))
+
+    assert delta.changed == 0
+    assert not delta.has_changes
+
+
+def test_incremental_ranking_matches_full_sort():
+    market = SimulatedMarket([f"{i:04d}" for i in range(200)], changes=30, seed=1)
+    ranking = IntradayRanking(top_n=20)
+    ranking.apply(quotes_frame(market.quotes_since(0)["quotes"]))
+    since = market.seq
+    for _ in range(10):
+        market.step()
+        payload = market.quotes_since(since)
+        since = payload["seq"]
+        ranking.apply(quotes_frame(payload["quotes"]))
+
+    values = {code: round(price * volume / 1e8, 4) for code, price, volume in zip(market.codes, market.prices, market.volumes)}
+    expected = sorted(values, key=lambda code: (-values[code], code))[:20]
+    assert list(ranking.frame()["代號"]) == expected
+
+
+def test_http_source_only_fetches_changes():
+    market = SimulatedMarket([f"{i:04d}" for i in range(50)], changes=5, seed=2)
+    server = QuoteServer(market, port=0, step_interval=3600)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        source = HttpQuoteSource(f"http://127.0.0.1:{server.server_address[1]}/quotes", session=requests.Session())
+        assert len(source.fetch()) == 50
+        market.step()
+        assert len(source.fetch()) == 5
+        assert len(source.fetch()) == 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from stock_core import liquidity
+from stock_core.archive import HistoryArchive
+from stock_core.liquidity import get_liquidity_ranking
+
+
+def day(value):
+    return pd.DataFrame({
+        "代號": ["2330"], "股票名稱": ["台積電"], "收盤價格": [1000.0], "成交股數": [1e6], "交易值指標": [value],
+    })
+
+
+def test_backfilled_older_date_rebuilds_engine(tmp_path, monkeypatch):
+    archive = HistoryArchive(str(tmp_path))
+    monkeypatch.setattr(liquidity, "get_default_archive", lambda: archive)
+    monkeypatch.setattr(liquidity, "_engines", {})
+    archive.append("2026-10-12", day(10.0))
+    archive.append("2026-10-14", day(30.0))
+    get_liquidity_ranking(window=3, lookback=10)
+
+    # 事後回補中間缺少的交易日
+    archive.append("2026-10-13", day(50.0))
+    ranking, engine = get_liquidity_ranking(window=3, lookback=10)
+
+    assert engine.dates == ["2026-10-12", "2026-10-13", "2026-10-14"]
+    assert ranking.loc[0, "平均交易值"] == 30.0
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+from stock_core.config import TAIPEI_TZ
+from stock_core.markets import fetch_markets, parse_markets
+from stock_core.snapshot import SnapshotStore
+
+NOW = datetime(2026, 10, 16, 18, 0, tzinfo=TAIPEI_TZ)
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {}
+
+
+class FakeSession:
+    def __init__(self, content=None, error=None):
+        self.content = content
+        self.error = error
+
+    def get(self, url, headers=None, timeout=None):
+        if self.error:
+            raise self.error
+        return FakeResponse(self.content)
+
+
+def daily_csv(roc_date, rows):
+    lines = ["日期,證券代號,證券名稱,成交股數,收盤價"]
+    lines += [f"{roc_date},{code},{name},{volume},{close}" for code, name, volume, close in rows]
+    return "\n".join(lines).encode("utf-8")
+
+
+def make_stores(tmp_path, twse, tpex):
+    return {
+        key: SnapshotStore(cache_dir=str(tmp_path), url=f"http://{key}.test", session=session, name=key)
+        for key, session in (("twse", twse), ("tpex", tpex))
+    }
+
+
+def test_markets_on_same_date_are_merged(tmp_path):
+    stores = make_stores(
+        tmp_path,
+        FakeSession(daily_csv("1151016", [("2330", "台積電", 30000000, 1000.0)])),
+        FakeSession(daily_csv("1151016", [("6488", "環球晶", 2000000, 500.0)])),
+    )
+
+    fetched = fetch_markets(("twse", "tpex"), stores, now=NOW)
+    parsed, _ = parse_markets(fetched.snapshots)
+
+    assert fetched.errors == {}
+    assert fetched.trade_date == "2026-10-16"
+    assert sorted(parsed["股票代號"].astype(str)) == ["2330.TW", "6488.TWO"]
+
+
+def test_stale_market_is_rejected(tmp_path):
+    stores = make_stores(
+        tmp_path,
+        FakeSession(daily_csv("1151016", [("2330", "台積電", 30000000, 1000.0)])),
+        FakeSession(daily_csv("1151015", [("6488", "環球晶", 2000000, 500.0)])),
+    )
+
+    fetched = fetch_markets(("twse", "tpex"), stores, now=NOW)
+
+    assert list(fetched.snapshots) == ["twse"]
+    assert "2026-10-15" in fetched.errors["tpex"]
+    assert fetched.trade_date == "2026-10-16"
+
+
+def test_failed_market_is_recorded(tmp_path):
+    stores = make_stores(
+        tmp_path,
+        FakeSession(daily_csv("1151016", [("2330", "台積電", 30000000, 1000.0)])),
+        FakeSession(error=ConnectionError("unreachable")),
+    )
+
+    fetched = fetch_markets(("twse", "tpex"), stores, now=NOW)
+
+    assert list(fetched.snapshots) == ["twse"]
+    assert "unreachable" in fetched.errors["tpex"]
+
+
+def test_parse_markets_refuses_mixed_dates(tmp_path):
+    twse = make_stores(tmp_path, FakeSession(daily_csv("1151016", [("2330", "台積電", 30000000, 1000.0)])), None)
+    tpex = make_stores(tmp_path, None, FakeSession(daily_csv("1151015", [("6488", "環球晶", 2000000, 500.0)])))
+    snapshots = {"twse": twse["twse"].get(now=NOW), "tpex": tpex["tpex"].get(now=NOW)}
+
+    with pytest.raises(ValueError):
+        parse_markets(snapshots)
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from stock_core import pipeline
+from stock_core.archive import HistoryArchive
+from stock_core.config import TAIPEI_TZ
+from stock_core.markets import MarketFetchError
+from stock_core.pipeline import run_daily_ranking
+from stock_core.snapshot import SnapshotStore
+from stock_core.yf_fetcher import FetchReport
+from test_markets import FakeSession, daily_csv
+
+TRADE_DATE = "2026-01-05"
+
+
+class FakeFetcher:
+    """以固定收盤價回傳每個代號在 TRADE_DATE 的日線"""
+
+    def __init__(self):
+        self.requested = []
+
+    def fetch(self, tickers, start, end=None):
+        self.requested.extend(tickers)
+        index = pd.DatetimeIndex([TRADE_DATE])
+        frames = {
+            ticker: pd.DataFrame({"Open": 10.0, "High": 10.0, "Low": 10.0, "Close": 10.0, "Volume": 1e6}, index=index)
+            for ticker in tickers
+        }
+        return frames, FetchReport(requested=len(tickers))
+
+
+def store(tmp_path, key, session):
+    return SnapshotStore(cache_dir=str(tmp_path), url=f"http://{key}.test", session=session, name=key)
+
+
+def run(stores, fetcher):
+    return run_daily_ranking(
+        markets=tuple(stores), stores=stores, archive=False, save_results=False, fetcher=fetcher
+    )
+
+
+def test_failed_market_falls_back_to_yfinance_and_merges(tmp_path):
+    # 上櫃先前已有本地快照，提供備援查詢的代號清單
+    earlier = store(tmp_path, "tpex", FakeSession(daily_csv("1150102", [("6488", "環球晶", 2000000, 500.0)])))
+    earlier.get(now=datetime(2026, 1, 2, 18, 0, tzinfo=TAIPEI_TZ))
+    stores = {
+        "twse": store(tmp_path, "twse", FakeSession(daily_csv("1150105", [("2330", "台積電", 30000000, 1000.0)]))),
+        "tpex": store(tmp_path, "tpex", FakeSession(error=ConnectionError("unreachable"))),
+    }
+    fetcher = FakeFetcher()
+
+    ranking = run(stores, fetcher)
+
+    assert fetcher.requested == ["6488.TWO"]
+    assert ranking.trade_date == TRADE_DATE
+    assert ranking.sources["tpex"] == "yfinance"
+    assert sorted(ranking.ranked["股票代號"]) == ["2330.TW", "6488.TWO"]
+    assert not ranking.complete
+
+
+def test_all_markets_failing_without_codes_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "get_default_archive", lambda: HistoryArchive(str(tmp_path)))
+    stores = {
+        "twse": store(tmp_path, "twse", FakeSession(error=ConnectionError("down"))),
+        "tpex": store(tmp_path, "tpex", FakeSession(error=ConnectionError("down"))),
+    }
+
+    with pytest.raises(MarketFetchError):
+        run(stores, FakeFetcher())
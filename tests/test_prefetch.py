@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pandas as pd
+
+from stock_core import prefetch
+from stock_core.config import TAIPEI_TZ
+from stock_core.parser import ParseReport
+from stock_core.pipeline import DailyRanking
+from stock_core.prefetch import PrefetchScheduler, RankingCache
+
+
+def previous_day_ranking(*args, **kwargs):
+    ranked = pd.DataFrame({"日期": ["2026-10-15"], "股票代號": ["2330.TW"], "交易值指標": [300.0]})
+    return DailyRanking(
+        ranked=ranked, report=ParseReport(), trade_date="2026-10-15", source="twse:revalidated",
+        sources={"twse": "revalidated"},
+    )
+
+
+def run_at(tmp_path, monkeypatch, hour):
+    monkeypatch.setattr(prefetch, "get_daily_ranking", previous_day_ranking)
+    scheduler = PrefetchScheduler(cache=RankingCache(str(tmp_path)))
+    now = datetime(2026, 10, 16, hour, 0, tzinfo=TAIPEI_TZ)
+    warmed = scheduler.run_once(now)
+    return warmed, scheduler.next_run(now, warmed)
+
+
+def test_stale_data_before_cutoff_is_retried(tmp_path, monkeypatch):
+    warmed, next_run = run_at(tmp_path, monkeypatch, 15)
+
+    assert not warmed
+    assert next_run == datetime(2026, 10, 16, 15, 10, tzinfo=TAIPEI_TZ)
+
+
+def test_stale_data_after_cutoff_is_treated_as_holiday(tmp_path, monkeypatch):
+    warmed, next_run = run_at(tmp_path, monkeypatch, 18)
+
+    assert warmed
+    assert next_run == datetime(2026, 10, 19, 14, 30, tzinfo=TAIPEI_TZ)
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from stock_core.result_store import ResultStore
+
+
+def ranked(trade_date, rows):
+    return pd.DataFrame(
+        [(trade_date, ticker, ticker.split(".")[0], 100.0, 1000, value) for ticker, value in rows],
+        columns=["日期", "股票代號", "股票名稱", "收盤價格", "成交股數", "交易值指標"],
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "results.sqlite"))
+
+
+def test_save_replaces_the_same_date(store):
+    store.save(ranked("2026-10-15", [("2330.TW", 50.0), ("2317.TW", 20.0), ("6488.TWO", 10.0)]))
+
+    store.save(ranked("2026-10-15", [("2317.TW", 60.0), ("2330.TW", 50.0), ("6488.TWO", 10.0)]))
+
+    top = store.top("2026-10-15")
+    assert list(top["代號"]) == ["2317", "2330", "6488"]
+    assert list(top["排名"]) == [1, 2, 3]
+
+
+def test_save_keeps_other_dates(store):
+    store.save(ranked("2026-10-14", [("2330.TW", 40.0)]))
+    store.save(ranked("2026-10-15", [("2330.TW", 50.0)]))
+
+    assert store.dates() == ["2026-10-14", "2026-10-15"]
+    assert list(store.history("2330")["交易值指標"]) == [40.0, 50.0]
+
+
+def test_mixed_dates_are_rejected(store):
+    # 上市已更新、上櫃仍是前一日：不可取代前一日完整的排行
+    store.save(ranked("2026-10-15", [("2330.TW", 50.0), ("6488.TWO", 10.0)]))
+    mixed = pd.concat([ranked("2026-10-16", [("2330.TW", 55.0)]), ranked("2026-10-15", [("6488.TWO", 11.0)])])
+
+    with pytest.raises(ValueError):
+        store.save(mixed)
+
+    assert store.dates() == ["2026-10-15"]
+    assert len(store.top("2026-10-15")) == 2
+
+
+def test_import_sheet_does_not_replace_stored_dates(store):
+    store.save(ranked("2026-10-15", [("2330.TW", 50.0), ("6488.TWO", 10.0)]))
+    values = [
+        ["日期", "股票代號", "收盤價格", "交易值指標"],
+        ["2026-10-14", "2330.TW", "100", "40"],
+        ["2026-10-15", "2330.TW", "100", "99"],
+    ]
+
+    assert store.import_sheet(values) == 1
+    assert store.dates() == ["2026-10-14", "2026-10-15"]
+    assert len(store.top("2026-10-15")) == 2
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from stock_core.schema import MARKET_DTYPES, compact, to_display
+
+
+def test_float32_prices_round_trip_at_two_decimals():
+    # 0.01 ~ 9999.99 的所有兩位小數價格
+    prices = np.arange(1, 1_000_000) / 100
+    frame = compact(pd.DataFrame({"收盤價格": prices}))
+
+    assert frame["收盤價格"].dtype == "float32"
+    assert np.array_equal(to_display(frame)["收盤價格"].to_numpy(), prices)
+
+
+def test_trading_value_keeps_float64_precision():
+    values = pd.Series([123456.7891, 0.0001, 98765.4321])
+    frame = compact(pd.DataFrame({"交易值指標": values}))
+
+    assert MARKET_DTYPES["交易值指標"] == "float64"
+    assert to_display(frame)["交易值指標"].tolist() == values.tolist()
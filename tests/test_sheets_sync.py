@@ -0,0 +1,75 @@
+import pandas as pd
+
+from stock_core.sheets_sync import SHEET_COLUMNS, MemoryWorksheet, SheetSync
+
+
+def ranked(values):
+    return pd.DataFrame(
+        [("2026-10-15", ticker, close, value) for ticker, close, value in values], columns=SHEET_COLUMNS
+    )
+
+
+def make_sync(worksheet):
+    return SheetSync(worksheet, sleep=lambda seconds: None)
+
+
+def test_upsert_is_idempotent():
+    worksheet = MemoryWorksheet()
+    sync = make_sync(worksheet)
+    frame = ranked([("2330.TW", 1000.0, 50.5), ("2317.TW", 200.5, 20.25)])
+
+    first = sync.upsert(frame)
+    second = sync.upsert(frame)
+
+    assert (first.inserted, first.updated) == (2, 0)
+    assert (second.inserted, second.updated, second.unchanged) == (0, 0, 2)
+    assert worksheet.calls["batch_update"] == 0
+    assert len(worksheet.rows) == 3
+
+
+def test_upsert_updates_changed_rows_in_place():
+    worksheet = MemoryWorksheet()
+    sync = make_sync(worksheet)
+    sync.upsert(ranked([("2330.TW", 1000.0, 50.5), ("2317.TW", 200.5, 20.25)]))
+
+    result = sync.upsert(ranked([("2330.TW", 1005.0, 51.0), ("2317.TW", 200.5, 20.25)]))
+
+    assert (result.inserted, result.updated, result.unchanged) == (0, 1, 1)
+    assert worksheet.rows[1] == ["2026-10-15", "2330.TW", "1005.0", "51.0"]
+    assert len(worksheet.rows) == 3
+
+
+def test_new_instance_reads_only_key_columns():
+    worksheet = MemoryWorksheet()
+    frame = ranked([("2330.TW", 1000.0, 50.5), ("2317.TW", 200.5, 20.25)])
+    make_sync(worksheet).upsert(frame)
+
+    result = make_sync(worksheet).upsert(frame)
+
+    assert result.unchanged == 2
+    assert worksheet.calls["read_all"] == 0
+    assert len(worksheet.rows) == 3
+
+
+def test_rows_moved_outside_trigger_index_refresh():
+    worksheet = MemoryWorksheet()
+    sync = make_sync(worksheet)
+    sync.upsert(ranked([("2330.TW", 1000.0, 50.5), ("2317.TW", 200.5, 20.25)]))
+    # 工作表上的第一筆資料被手動刪除，2317 往上移一列
+    del worksheet.rows[1]
+
+    result = sync.upsert(ranked([("2317.TW", 201.0, 20.5), ("2330.TW", 1000.0, 50.5)]))
+
+    assert (result.inserted, result.updated) == (1, 1)
+    assert worksheet.rows[1] == ["2026-10-15", "2317.TW", "201.0", "20.5"]
+    assert sorted(row[1] for row in worksheet.rows[1:]) == ["2317.TW", "2330.TW"]
+
+
+def test_duplicate_keys_keep_last_row():
+    worksheet = MemoryWorksheet()
+    sync = make_sync(worksheet)
+
+    result = sync.upsert(ranked([("2330.TW", 1000.0, 50.5), ("2330.TW", 1005.0, 51.0)]))
+
+    assert result.inserted == 1
+    assert worksheet.rows[1:] == [["2026-10-15", "2330.TW", "1005.0", "51.0"]]
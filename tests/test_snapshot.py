@@ -0,0 +1,42 @@
+import os
+from datetime import datetime
+
+from stock_core.config import TAIPEI_TZ
+from stock_core.snapshot import SnapshotStore
+from test_markets import FakeResponse, FakeSession, daily_csv
+
+ROWS = [("2330", "台積電", 30000000, 1000.0)]
+
+
+def make_store(tmp_path, session):
+    return SnapshotStore(cache_dir=str(tmp_path), url="http://twse.test", session=session)
+
+
+def test_payload_date_is_trusted_before_publish_time(tmp_path):
+    # 14:30 前預期交易日為前一日，但資料本身已是當日
+    store = make_store(tmp_path, FakeSession(daily_csv("1151016", ROWS)))
+
+    snapshot = store.get(now=datetime(2026, 10, 16, 14, 0, tzinfo=TAIPEI_TZ))
+
+    assert snapshot.trade_date == "2026-10-16"
+    assert snapshot.verified
+    assert os.path.exists(os.path.join(store.cache_dir, "2026-10-16.csv"))
+    assert not os.path.exists(os.path.join(store.cache_dir, "2026-10-15.csv"))
+
+
+class ModifiedSession(FakeSession):
+    def get(self, url, headers=None, timeout=None):
+        response = FakeResponse(self.content)
+        response.headers = {"Last-Modified": "Fri, 16 Oct 2026 06:00:00 GMT"}
+        return response
+
+
+def test_last_modified_date_is_capped_at_expected_date(tmp_path):
+    # 沒有日期欄時只能依 Last-Modified（台北 14:00 仍可能在更新前一日資料）
+    store = make_store(tmp_path, ModifiedSession(daily_csv("1151016", ROWS)))
+    store.data_date = None
+
+    snapshot = store.get(now=datetime(2026, 10, 16, 14, 0, tzinfo=TAIPEI_TZ))
+
+    assert snapshot.trade_date == "2026-10-15"
+    assert snapshot.verified
@@ -0,0 +1,33 @@
+import io
+
+import openpyxl
+import pandas as pd
+
+from stock_core.workbook_io import iter_chunks
+
+
+def workbook(rows):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+def test_blank_rows_keep_read_excel_positions():
+    content = workbook([
+        ["日期", "股票代號", "收盤價格", "交易值指標"],
+        ["2026-10-15", "2330", None, None],
+        [None, None, None, None],
+        ["2026-10-15", "2317", None, None],
+        ["2026-10-15", "6488", None, None],
+    ])
+
+    streamed = pd.concat(list(iter_chunks(io.BytesIO(content), "list.xlsx", chunksize=2)), ignore_index=True)
+    expected = pd.read_excel(io.BytesIO(content))
+
+    assert len(streamed) == len(expected) == 4
+    assert streamed["股票代號"].isna().tolist() == expected["股票代號"].isna().tolist()
+    assert streamed["股票代號"].tolist()[3] == "6488"
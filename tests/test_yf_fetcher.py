@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from stock_core.config import TAIPEI_TZ
+from stock_core.yf_fetcher import INVALID_AFTER_MISSES, OHLCV_COLUMNS, OhlcvCache, YFinanceFetcher
+
+START = "2026-10-12"
+END = "2026-10-16"
+
+
+class FakeDownloader:
+    """依 yf.download(group_by='ticker') 的格式回傳日線，記錄每次請求的代號"""
+
+    def __init__(self, available, last=None):
+        self.available = set(available)
+        self.last = last
+        self.calls = []
+
+    def __call__(self, tickers, start, end):
+        self.calls.append(list(tickers))
+        dates = pd.bdate_range(start, pd.Timestamp(end) - timedelta(days=1))
+        if self.last is not None:
+            dates = dates[dates <= pd.Timestamp(self.last)]
+        frames = {}
+        for ticker in tickers:
+            values = np.full((len(dates), len(OHLCV_COLUMNS)), np.nan)
+            if ticker in self.available:
+                values[:] = [100.0, 101.0, 99.0, 100.5, 1000.0]
+            frames[ticker] = pd.DataFrame(values, index=dates, columns=OHLCV_COLUMNS)
+        return pd.concat(frames, axis=1)
+
+
+def make_fetcher(tmp_path, downloader, day=16):
+    return YFinanceFetcher(
+        cache=OhlcvCache(str(tmp_path)), downloader=downloader, max_workers=1, sleep=lambda seconds: None,
+        clock=lambda: datetime(2026, 10, day, 18, 0, tzinfo=TAIPEI_TZ),
+    )
+
+
+def test_covered_tickers_are_served_from_cache(tmp_path):
+    downloader = FakeDownloader({"2330.TW", "2317.TW"})
+    make_fetcher(tmp_path, downloader).fetch(["2330.TW", "2317.TW"], START, END)
+
+    frames, report = make_fetcher(tmp_path, downloader).fetch(["2330.TW", "2317.TW"], START, END)
+
+    assert len(downloader.calls) == 1
+    assert report.from_cache == 2
+    assert len(frames["2330.TW"]) == 5
+
+
+def test_empty_ticker_is_not_marked_covered(tmp_path):
+    downloader = FakeDownloader({"2330.TW"})
+    cache = OhlcvCache(str(tmp_path))
+
+    frames, report = make_fetcher(tmp_path, downloader).fetch(["2330.TW", "9999.TW"], START, END)
+
+    assert "9999.TW" not in frames
+    assert "9999.TW" in report.failures
+    assert cache.coverage("9999.TW") is None
+    assert cache.coverage("2330.TW") is not None
+
+    # 下次執行只重新查詢沒有資料的股票
+    make_fetcher(tmp_path, downloader).fetch(["2330.TW", "9999.TW"], START, END)
+    assert downloader.calls[-1] == ["9999.TW"]
+
+
+def test_coverage_stops_at_the_last_downloaded_bar(tmp_path):
+    # 來源尚未更新最新一日：已確認區間不可延伸到沒有資料的日期
+    make_fetcher(tmp_path, FakeDownloader({"2330.TW"}, last="2026-10-15")).fetch(["2330.TW"], START, END)
+
+    assert OhlcvCache(str(tmp_path)).coverage("2330.TW")[1] == pd.Timestamp("2026-10-15")
+
+    downloader = FakeDownloader({"2330.TW"})
+    frames, _ = make_fetcher(tmp_path, downloader).fetch(["2330.TW"], START, END)
+    assert downloader.calls == [["2330.TW"]]
+    assert frames["2330.TW"].index.max() == pd.Timestamp(END)
+
+
+def test_whole_batch_empty_does_not_count_as_invalid(tmp_path):
+    downloader = FakeDownloader(set())
+
+    for day in range(12, 12 + INVALID_AFTER_MISSES):
+        make_fetcher(tmp_path, downloader, day).fetch(["2330.TW"], START, END)
+
+    assert OhlcvCache(str(tmp_path)).invalid_since("2330.TW") is None
+
+
+def test_ticker_missing_on_several_days_is_cached_as_invalid(tmp_path):
+    downloader = FakeDownloader({"2330.TW"})
+    for day in range(12, 12 + INVALID_AFTER_MISSES):
+        make_fetcher(tmp_path, downloader, day).fetch(["2330.TW", "9999.TW"], START, END)
+    calls = len(downloader.calls)
+
+    _, report = make_fetcher(tmp_path, downloader, 16).fetch(["9999.TW"], START, END)
+
+    assert len(downloader.calls) == calls
+    assert report.failures["9999.TW"].startswith("代號無效")
+
+    # 負面快取過期後重新查詢
+    later = make_fetcher(tmp_path, downloader, 16)
+    later.clock = lambda: datetime(2026, 10, 30, 18, 0, tzinfo=TAIPEI_TZ)
+    later.fetch(["9999.TW"], START, END)
+    assert downloader.calls[-1] == ["9999.TW"]